@@ -1,10 +1,12 @@
 import json
-import boto3
 import base64
 import uuid
 import os
-from datetime import datetime
+import time
+from datetime import date, datetime
 from decimal import Decimal
+from warm_clients import lazy_client, lazy_resource, get_opensearch_client, register_priming
+from asset_catalog import utc_timestamp
 
 class DecimalEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -12,23 +14,448 @@ class DecimalEncoder(json.JSONEncoder):
             return int(obj) if obj % 1 == 0 else float(obj)
         return super(DecimalEncoder, self).default(obj)
 
-s3_client = boto3.client('s3')
-dynamodb = boto3.resource('dynamodb')
+# 客户端在首次使用时创建（/health等路由不触发boto3初始化）
+s3_client = lazy_client('s3')
+lambda_client = lazy_client('lambda')
+dynamodb = lazy_resource('dynamodb')
+register_priming(clients=['s3', 'lambda'], resources=['dynamodb'], opensearch=True)
 BUCKET_NAME = os.environ.get('UPLOAD_BUCKET', 'multimodal-search-uploads')
-STATUS_TABLE_NAME = os.environ.get('STATUS_TABLE_NAME', 'multimodal-search-embedding-status')
+CATALOG_TABLE_NAME = os.environ.get('CATALOG_TABLE_NAME', 'multimodal-search-asset-catalog')
+JOBS_TABLE_NAME = os.environ.get('JOBS_TABLE_NAME', 'multimodal-search-maintenance-jobs')
+MAINTENANCE_FUNCTION_NAME = os.environ.get('MAINTENANCE_FUNCTION_NAME', 'multimodal-search-maintenance')
+CATALOG_INDEX_NAME = 'catalog-by-time'
+CATALOG_STATUS_INDEX_NAME = 'catalog-status-index'
+OPENSEARCH_INDEX = os.environ.get('OPENSEARCH_INDEX', 'embeddings')
+STATS_CACHE_TTL = int(os.environ.get('STATS_CACHE_TTL', '30'))  # 统计结果缓存秒数
+CATALOG_PARTITION = 'asset'
 ALLOWED_TYPES = ['png', 'jpeg', 'jpg', 'webp', 'mp4', 'mov', 'wav', 'mp3', 'm4a']
+MEDIA_TYPE_EXTENSIONS = {
+    'image': ['png', 'jpeg', 'jpg', 'webp'],
+    'video': ['mp4', 'mov'],
+    'audio': ['wav', 'mp3', 'm4a']
+}
+EMBEDDING_STATUSES = ['pending', 'processing', 'retrying', 'completed', 'failed', 'unsupported']
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+CATALOG_QUERY_PAGE_SIZE = 200  # 每次Query评估的条数（过滤前）
+MAX_CATALOG_QUERY_PAGES = 5  # 每个请求最多读取的Query页数，过滤掉的记录太多时返回游标由调用方续读
+MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_SIZE', str(2 * 1024 ** 3)))  # 直传上限，默认2GB
+MIN_PART_SIZE = 8 * 1024 * 1024  # S3分片最小5MB，取8MB
+MAX_PARTS = 10000
+UPLOAD_URL_EXPIRES = 3600
+UPLOAD_PREFIX = 'uploads/'  # 只有该前缀下的对象会触发embedding（按类型和大小分通道）
 
-def get_embedding_status(s3_uri):
+# 统计结果缓存（Lambda容器内复用）
+_stats_cache = {'expires_at': 0, 'data': None}
+
+def count_query(table, **query_kwargs):
+    """
+    使用Select=COUNT统计Query匹配条数（不返回记录内容）
+    """
+    total = 0
+    while True:
+        response = table.query(Select='COUNT', **query_kwargs)
+        total += response.get('Count', 0)
+        if 'LastEvaluatedKey' not in response:
+            return total
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def get_embedding_stats():
     """
-    从DynamoDB获取embedding状态
+    全库embedding覆盖统计：OpenSearch聚合 + 素材目录按状态索引计数
+    """
+    from boto3.dynamodb.conditions import Key
+    
+    # 分段统计：一次size=0聚合请求
+    segments = {
+        'total': 0,
+        'assets': 0,
+        'byMediaType': {},
+        'byFileType': {},
+        'byEmbeddingType': {'visual': 0, 'text': 0, 'audio': 0}
+    }
+    if os.environ.get('OPENSEARCH_ENDPOINT'):
+        try:
+            result = get_opensearch_client().search(
+                index=OPENSEARCH_INDEX,
+                body={
+                    'size': 0,
+                    'track_total_hits': True,
+                    'aggs': {
+                        'media_types': {'terms': {'field': 'media_type', 'size': 20}},
+                        'file_types': {'terms': {'field': 'file_type', 'size': 50}},
+                        'assets': {'cardinality': {'field': 's3_uri'}},
+                        'embedding_types': {
+                            'filters': {
+                                'filters': {
+                                    'visual': {'exists': {'field': 'visual_embedding'}},
+                                    'text': {'exists': {'field': 'text_embedding'}},
+                                    'audio': {'exists': {'field': 'audio_embedding'}}
+                                }
+                            }
+                        }
+                    }
+                }
+            )
+            aggs = result['aggregations']
+            segments['total'] = result['hits']['total']['value']
+            segments['assets'] = aggs['assets']['value']
+            segments['byMediaType'] = {b['key']: b['doc_count'] for b in aggs['media_types']['buckets']}
+            segments['byFileType'] = {b['key']: b['doc_count'] for b in aggs['file_types']['buckets']}
+            segments['byEmbeddingType'] = {
+                name: bucket['doc_count'] for name, bucket in aggs['embedding_types']['buckets'].items()
+            }
+        except Exception as e:
+            if '404' not in str(e) and 'index_not_found' not in str(e).lower():
+                raise
+    
+    # 素材状态统计：全部来自素材目录自身的状态（按状态GSI计数），各状态之和即素材总数
+    catalog_table = dynamodb.Table(CATALOG_TABLE_NAME)
+    by_status = {
+        status: count_query(
+            catalog_table,
+            IndexName=CATALOG_STATUS_INDEX_NAME,
+            KeyConditionExpression=Key('status').eq(status)
+        )
+        for status in EMBEDDING_STATUSES
+    }
+    total_assets = sum(by_status.values())
+    
+    return {
+        'assets': {
+            'total': total_assets,
+            'byStatus': by_status
+        },
+        'segments': segments,
+        'generatedAt': datetime.now().isoformat()
+    }
+
+def get_cached_embedding_stats():
+    """
+    带TTL缓存的统计结果，供仪表盘高频轮询
+    """
+    now = time.time()
+    if _stats_cache['data'] is not None and now < _stats_cache['expires_at']:
+        return dict(_stats_cache['data'], cached=True)
+    
+    data = get_embedding_stats()
+    _stats_cache['data'] = data
+    _stats_cache['expires_at'] = now + STATS_CACHE_TTL
+    return dict(data, cached=False)
+
+def catalog_range_bound(value, end_of_day):
+    """
+    查询范围边界转换为排序键格式；只有日期（2025-01-25）时from取当天开始，
+    to取当天最后一毫秒，保证to当天的记录包含在内
+    """
+    if len(value) == 10:
+        day = date.fromisoformat(value)
+        return f"{day.isoformat()}T{'23:59:59.999' if end_of_day else '00:00:00.000'}Z"
+    return utc_timestamp(value)
+
+def catalog_index_key(item):
+    """目录记录在catalog-by-time索引中的键，可作为ExclusiveStartKey从该记录之后继续读取"""
+    return {key: item[key] for key in ('asset_key', 'catalog_pk', 'last_modified')}
+
+def encode_cursor(last_evaluated_key):
+    """
+    将DynamoDB的LastEvaluatedKey编码为不透明的分页游标
+    """
+    if not last_evaluated_key:
+        return None
+    raw = json.dumps(last_evaluated_key, cls=DecimalEncoder).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor):
+    """
+    解码分页游标，返回ExclusiveStartKey
     """
     try:
-        table = dynamodb.Table(STATUS_TABLE_NAME)
-        response = table.get_item(Key={'s3_uri': s3_uri})
-        return response.get('Item')
+        return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def list_catalog_assets(limit=DEFAULT_PAGE_SIZE, cursor=None, media_type=None, statuses=None,
+                        date_from=None, date_to=None, order='desc'):
+    """
+    按上传时间查询素材目录（GSI单分区Query，游标分页，服务端过滤）
+    每个请求最多读取MAX_CATALOG_QUERY_PAGES页，过滤后不足一页时也返回游标，调用方按游标续读
+    返回 (items, next_cursor)
+    """
+    from boto3.dynamodb.conditions import Key, Attr
+    
+    table = dynamodb.Table(CATALOG_TABLE_NAME)
+    
+    # 时间范围使用排序键条件，不消耗额外读取（与存储格式一致的UTC时间）
+    date_from = catalog_range_bound(date_from, end_of_day=False) if date_from else None
+    date_to = catalog_range_bound(date_to, end_of_day=True) if date_to else None
+    key_condition = Key('catalog_pk').eq(CATALOG_PARTITION)
+    if date_from and date_to:
+        key_condition = key_condition & Key('last_modified').between(date_from, date_to)
+    elif date_from:
+        key_condition = key_condition & Key('last_modified').gte(date_from)
+    elif date_to:
+        key_condition = key_condition & Key('last_modified').lte(date_to)
+    
+    # 媒体类型和状态使用过滤表达式
+    filter_expression = None
+    if media_type:
+        filter_expression = Attr('file_type').is_in(MEDIA_TYPE_EXTENSIONS[media_type])
+    if statuses:
+        status_condition = Attr('status').is_in(statuses)
+        filter_expression = status_condition if filter_expression is None else filter_expression & status_condition
+    
+    query_kwargs = {
+        'IndexName': CATALOG_INDEX_NAME,
+        'KeyConditionExpression': key_condition,
+        'ScanIndexForward': order == 'asc'
+    }
+    if filter_expression is not None:
+        query_kwargs['FilterExpression'] = filter_expression
+    if cursor:
+        query_kwargs['ExclusiveStartKey'] = decode_cursor(cursor)
+    
+    # Limit限制的是评估条数，过滤后不足一页时继续读取，但最多读取MAX_CATALOG_QUERY_PAGES页；
+    # 一页返回的记录超过所需条数时截断，游标指向最后一条返回的记录
+    query_kwargs['Limit'] = CATALOG_QUERY_PAGE_SIZE
+    items = []
+    last_evaluated_key = None
+    for _ in range(MAX_CATALOG_QUERY_PAGES):
+        response = table.query(**query_kwargs)
+        page_items = response.get('Items', [])
+        remaining = limit - len(items)
+        if len(page_items) > remaining:
+            items.extend(page_items[:remaining])
+            last_evaluated_key = catalog_index_key(items[-1])
+            break
+        
+        items.extend(page_items)
+        last_evaluated_key = response.get('LastEvaluatedKey')
+        if not last_evaluated_key or len(items) >= limit:
+            break
+        query_kwargs['ExclusiveStartKey'] = last_evaluated_key
+    
+    return items, encode_cursor(last_evaluated_key)
+
+def put_catalog_asset(key, size, status='pending'):
+    """
+    上传完成后写入素材目录（embedding流水线随后增量更新状态）
+    """
+    try:
+        table = dynamodb.Table(CATALOG_TABLE_NAME)
+        now = utc_timestamp()
+        table.put_item(
+            Item={
+                'asset_key': key,
+                'catalog_pk': CATALOG_PARTITION,
+                's3_uri': f"s3://{BUCKET_NAME}/{key}",
+                'file_type': key.split('.')[-1].lower(),
+                'status': status,
+                'size': size,
+                'retry_count': 0,
+                'last_modified': now,
+                'updated_at': now
+            },
+            ConditionExpression='attribute_not_exists(asset_key)'
+        )
     except Exception as e:
-        print(f"Failed to get status for {s3_uri}: {str(e)}")
-        return None
+        # embedding流水线可能已先行写入，忽略条件写入失败
+        print(f"Failed to create catalog entry for {key}: {str(e)}")
+
+def initiate_multipart_upload(file_name, file_type, file_size):
+    """
+    创建S3分片上传并为每个分片生成预签名URL，浏览器直接并行上传到S3
+    直接上传到uploads/下的最终key，完成时只读取文件头校验
+    """
+    ext = file_name.split('.')[-1].lower()
+    unique_name = f"{UPLOAD_PREFIX}{uuid.uuid4()}.{ext}"
+    
+    upload = s3_client.create_multipart_upload(
+        Bucket=BUCKET_NAME,
+        Key=unique_name,
+        ContentType=file_type
+    )
+    upload_id = upload['UploadId']
+    
+    # 分片大小需保证总分片数不超过S3上限
+    part_size = max(MIN_PART_SIZE, -(-file_size // MAX_PARTS))
+    part_count = max(1, -(-file_size // part_size))
+    
+    parts = [{
+        'partNumber': part_number,
+        'url': s3_client.generate_presigned_url(
+            'upload_part',
+            Params={
+                'Bucket': BUCKET_NAME,
+                'Key': unique_name,
+                'UploadId': upload_id,
+                'PartNumber': part_number
+            },
+            ExpiresIn=UPLOAD_URL_EXPIRES
+        )
+    } for part_number in range(1, part_count + 1)]
+    
+    return {
+        'key': unique_name,
+        'uploadId': upload_id,
+        'partSize': part_size,
+        'parts': parts,
+        'expiresIn': UPLOAD_URL_EXPIRES
+    }
+
+def sniff_file_type(header, ext):
+    """
+    根据文件头魔数校验实际类型与扩展名是否一致
+    """
+    if ext == 'png':
+        return header.startswith(b'\x89PNG\r\n\x1a\n')
+    if ext in ('jpg', 'jpeg'):
+        return header.startswith(b'\xff\xd8\xff')
+    if ext == 'webp':
+        return header[:4] == b'RIFF' and header[8:12] == b'WEBP'
+    if ext == 'wav':
+        return header[:4] == b'RIFF' and header[8:12] == b'WAVE'
+    if ext == 'mp3':
+        return header.startswith(b'ID3') or (len(header) > 1 and header[0] == 0xff and header[1] & 0xe0 == 0xe0)
+    if ext in ('mp4', 'm4a', 'mov'):
+        # ISO BMFF：第4-8字节为box类型，QuickTime文件可能以其他atom开头
+        return header[4:8] in (b'ftyp', b'moov', b'mdat', b'wide', b'free', b'skip', b'pnot')
+    return False
+
+def is_upload_key(key):
+    """分片上传的完成/取消只接受initiate生成的key（uploads/下一级的对象）"""
+    return isinstance(key, str) and key.startswith(UPLOAD_PREFIX) and '/' not in key[len(UPLOAD_PREFIX):]
+
+def complete_multipart_upload(key, upload_id, parts):
+    """
+    完成分片上传并校验文件大小和类型，校验失败时删除对象
+    只用HEAD和文件头的范围读取校验（耗时与文件大小无关）；embedding处理前会跳过已删除的对象
+    返回 (对象大小, 错误信息)
+    """
+    s3_client.complete_multipart_upload(
+        Bucket=BUCKET_NAME,
+        Key=key,
+        UploadId=upload_id,
+        MultipartUpload={
+            'Parts': sorted(
+                [{'PartNumber': int(p['partNumber']), 'ETag': p['etag']} for p in parts],
+                key=lambda p: p['PartNumber']
+            )
+        }
+    )
+    
+    size = s3_client.head_object(Bucket=BUCKET_NAME, Key=key)['ContentLength']
+    header = s3_client.get_object(Bucket=BUCKET_NAME, Key=key, Range='bytes=0-15')['Body'].read()
+    ext = key.split('.')[-1].lower()
+    
+    error = None
+    if size > MAX_UPLOAD_SIZE:
+        error = f"文件大小超过限制: {size} > {MAX_UPLOAD_SIZE}"
+    elif not sniff_file_type(header, ext):
+        error = f"文件内容与扩展名 .{ext} 不匹配"
+    
+    if error:
+        s3_client.delete_object(Bucket=BUCKET_NAME, Key=key)
+        print(f"Rejected upload {key}: {error}")
+    return size, error
+
+def start_purge_job():
+    """
+    创建清库任务记录并异步调用维护Lambda执行
+    """
+    now = datetime.now().isoformat()
+    job = {
+        'job_id': str(uuid.uuid4()),
+        'job_type': 'purge',
+        'status': 'pending',
+        'step': 'swap_index',
+        'progress': {},
+        'created_at': now,
+        'updated_at': now
+    }
+    dynamodb.Table(JOBS_TABLE_NAME).put_item(Item=job)
+    
+    lambda_client.invoke(
+        FunctionName=MAINTENANCE_FUNCTION_NAME,
+        InvocationType='Event',
+        Payload=json.dumps({'job_id': job['job_id']})
+    )
+    print(f"Started purge job {job['job_id']}")
+    return job
+
+def build_material(item):
+    """
+    将素材目录记录转换为前端使用的素材格式
+    """
+    key = item['asset_key']
+    segment_counts = {
+        'visual': int(item.get('segment_counts', {}).get('visual', 0)),
+        'text': int(item.get('segment_counts', {}).get('text', 0)),
+        'audio': int(item.get('segment_counts', {}).get('audio', 0))
+    }
+    
+    # 设置可用的embedding类型
+    embeddings = []
+    if segment_counts['visual'] > 0:
+        embeddings.append('🖼️ 视觉')
+    if segment_counts['text'] > 0:
+        embeddings.append('📝 文本')
+    if segment_counts['audio'] > 0:
+        embeddings.append('🎧 音频')
+    
+    # 确定embedding状态
+    embedding_status = item.get('status', 'pending')
+    retry_count = item.get('retry_count', 0)
+    if embedding_status == 'completed':
+        status_display = '✅ 已完成'
+    elif embedding_status == 'processing':
+        status_display = '🔄 处理中'
+    elif embedding_status == 'retrying':
+        status_display = f'⚠️ 重试中 ({retry_count}/5)'
+    elif embedding_status == 'failed':
+        status_display = '❌ 失败'
+    elif embedding_status == 'unsupported':
+        status_display = '❌ 不支持'
+    else:
+        embedding_status = 'pending'
+        status_display = '⏳ 待处理'
+    
+    # 生成预签名URL（本地签名，无网络请求）
+    file_url = s3_client.generate_presigned_url(
+        'get_object',
+        Params={'Bucket': BUCKET_NAME, 'Key': key},
+        ExpiresIn=3600
+    )
+    
+    # 优先使用ingest时生成的缩略图/封面/预览
+    derivative_urls = {
+        name: s3_client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': BUCKET_NAME, 'Key': derivative_key},
+            ExpiresIn=3600
+        )
+        for name, derivative_key in item.get('derivatives', {}).items()
+    }
+    
+    return {
+        'key': key,
+        'name': key.split('/')[-1],
+        'size': item.get('size', 0),
+        'lastModified': item.get('last_modified'),
+        'url': file_url,
+        'thumbnailUrl': derivative_urls.get('thumbnail'),
+        'posterUrl': derivative_urls.get('poster'),
+        'previewUrl': derivative_urls.get('preview'),
+        'embeddings': embeddings,
+        'hasEmbedding': len(embeddings) > 0,
+        'segmentCount': item.get('segment_count', 0),
+        'segmentCounts': segment_counts,
+        'embeddingStatus': embedding_status,
+        'statusDisplay': status_display,
+        'retryCount': retry_count,
+        'lastError': item.get('last_error'),
+        'lastErrorTime': item.get('last_error_time')
+    }
 
 def handler(event, context):
     """
@@ -59,136 +486,47 @@ def handler(event, context):
         }
     elif path == '/api/materials' and method == 'GET':
         try:
-            # 获取S3中的所有文件
-            s3_objects = s3_client.list_objects_v2(Bucket=BUCKET_NAME)
-            materials = []
+            # 查询参数: limit, cursor, mediaType, status(逗号分隔), from, to, order
+            params = event.get('queryStringParameters') or {}
+            limit = min(max(int(params.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+            media_type = params.get('mediaType')
+            statuses = [s for s in params.get('status', '').split(',') if s]
+            order = params.get('order', 'desc')
             
-            if 'Contents' in s3_objects:
-                # 初始化OpenSearch客户端
-                from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
-                import boto3
-                
-                opensearch_endpoint = os.environ.get('OPENSEARCH_ENDPOINT')
-                if opensearch_endpoint:
-                    host = opensearch_endpoint.replace('https://', '')
-                    region = os.environ.get('AWS_REGION', 'us-east-1')
-                    credentials = boto3.Session().get_credentials()
-                    auth = AWSV4SignerAuth(credentials, region, 'aoss')
-                    
-                    opensearch_client = OpenSearch(
-                        hosts=[{'host': host, 'port': 443}],
-                        http_auth=auth,
-                        use_ssl=True,
-                        verify_certs=True,
-                        connection_class=RequestsHttpConnection
-                    )
-                
-                for obj in s3_objects['Contents']:
-                    key = obj['Key']
-                    if key.startswith('bedrock-outputs/') or key.startswith('temp/'):
-                        continue
-                        
-                    # 生成预签名URL
-                    file_url = s3_client.generate_presigned_url(
-                        'get_object',
-                        Params={'Bucket': BUCKET_NAME, 'Key': key},
-                        ExpiresIn=3600
-                    )
-                    
-                    # 检查OpenSearch中的embedding状态
-                    embeddings = []
-                    segment_count = 0
-                    segment_counts = {'visual': 0, 'text': 0, 'audio': 0}
-                    if opensearch_endpoint:
-                        try:
-                            s3_uri = f"s3://{BUCKET_NAME}/{key}"
-                            search_result = opensearch_client.search(
-                                index='embeddings',
-                                body={
-                                    'query': {'term': {'s3_uri': s3_uri}},
-                                    'size': 100
-                                }
-                            )
-                            
-                            total_hits = search_result['hits']['total']['value']
-                            segment_count = total_hits
-                            
-                            if total_hits > 0:
-                                # 统计各类型embedding的数量
-                                for hit in search_result['hits']['hits']:
-                                    doc = hit['_source']
-                                    if 'visual_embedding' in doc:
-                                        segment_counts['visual'] += 1
-                                    if 'text_embedding' in doc:
-                                        segment_counts['text'] += 1
-                                    if 'audio_embedding' in doc:
-                                        segment_counts['audio'] += 1
-                                
-                                # 设置可用的embedding类型
-                                if segment_counts['visual'] > 0:
-                                    embeddings.append('🖼️ 视觉')
-                                if segment_counts['text'] > 0:
-                                    embeddings.append('📝 文本')
-                                if segment_counts['audio'] > 0:
-                                    embeddings.append('🎧 音频')
-                        except:
-                            pass
-                    
-                    # 从DynamoDB获取状态信息
-                    s3_uri = f"s3://{BUCKET_NAME}/{key}"
-                    status_info = get_embedding_status(s3_uri)
-                    
-                    # 确定embedding状态
-                    if len(embeddings) > 0:
-                        embedding_status = 'completed'
-                        status_display = '✅ 已完成'
-                    elif status_info and status_info.get('status'):
-                        db_status = status_info['status']
-                        retry_count = status_info.get('retry_count', 0)
-                        if db_status == 'processing':
-                            embedding_status = 'processing'
-                            status_display = '🔄 处理中'
-                        elif db_status == 'retrying':
-                            embedding_status = 'retrying'
-                            status_display = f'⚠️ 重试中 ({retry_count}/5)'
-                        elif db_status == 'failed':
-                            embedding_status = 'failed'
-                            status_display = '❌ 失败'
-                        else:
-                            embedding_status = 'pending'
-                            status_display = '⏳ 待处理'
-                    else:
-                        # 检查文件类型是否支持
-                        file_ext = key.split('.')[-1].lower()
-                        if file_ext in ALLOWED_TYPES:
-                            embedding_status = 'pending'
-                            status_display = '⏳ 待处理'
-                        else:
-                            embedding_status = 'unsupported'
-                            status_display = '❌ 不支持'
-                    
-                    materials.append({
-                        'key': key,
-                        'name': key.split('/')[-1],
-                        'size': obj['Size'],
-                        'lastModified': obj['LastModified'].isoformat(),
-                        'url': file_url,
-                        'embeddings': embeddings,
-                        'hasEmbedding': len(embeddings) > 0,
-                        'segmentCount': segment_count,
-                        'segmentCounts': segment_counts,
-                        'embeddingStatus': embedding_status,
-                        'statusDisplay': status_display,
-                        'retryCount': status_info.get('retry_count', 0) if status_info else 0,
-                        'lastError': status_info.get('last_error') if status_info else None,
-                        'lastErrorTime': status_info.get('last_error_time') if status_info else None
-                    })
+            if media_type and media_type not in MEDIA_TYPE_EXTENSIONS:
+                raise ValueError(f"不支持的媒体类型: {media_type}")
+            if any(s not in EMBEDDING_STATUSES for s in statuses):
+                raise ValueError(f"不支持的状态过滤。仅支持: {', '.join(EMBEDDING_STATUSES)}")
+            if order not in ('asc', 'desc'):
+                raise ValueError("order 仅支持 asc 或 desc")
+            
+            # 从素材目录表分页查询（由embedding流水线增量维护）
+            items, next_cursor = list_catalog_assets(
+                limit=limit,
+                cursor=params.get('cursor'),
+                media_type=media_type,
+                statuses=statuses,
+                date_from=params.get('from'),
+                date_to=params.get('to'),
+                order=order
+            )
+            materials = [build_material(item) for item in items]
             
             response_body = {
                 'materials': materials,
-                'total': len(materials)
+                'count': len(materials),
+                'nextCursor': next_cursor
             }
             
+        except ValueError as e:
+            response_body = {'error': str(e)}
+            status_code = 400
+        except Exception as e:
+            response_body = {'error': str(e)}
+            status_code = 500
+    elif path == '/api/stats' and method == 'GET':
+        try:
+            response_body = get_cached_embedding_stats()
         except Exception as e:
             response_body = {'error': str(e)}
             status_code = 500
@@ -196,21 +534,7 @@ def handler(event, context):
         try:
             opensearch_endpoint = os.environ.get('OPENSEARCH_ENDPOINT')
             if opensearch_endpoint:
-                from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
-                import boto3
-                
-                host = opensearch_endpoint.replace('https://', '')
-                region = os.environ.get('AWS_REGION', 'us-east-1')
-                credentials = boto3.Session().get_credentials()
-                auth = AWSV4SignerAuth(credentials, region, 'aoss')
-                
-                opensearch_client = OpenSearch(
-                    hosts=[{'host': host, 'port': 443}],
-                    http_auth=auth,
-                    use_ssl=True,
-                    verify_certs=True,
-                    connection_class=RequestsHttpConnection
-                )
+                opensearch_client = get_opensearch_client()
                 
                 # 直接搜索检查索引状态（OpenSearch Serverless兼容）
                 try:
@@ -253,158 +577,110 @@ def handler(event, context):
             status_code = 500
     elif path == '/api/cleanup' and method == 'DELETE':
         try:
-            # 清理S3文件（包括bedrock-outputs）
-            try:
-                # 使用分页获取所有对象
-                paginator = s3_client.get_paginator('list_objects_v2')
-                objects_to_delete = []
-                
-                for page in paginator.paginate(Bucket=BUCKET_NAME):
-                    if 'Contents' in page:
-                        for obj in page['Contents']:
-                            objects_to_delete.append({'Key': obj['Key']})
-                
-                if objects_to_delete:
-                    print(f"Deleting {len(objects_to_delete)} S3 objects")
-                    # 批量删除S3对象
-                    for i in range(0, len(objects_to_delete), 1000):  # S3批量删除最多1000个
-                        batch = objects_to_delete[i:i+1000]
-                        s3_client.delete_objects(
-                            Bucket=BUCKET_NAME,
-                            Delete={'Objects': batch}
-                        )
-                        print(f"Deleted batch {i//1000 + 1}")
-            except Exception as s3_error:
-                print(f"S3 cleanup error: {str(s3_error)}")
-                response_body = {'error': f'S3 cleanup failed: {str(s3_error)}'}
-                status_code = 500
-            
-            # 清理OpenSearch
-            opensearch_endpoint = os.environ.get('OPENSEARCH_ENDPOINT')
-            if opensearch_endpoint:
-                try:
-                    from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
-                    import boto3
-                    
-                    host = opensearch_endpoint.replace('https://', '')
-                    region = os.environ.get('AWS_REGION', 'us-east-1')
-                    credentials = boto3.Session().get_credentials()
-                    auth = AWSV4SignerAuth(credentials, region, 'aoss')
-                    
-                    opensearch_client = OpenSearch(
-                        hosts=[{'host': host, 'port': 443}],
-                        http_auth=auth,
-                        use_ssl=True,
-                        verify_certs=True,
-                        connection_class=RequestsHttpConnection
-                    )
-                    
-                    # 删除所有embedding数据 - OpenSearch Serverless不支持delete_by_query
-                    index_name = os.environ.get('OPENSEARCH_INDEX', 'embeddings')
-                    
-                    # 使用多轮删除确保所有文档都被删除
-                    total_deleted = 0
-                    max_rounds = 10  # 最多10轮
-                    
-                    for round_num in range(max_rounds):
-                        # 检查是否还有文档
-                        check_result = opensearch_client.search(
-                            index=index_name,
-                            body={
-                                'query': {'match_all': {}},
-                                'size': 0  # 只要总数
-                            }
-                        )
-                        
-                        remaining_docs = check_result['hits']['total']['value']
-                        print(f"Round {round_num + 1}: {remaining_docs} documents remaining")
-                        
-                        if remaining_docs == 0:
-                            break
-                            
-                        # 获取一批文档ID进行删除
-                        search_result = opensearch_client.search(
-                            index=index_name,
-                            body={
-                                'query': {'match_all': {}},
-                                'size': min(500, remaining_docs),  # 每次最多500个
-                                '_source': False
-                            }
-                        )
-                        
-                        hits = search_result['hits']['hits']
-                        if not hits:
-                            break
-                            
-                        # 批量删除
-                        bulk_body = []
-                        for hit in hits:
-                            bulk_body.append({
-                                'delete': {
-                                    '_index': index_name,
-                                    '_id': hit['_id']
-                                }
-                            })
-                        
-                        if bulk_body:
-                            delete_result = opensearch_client.bulk(body=bulk_body)
-                            batch_deleted = len(bulk_body)
-                            total_deleted += batch_deleted
-                            print(f"Deleted {batch_deleted} documents in round {round_num + 1}, total: {total_deleted}")
-                            
-                            # 检查是否有删除错误
-                            if 'errors' in delete_result and delete_result['errors']:
-                                print(f"Some delete errors occurred: {delete_result}")
-                        
-                        # 等待一下让索引更新
-                        import time
-                        time.sleep(1)
-                    
-                    print(f"Cleared {total_deleted} documents from OpenSearch index: {index_name} in {round_num + 1} rounds")
-                except Exception as os_error:
-                    print(f"OpenSearch cleanup error: {str(os_error)}")
-                    import traceback
-                    traceback.print_exc()
-            
-            # 清理DynamoDB搜索记录
-            search_table_name = os.environ.get('SEARCH_TABLE_NAME', 'multimodal-search-search-tasks')
-            if search_table_name:
-                try:
-                    dynamodb = boto3.resource('dynamodb')
-                    table = dynamodb.Table(search_table_name)
-                    
-                    # 扫描并删除所有记录
-                    deleted_count = 0
-                    scan_response = table.scan()
-                    
-                    while True:
-                        items = scan_response.get('Items', [])
-                        if items:
-                            with table.batch_writer() as batch:
-                                for item in items:
-                                    batch.delete_item(Key={'search_id': item['search_id']})
-                                    deleted_count += 1
-                        
-                        # 检查是否有更多数据
-                        if 'LastEvaluatedKey' not in scan_response:
-                            break
-                        scan_response = table.scan(ExclusiveStartKey=scan_response['LastEvaluatedKey'])
-                    
-                    print(f"DynamoDB deleted {deleted_count} search records")
-                except Exception as db_error:
-                    print(f"DynamoDB cleanup error: {str(db_error)}")
+            # 清库改为后台任务：别名切换到新索引 + 分页删除S3和DynamoDB数据
+            job = start_purge_job()
+            response_body = {
+                "success": True,
+                "jobId": job['job_id'],
+                "status": job['status'],
+                "message": "清库任务已启动"
+            }
+            status_code = 202
             
-            if 'response_body' not in locals():
+        except Exception as e:
+            response_body = {'error': str(e)}
+            status_code = 500
+    elif path.startswith('/api/cleanup/') and method == 'GET':
+        try:
+            job_id = path.split('/')[-1]
+            job = dynamodb.Table(JOBS_TABLE_NAME).get_item(Key={'job_id': job_id}).get('Item')
+            if job:
                 response_body = {
-                    "success": True,
-                    "message": "清库操作完成，所有数据已清理干净"
+                    'jobId': job_id,
+                    'status': job['status'],
+                    'step': job.get('step'),
+                    'progress': job.get('progress', {}),
+                    'error': job.get('error'),
+                    'createdAt': job.get('created_at'),
+                    'updatedAt': job.get('updated_at')
                 }
-            status_code = 200
-            
+            else:
+                response_body = {'error': 'Job not found'}
+                status_code = 404
+                
         except Exception as e:
             response_body = {'error': str(e)}
             status_code = 500
+    elif path == '/api/upload/initiate' and method == 'POST':
+        try:
+            body = json.loads(event.get('body') or '{}')
+            file_name = body.get('fileName')
+            file_type = body.get('fileType')
+            file_size = body.get('fileSize')
+            
+            # 验证必要参数
+            if not all([file_name, file_type, file_size]):
+                response_body = {"error": "缺少必要参数: fileName, fileType, fileSize"}
+                status_code = 400
+            elif file_name.split('.')[-1].lower() not in ALLOWED_TYPES:
+                response_body = {"error": f"不支持的文件类型。仅支持: {', '.join(ALLOWED_TYPES)}"}
+                status_code = 400
+            elif int(file_size) > MAX_UPLOAD_SIZE:
+                response_body = {"error": f"文件大小超过限制: {MAX_UPLOAD_SIZE // (1024 * 1024)}MB"}
+                status_code = 400
+            else:
+                response_body = initiate_multipart_upload(file_name, file_type, int(file_size))
+        except Exception as e:
+            response_body = {"error": str(e)}
+            status_code = 500
+    elif path == '/api/upload/complete' and method == 'POST':
+        try:
+            body = json.loads(event.get('body') or '{}')
+            key = body.get('key')
+            upload_id = body.get('uploadId')
+            parts = body.get('parts')
+            
+            if not all([key, upload_id, parts]):
+                response_body = {"error": "缺少必要参数: key, uploadId, parts"}
+                status_code = 400
+            elif not is_upload_key(key):
+                response_body = {"error": "无效的上传key"}
+                status_code = 400
+            else:
+                size, error = complete_multipart_upload(key, upload_id, parts)
+                if error:
+                    response_body = {"error": error}
+                    status_code = 400
+                else:
+                    put_catalog_asset(key, size)
+                    response_body = {
+                        "success": True,
+                        "fileName": key,
+                        "s3Uri": f"s3://{BUCKET_NAME}/{key}",
+                        "size": size,
+                        "uploadTime": datetime.now().isoformat()
+                    }
+        except Exception as e:
+            response_body = {"error": str(e)}
+            status_code = 500
+    elif path == '/api/upload/abort' and method == 'POST':
+        try:
+            body = json.loads(event.get('body') or '{}')
+            if not is_upload_key(body.get('key')) or not body.get('uploadId'):
+                response_body = {"error": "无效的上传key或uploadId"}
+                status_code = 400
+            else:
+                s3_client.abort_multipart_upload(
+                    Bucket=BUCKET_NAME,
+                    Key=body['key'],
+                    UploadId=body['uploadId']
+                )
+                response_body = {"success": True}
+        except Exception as e:
+            response_body = {"error": str(e)}
+            status_code = 500
     elif path == '/api/upload' and method == 'POST':
+        # 旧版base64上传（受API Gateway 10MB限制），前端已改用分片直传
         try:
             body = json.loads(event.get('body', '{}'))
             file_data = body.get('file')
@@ -423,7 +699,7 @@ def handler(event, context):
                     status_code = 400
                 else:
                     # 生成唯一文件名
-                    unique_name = f"{uuid.uuid4()}.{ext}"
+                    unique_name = f"{UPLOAD_PREFIX}{uuid.uuid4()}.{ext}"
                     
                     # 解码base64文件数据
                     file_content = base64.b64decode(file_data)
@@ -435,6 +711,7 @@ def handler(event, context):
                         Body=file_content,
                         ContentType=file_type
                     )
+                    put_catalog_asset(unique_name, len(file_content))
                     
                     s3_uri = f"s3://{BUCKET_NAME}/{unique_name}"
                     response_body = {
@@ -0,0 +1,304 @@
+import json
+import os
+import time
+from datetime import datetime
+from warm_clients import lazy_client, lazy_resource, get_opensearch_client
+from bedrock_pool import CONCURRENCY_POOL, lane_limit
+
+# 初始化客户端（容器内复用）
+s3_client = lazy_client('s3')
+sqs_client = lazy_client('sqs')
+dynamodb = lazy_resource('dynamodb')
+
+# 配置
+OPENSEARCH_ENDPOINT = os.environ.get('OPENSEARCH_ENDPOINT')
+OPENSEARCH_INDEX = os.environ.get('OPENSEARCH_INDEX', 'embeddings')
+STATUS_TABLE_NAME = os.environ.get('STATUS_TABLE_NAME', 'multimodal-search-embedding-status')
+CATALOG_TABLE_NAME = os.environ.get('CATALOG_TABLE_NAME', 'multimodal-search-asset-catalog')
+CONCURRENCY_TABLE_NAME = os.environ.get('CONCURRENCY_TABLE_NAME', 'multimodal-search-concurrency')
+EMBEDDING_DLQ_URL = os.environ.get('EMBEDDING_DLQ_URL')
+EMBEDDING_QUEUE_URLS = json.loads(os.environ.get('EMBEDDING_QUEUE_URLS', '{}'))
+
+# 与embedding Lambda的通道划分保持一致
+IMAGE_EXTENSIONS = ['png', 'jpeg', 'jpg', 'webp']
+SMALL_MEDIA_MAX_BYTES = int(os.environ.get('SMALL_MEDIA_MAX_BYTES', str(50 * 1024 * 1024)))
+LANE_PRIORITY = ['image', 'media-small', 'media-large']  # 小文件优先恢复
+AIMD_INITIAL_LIMIT = 2  # 共享池（bedrock_pool.CONCURRENCY_POOL）尚未初始化时的上限
+
+# 限速：每个通道每轮最多补充 (该通道在共享并发上限中的份额 × 系数 - 队列积压) 条
+DEFAULT_MAX_MESSAGES = int(os.environ.get('REDRIVE_MAX_MESSAGES', '100'))  # 每轮最多扫描的DLQ消息数
+MESSAGES_PER_SLOT = int(os.environ.get('REDRIVE_MESSAGES_PER_SLOT', '5'))
+THROTTLE_QUIET_SECONDS = 300  # 最近限流过的通道本轮不补充
+REDRIVE_SPACING_SECONDS = 3  # 同一通道的消息按间隔延迟投递，避免突发
+MAX_DELAY_SECONDS = 900  # SQS DelaySeconds上限
+RECEIVE_VISIBILITY_SECONDS = 300
+MAX_REDRIVES = int(os.environ.get('MAX_REDRIVES', '3'))  # 同一文件最多重投次数，超过后不再投回
+
+def handler(event, context):
+    """
+    DLQ重投Lambda - 定时或由scripts/redrive_dlq.py调用
+    分批读取embedding DLQ，跳过已完成/重复/源文件已删除的消息，
+    永久错误或重投次数已达MAX_REDRIVES的文件停放（从DLQ删除，状态保持failed），
+    其余按通道优先级和消息年龄排序，在Bedrock并发余量内分批投回各通道队列
+    """
+    event = event or {}
+    max_messages = int(event.get('maxMessages', DEFAULT_MAX_MESSAGES))
+    dry_run = bool(event.get('dryRun', False))
+
+    messages = receive_dlq_messages(max_messages)
+    print(f"Received {len(messages)} DLQ messages (dry run: {dry_run})")
+
+    report = {
+        'scanned': len(messages),
+        'redriven': {lane: 0 for lane in LANE_PRIORITY},
+        'already_completed': 0,
+        'duplicates': 0,
+        'missing_source': 0,
+        'invalid': 0,
+        'parked': 0,
+        'deferred': 0,
+        'dry_run': dry_run
+    }
+
+    candidates = []
+    seen_uris = set()
+    opensearch_client = get_opensearch_client() if OPENSEARCH_ENDPOINT else None
+    for message in messages:
+        record = parse_dlq_message(message)
+        if not record:
+            report['invalid'] += 1
+            finish_message(message, delete=not dry_run)
+            continue
+
+        if record['s3_uri'] in seen_uris:
+            report['duplicates'] += 1
+            finish_message(message, delete=not dry_run)
+            continue
+        seen_uris.add(record['s3_uri'])
+
+        status_item = load_status(record['s3_uri'])
+        if is_already_embedded(opensearch_client, record['s3_uri'], status_item):
+            report['already_completed'] += 1
+            finish_message(message, delete=not dry_run)
+            continue
+
+        park_reason = redrive_park_reason(record, status_item)
+        if park_reason:
+            report['parked'] += 1
+            if not dry_run:
+                park_record(record, park_reason)
+            finish_message(message, delete=not dry_run)
+            continue
+
+        if record['size'] is None:
+            try:
+                record['size'] = s3_client.head_object(Bucket=record['bucket'], Key=record['key'])['ContentLength']
+            except Exception as e:
+                print(f"Source object unavailable for {record['s3_uri']}: {str(e)}")
+                report['missing_source'] += 1
+                finish_message(message, delete=not dry_run)
+                continue
+
+        record['lane'] = ingest_lane(record['key'].split('.')[-1].lower(), record['size'])
+        record['message'] = message
+        candidates.append(record)
+
+    # 通道优先级高的先投，同通道内最早进入DLQ的先投
+    candidates.sort(key=lambda r: (LANE_PRIORITY.index(r['lane']), r['sent_at']))
+    budgets = {lane: redrive_budget(lane) for lane in LANE_PRIORITY}
+    print(f"Redrive budgets: {budgets}")
+
+    for record in candidates:
+        lane = record['lane']
+        if report['redriven'][lane] >= budgets[lane]:
+            report['deferred'] += 1
+            finish_message(record['message'], delete=False)
+            continue
+
+        if not dry_run:
+            delay = min(MAX_DELAY_SECONDS, report['redriven'][lane] * REDRIVE_SPACING_SECONDS)
+            redrive_record(record, delay)
+            finish_message(record['message'], delete=True)
+        else:
+            finish_message(record['message'], delete=False)
+        report['redriven'][lane] += 1
+
+    report['remaining'] = get_queue_depth(EMBEDDING_DLQ_URL)
+    print(f"Redrive report: {json.dumps(report)}")
+    return report
+
+def receive_dlq_messages(max_messages):
+    """从DLQ读取最多max_messages条消息（读取期间对其他消费者不可见）"""
+    messages = []
+    while len(messages) < max_messages:
+        response = sqs_client.receive_message(
+            QueueUrl=EMBEDDING_DLQ_URL,
+            MaxNumberOfMessages=min(10, max_messages - len(messages)),
+            VisibilityTimeout=RECEIVE_VISIBILITY_SECONDS,
+            WaitTimeSeconds=1,
+            AttributeNames=['SentTimestamp'],
+            MessageAttributeNames=['All']
+        )
+        batch = response.get('Messages', [])
+        if not batch:
+            break
+        messages.extend(batch)
+    return messages
+
+def parse_dlq_message(message):
+    """解析DLQ消息中的S3对象（兼容EventBridge和S3通知两种格式），无法解析时返回None"""
+    try:
+        body = json.loads(message['Body'])
+        if body.get('source') == 'aws.s3':
+            bucket = body['detail']['bucket']['name']
+            obj = body['detail']['object']
+        else:
+            s3_record = body['Records'][0]['s3']
+            bucket = s3_record['bucket']['name']
+            obj = s3_record['object']
+    except (ValueError, KeyError, IndexError, TypeError):
+        print(f"Unparseable DLQ message {message.get('MessageId')}")
+        return None
+
+    return {
+        'bucket': bucket,
+        'key': obj['key'],
+        'size': obj.get('size'),
+        's3_uri': f"s3://{bucket}/{obj['key']}",
+        'sent_at': int(message.get('Attributes', {}).get('SentTimestamp', '0')),
+        # embedding Lambda转入DLQ时附带的错误类型；超过maxReceiveCount由SQS转入的消息没有该属性
+        'error_class': message.get('MessageAttributes', {}).get('error_class', {}).get('StringValue')
+    }
+
+def ingest_lane(file_ext, size):
+    """按媒体类型和大小确定摄取通道（与embedding Lambda一致）"""
+    if file_ext in IMAGE_EXTENSIONS:
+        return 'image'
+    return 'media-small' if (size or 0) < SMALL_MEDIA_MAX_BYTES else 'media-large'
+
+def load_status(s3_uri):
+    """读取状态表中该文件的状态、重投次数和最后一次错误类型"""
+    return dynamodb.Table(STATUS_TABLE_NAME).get_item(
+        Key={'s3_uri': s3_uri},
+        ProjectionExpression='#s, redrive_count, last_error_class',
+        ExpressionAttributeNames={'#s': 'status'}
+    ).get('Item') or {}
+
+def redrive_park_reason(record, status_item):
+    """
+    不应再投回的原因：永久错误（消息属性，或状态为failed且记录的错误类型为permanent）、
+    或重投次数已达MAX_REDRIVES；可以重投时返回None
+    """
+    if record['error_class'] == 'permanent' or (
+        status_item.get('status') == 'failed' and status_item.get('last_error_class') == 'permanent'
+    ):
+        return 'permanent'
+    if int(status_item.get('redrive_count', 0)) >= MAX_REDRIVES:
+        return 'max_redrives'
+    return None
+
+def is_already_embedded(opensearch_client, s3_uri, status_item):
+    """状态表为completed，或索引中已有该文件的向量文档"""
+    if status_item.get('status') == 'completed':
+        return True
+    if opensearch_client is None:
+        return False
+
+    try:
+        result = opensearch_client.count(
+            index=OPENSEARCH_INDEX,
+            body={'query': {'term': {'s3_uri': s3_uri}}}
+        )
+        return result.get('count', 0) > 0
+    except Exception as e:
+        print(f"Failed to check index for {s3_uri}: {str(e)}")
+        return False
+
+def redrive_budget(lane):
+    """
+    根据共享AIMD并发控制状态计算该通道本轮可投递条数：
+    最近限流过则为0，否则为 通道份额名额数 × MESSAGES_PER_SLOT 减去通道队列现有积压
+    """
+    state = dynamodb.Table(CONCURRENCY_TABLE_NAME).get_item(
+        Key={'pool': CONCURRENCY_POOL}, ConsistentRead=True
+    ).get('Item') or {}
+    if time.time() - int(state.get('last_decrease', 0)) < THROTTLE_QUIET_SECONDS:
+        return 0
+
+    limit = int(state.get('limit', AIMD_INITIAL_LIMIT))
+    lane_slots = lane_limit(lane, limit)
+    backlog = get_queue_depth(EMBEDDING_QUEUE_URLS[lane])
+    return max(0, lane_slots * MESSAGES_PER_SLOT - backlog)
+
+def get_queue_depth(queue_url):
+    """队列中可见和处理中的消息总数"""
+    attributes = sqs_client.get_queue_attributes(
+        QueueUrl=queue_url,
+        AttributeNames=['ApproximateNumberOfMessages', 'ApproximateNumberOfMessagesNotVisible']
+    )['Attributes']
+    return int(attributes['ApproximateNumberOfMessages']) + int(attributes['ApproximateNumberOfMessagesNotVisible'])
+
+def park_record(record, reason):
+    """停放不再重投的文件：状态保持failed并记录原因，消息随后从DLQ删除"""
+    dynamodb.Table(STATUS_TABLE_NAME).update_item(
+        Key={'s3_uri': record['s3_uri']},
+        UpdateExpression="SET #s = :failed, parked_reason = :reason, last_updated = :now REMOVE active_status",
+        ExpressionAttributeNames={'#s': 'status'},
+        ExpressionAttributeValues={':failed': 'failed', ':reason': reason, ':now': datetime.now().isoformat()}
+    )
+    try:
+        dynamodb.Table(CATALOG_TABLE_NAME).update_item(
+            Key={'asset_key': record['key']},
+            UpdateExpression="SET #s = :failed, updated_at = :now",
+            ConditionExpression="attribute_exists(asset_key)",
+            ExpressionAttributeNames={'#s': 'status'},
+            ExpressionAttributeValues={':failed': 'failed', ':now': datetime.now().isoformat()}
+        )
+    except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+        pass
+    print(f"Parked {record['s3_uri']} ({reason})")
+
+def redrive_record(record, delay):
+    """
+    递增重投次数后把对象投回对应通道队列
+    failure_count保留累计值，embedding Lambda按重投次数增加一份重试预算
+    """
+    dynamodb.Table(STATUS_TABLE_NAME).update_item(
+        Key={'s3_uri': record['s3_uri']},
+        UpdateExpression=(
+            "SET #s = :pending, redrive_count = if_not_exists(redrive_count, :zero) + :one, "
+            "last_updated = :now REMOVE active_status"
+        ),
+        ExpressionAttributeNames={'#s': 'status'},
+        ExpressionAttributeValues={':pending': 'pending', ':zero': 0, ':one': 1, ':now': datetime.now().isoformat()}
+    )
+    try:
+        _, object_key = record['s3_uri'][5:].split('/', 1)
+        dynamodb.Table(CATALOG_TABLE_NAME).update_item(
+            Key={'asset_key': object_key},
+            UpdateExpression="SET #s = :pending, updated_at = :now",
+            ConditionExpression="attribute_exists(asset_key)",
+            ExpressionAttributeNames={'#s': 'status'},
+            ExpressionAttributeValues={':pending': 'pending', ':now': datetime.now().isoformat()}
+        )
+    except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+        pass
+    sqs_client.send_message(
+        QueueUrl=EMBEDDING_QUEUE_URLS[record['lane']],
+        MessageBody=json.dumps({'Records': [{
+            'eventName': 'ObjectCreated:Redrive',
+            'eventTime': datetime.now().isoformat(),
+            's3': {'bucket': {'name': record['bucket']}, 'object': {'key': record['key'], 'size': record['size']}}
+        }]}),
+        DelaySeconds=delay
+    )
+    print(f"Redrove {record['s3_uri']} to {record['lane']} lane (delay {delay}s)")
+
+def finish_message(message, delete):
+    """已处理的消息从DLQ删除，未处理的立即恢复可见以便下一轮读取"""
+    if delete:
+        sqs_client.delete_message(QueueUrl=EMBEDDING_DLQ_URL, ReceiptHandle=message['ReceiptHandle'])
+    else:
+        sqs_client.change_message_visibility(
+            QueueUrl=EMBEDDING_DLQ_URL, ReceiptHandle=message['ReceiptHandle'], VisibilityTimeout=0
+        )
@@ -1,31 +1,87 @@
 import json
-import boto3
 import base64
-from datetime import datetime
+from datetime import datetime, timedelta
 import uuid
 import os
 import time
-from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
+import io
+import shutil
+import subprocess
+import tempfile
+import random
+from warm_clients import lazy_client, lazy_resource, get_account_id, get_opensearch_client, index_exists, register_priming
+from index_schema import build_index_body
+from asset_catalog import utc_timestamp
+from tracing import trace_from_sqs_record, end_trace, span, record_span
+from bedrock_pool import (
+    CONCURRENCY_POOL, BedrockRegionRouter, ConcurrencyLimitExceeded, is_throttling_error,
+    acquire_bedrock_slot, release_bedrock_slot, region_from_arn
+)
 
-# 初始化客户端
-s3_client = boto3.client('s3')
-bedrock_client = boto3.client('bedrock-runtime')
-dynamodb = boto3.resource('dynamodb')
+# 初始化客户端（容器内复用）
+s3_client = lazy_client('s3')
+sqs_client = lazy_client('sqs')
+lambda_client = lazy_client('lambda')
+dynamodb = lazy_resource('dynamodb')
+register_priming(clients=['s3', 'sqs', 'bedrock-runtime'], resources=['dynamodb'], opensearch=True)
 
 # DynamoDB表名
 STATUS_TABLE_NAME = os.environ.get('STATUS_TABLE_NAME', 'multimodal-search-embedding-status')
+CATALOG_TABLE_NAME = os.environ.get('CATALOG_TABLE_NAME', 'multimodal-search-asset-catalog')
+CATALOG_PARTITION = 'asset'  # 素材目录GSI的固定分区键，用于按时间排序分页
 
 # 配置
 OPENSEARCH_ENDPOINT = os.environ.get('OPENSEARCH_ENDPOINT')
 OPENSEARCH_INDEX = os.environ.get('OPENSEARCH_INDEX', 'embeddings')
 TITAN_MODEL_ID = 'amazon.titan-embed-image-v1'
 MARENG0_MODEL_ID = 'twelvelabs.marengo-embed-2-7-v1:0'
-VECTOR_DIMENSION = 1024
+
+# 缩略图/预览等衍生文件（embedding流水线跳过该前缀）
+DERIVATIVES_PREFIX = 'derivatives/'
+THUMBNAIL_SIZE = int(os.environ.get('THUMBNAIL_SIZE', '480'))
+PREVIEW_MAX_SECONDS = int(os.environ.get('PREVIEW_MAX_SECONDS', '30'))
+FFMPEG_TIMEOUT = 60
+FFMPEG_MIN_SECONDS = 10  # 剩余时间不足以完成一步时跳过该步
+DERIVATIVES_TIME_MARGIN_MS = 15000  # 留给上传和更新目录的时间
+# 视频衍生文件（ffmpeg/ffprobe）由独立的衍生文件Lambda异步生成，不占用embedding Lambda的超时
+DERIVATIVES_FUNCTION_NAME = os.environ.get('DERIVATIVES_FUNCTION_NAME')
+
+# AIMD自适应并发控制（bedrock_pool）：embedding各通道和search worker共用同一个marengo池，
+# 各通道只能占用共享上限的一定份额（LANE_SHARES，可通过IMAGE_LANE_SHARE等环境变量调整）
+SLOT_WAIT_SECONDS = 30  # 等待空闲名额的最长时间
+
+# 逐条消息的指数退避（full jitter），通过ChangeMessageVisibility实现
+EMBEDDING_DLQ_URL = os.environ.get('EMBEDDING_DLQ_URL')
+MAX_FAILURE_ATTEMPTS = int(os.environ.get('MAX_FAILURE_ATTEMPTS', '4'))  # 非限流错误的重试预算（DLQ每重投一次再增加一份）
+THROTTLE_BACKOFF_BASE = 20  # 秒
+TRANSIENT_BACKOFF_BASE = 10  # 秒
+MAX_BACKOFF = 900  # 秒
+PERMANENT_ERROR_CODES = ['ValidationException', 'AccessDeniedException', 'ResourceNotFoundException', 'NoSuchKey']
+
+# 多区域Bedrock路由：BEDROCK_REGIONS为远端区域列表（JSON），例如
+# [{"region": "us-west-2", "outputBucket": "my-usw2-bedrock-staging", "maxConcurrency": 4, "transferCostPerGb": 0.02}]
+# 未配置时只使用本区域
+HOME_REGION = os.environ.get('AWS_REGION', 'us-east-1')
+BEDROCK_REGIONS = json.loads(os.environ.get('BEDROCK_REGIONS', '[]'))
+
+# 卡住任务清理：稀疏GSI只包含处理中/重试中的记录
+ACTIVE_STATUSES = ['processing', 'retrying']
+ACTIVE_STATUS_INDEX = 'active-status-index'
+STALE_AFTER_SECONDS = int(os.environ.get('STALE_AFTER_SECONDS', '1800'))  # 大于Lambda超时 + 最大退避
+SWEEP_MIN_REMAINING_MS = 90000
+EMBEDDING_QUEUE_URLS = json.loads(os.environ.get('EMBEDDING_QUEUE_URLS', '{}'))
+
+# 摄取优先级通道：图片、小音视频、大音视频分别排队，各自最多占用共享并发上限的一定比例（bedrock_pool.LANE_SHARES）
+IMAGE_EXTENSIONS = ['png', 'jpeg', 'jpg', 'webp']
+SMALL_MEDIA_MAX_BYTES = int(os.environ.get('SMALL_MEDIA_MAX_BYTES', str(50 * 1024 * 1024)))
 
 def handler(event, context):
     """
-    SQS触发的Embedding处理Lambda
+    SQS触发的Embedding处理Lambda（定时事件触发时清理卡住的任务）
     """
+    if event.get('detail-type') == 'Scheduled Event':
+        return sweep_stale_jobs(context)
+    
     try:
         # 初始化OpenSearch客户端
         opensearch_client = get_opensearch_client()
@@ -33,168 +89,281 @@ def handler(event, context):
         
         # 解析SQS消息中的S3事件
         print(f"Received {len(event['Records'])} SQS records")
+        batch_item_failures = []
         for sqs_record in event['Records']:
             print(f"Processing SQS record: {sqs_record.get('messageId', 'unknown')}")
             print(f"SQS attributes: {sqs_record.get('attributes', {})}")
-            # SQS消息体包含S3事件
-            s3_event = json.loads(sqs_record['body'])
-            
-            # 处理S3事件中的每个记录
-            print(f"S3 event contains {len(s3_event['Records'])} records")
-            for s3_record in s3_event['Records']:
-                bucket_name = s3_record['s3']['bucket']['name']
-                object_key = s3_record['s3']['object']['key']
-                s3_uri = f"s3://{bucket_name}/{object_key}"
-                
-                print(f"Processing file from SQS: {s3_uri}")
-                print(f"S3 event type: {s3_record.get('eventName', 'unknown')}")
-                print(f"S3 event time: {s3_record.get('eventTime', 'unknown')}")
-            
-                # 跳过Bedrock输出文件
-                if 'bedrock-outputs/' in object_key or 'temp/' in object_key:
-                    print(f"SKIPPING Bedrock output or temp file: {object_key}")
-                    continue
-                
-                print(f"File will be processed: {object_key}")
-                
-                # 更新状态为处理中
-                update_embedding_status(s3_uri, 'processing', retry_count=int(sqs_record.get('attributes', {}).get('ApproximateReceiveCount', '1')))
-                
-                # 判断文件类型
-                file_ext = object_key.split('.')[-1].lower()
-                print(f"Detected file extension: {file_ext}")
-                
-                try:
-                    if file_ext in ['png', 'jpeg', 'jpg', 'webp']:
-                        # 图片文件 - 使用Marengo模型
-                        print(f"Processing IMAGE file: {s3_uri}")
-                        embedding = get_embedding_from_marengo('image', s3_uri, bucket_name)
-                        store_embedding(opensearch_client, 'image', s3_uri, embedding, file_ext)
-                    elif file_ext in ['mp4', 'mov']:
-                        # 视频文件 - 使用Marengo模型
-                        print(f"Processing VIDEO file: {s3_uri}")
-                        embedding = get_embedding_from_marengo('video', s3_uri, bucket_name)
-                        store_embedding(opensearch_client, 'video', s3_uri, embedding, file_ext)
-                    elif file_ext in ['wav', 'mp3', 'm4a']:
-                        # 音频文件 - 使用Marengo模型的audio功能
-                        print(f"Processing AUDIO file: {s3_uri}")
-                        embedding = get_embedding_from_marengo('audio', s3_uri, bucket_name)
-                        store_embedding(opensearch_client, 'audio', s3_uri, embedding, file_ext)
-                    else:
-                        print(f"UNSUPPORTED file type: {file_ext} for {s3_uri}")
-                        continue
-                        
-                    print(f"SUCCESS: Completed processing {s3_uri}")
-                    # 更新状态为已完成
-                    update_embedding_status(s3_uri, 'completed', clear_error=True)
-                    
-                except Exception as file_error:
-                    error_msg = str(file_error)
-                    retry_count = int(sqs_record.get('attributes', {}).get('ApproximateReceiveCount', '1'))
-                    print(f"Error processing file {s3_uri}: {error_msg}")
-                    print(f"SQS message attributes: {sqs_record.get('attributes', {})}")
-                    print(f"Current retry count: {retry_count}")
-                    
-                    # 更新错误状态
-                    update_embedding_status(s3_uri, 'retrying', retry_count=retry_count, error_msg=error_msg)
-                    
-                    # 检查是否是Quota限制错误
-                    if any(keyword in error_msg.lower() for keyword in ['throttl', 'quota', 'limit', 'rate']):
-                        print(f"QUOTA/RATE LIMIT detected for {s3_uri}, retry #{retry_count}. Will retry via SQS redrive policy.")
-                        print(f"Error type: ThrottlingException - Will retry after delay")
-                        # 对于quota错误，让SQS自动重试
-                        raise file_error
-                    else:
-                        print(f"NON-QUOTA error for {s3_uri}, retry #{retry_count}: {error_msg}")
-                        # 对于非quota错误，也让SQS重试，但记录更多信息
-                        print(f"Error details: {type(file_error).__name__}: {error_msg}")
-                        import traceback
-                        print(f"Traceback: {traceback.format_exc()}")
-                        raise file_error
-            
-        return {
-            'statusCode': 200,
-            'body': json.dumps({'message': 'Embedding processing completed'})
-        }
+            # 每条消息一个trace（消息带traceparent时延续上游trace），处理完输出分阶段耗时
+            trace = trace_from_sqs_record(sqs_record)
+            # SQS消息体包含S3事件（EventBridge通道路由或旧的S3通知格式）
+            try:
+                process_sqs_record(sqs_record, opensearch_client, trace, batch_item_failures)
+            finally:
+                end_trace(trace, Operation=trace.attributes.get('lane', 'skipped'))
+        
+        # 部分批处理失败：只有列出的消息会在其可见性超时后重新投递
+        return {'batchItemFailures': batch_item_failures}
         
     except Exception as e:
         print(f"FATAL ERROR in embedding handler: {str(e)}")
         import traceback
         traceback.print_exc()
         print(f"Event that caused error: {json.dumps(event, default=str)}")
-        # 对于handler级别的错误，也要抛出异常让SQS重试
+        # 对于handler级别的错误，也要抛出异常让SQS重试整批消息
         raise e
 
-def get_opensearch_client():
-    """初始化OpenSearch客户端"""
-    if not OPENSEARCH_ENDPOINT:
-        raise ValueError("OPENSEARCH_ENDPOINT environment variable not set")
+def process_sqs_record(sqs_record, opensearch_client, trace, batch_item_failures):
+    """处理一条SQS消息中的S3事件；可重试的失败追加到batch_item_failures"""
+    s3_records = parse_s3_records(sqs_record['body'])
     
-    # 提取主机名（移除所有https://前缀）
-    host = OPENSEARCH_ENDPOINT.replace("https://", "").replace("https://", "")
-    region = os.environ.get('AWS_REGION', 'us-east-1')
+    # 处理S3事件中的每个记录
+    print(f"S3 event contains {len(s3_records)} records")
+    for s3_record in s3_records:
+        bucket_name = s3_record['s3']['bucket']['name']
+        object_key = s3_record['s3']['object']['key']
+        s3_uri = f"s3://{bucket_name}/{object_key}"
+        
+        print(f"Processing file from SQS: {s3_uri}")
+        print(f"S3 event type: {s3_record.get('eventName', 'unknown')}")
+        print(f"S3 event time: {s3_record.get('eventTime', 'unknown')}")
     
-    # 创建AWS签名认证
-    credentials = boto3.Session().get_credentials()
-    auth = AWSV4SignerAuth(credentials, region, 'aoss')
+        # 跳过Bedrock输出、临时查询文件、搜索结果和衍生文件
+        if 'bedrock-outputs/' in object_key or 'temp/' in object_key or object_key.startswith(('search-results/', DERIVATIVES_PREFIX)):
+            print(f"SKIPPING Bedrock output, temp, search result or derivative file: {object_key}")
+            continue
+        
+        print(f"File will be processed: {object_key}")
+        
+        # 判断文件类型
+        file_ext = object_key.split('.')[-1].lower()
+        print(f"Detected file extension: {file_ext}")
+        receive_count = int(sqs_record.get('attributes', {}).get('ApproximateReceiveCount', '1'))
+        
+        if file_ext not in ['png', 'jpeg', 'jpg', 'webp', 'mp4', 'mov', 'wav', 'mp3', 'm4a']:
+            print(f"UNSUPPORTED file type: {file_ext} for {s3_uri}")
+            update_asset_catalog(
+                s3_uri, 'unsupported',
+                size=s3_record['s3']['object'].get('size'),
+                last_modified=s3_record.get('eventTime')
+            )
+            continue
+        
+        # 上传校验失败的文件在完成分片上传后立即被删除，不写入状态和目录
+        if not object_exists(bucket_name, object_key):
+            print(f"SKIPPING deleted object (rejected upload or removed): {s3_uri}")
+            continue
+        
+        # 非限流错误的累计失败次数（限流重试不消耗该预算）和DLQ重投次数
+        failure_count, redrive_count = get_failure_counts(s3_uri)
+        
+        # 更新状态为处理中
+        update_embedding_status(
+            s3_uri, 'processing', retry_count=receive_count, failure_count=failure_count,
+            size=s3_record['s3']['object'].get('size'), redrive_count=redrive_count
+        )
+        update_asset_catalog(
+            s3_uri, 'processing', retry_count=receive_count,
+            size=s3_record['s3']['object'].get('size'),
+            last_modified=s3_record.get('eventTime')
+        )
+        
+        try:
+            if file_ext in ['png', 'jpeg', 'jpg', 'webp']:
+                # 图片文件 - 使用Marengo模型
+                media_type = 'image'
+                print(f"Processing IMAGE file: {s3_uri}")
+            elif file_ext in ['mp4', 'mov']:
+                # 视频文件 - 使用Marengo模型
+                media_type = 'video'
+                print(f"Processing VIDEO file: {s3_uri}")
+            else:
+                # 音频文件 - 使用Marengo模型的audio功能
+                media_type = 'audio'
+                print(f"Processing AUDIO file: {s3_uri}")
+            
+            size = s3_record['s3']['object'].get('size')
+            lane = ingest_lane(file_ext, size)
+            region, pool = bedrock_router.choose(CONCURRENCY_POOL, lane, size)
+            print(f"Ingest lane: {lane}, Bedrock region: {region}")
+            trace.attributes.update(s3_uri=s3_uri, lane=lane, region=region)
+            embedding = call_with_bedrock_slot(pool, lane, get_embedding_from_marengo, media_type, s3_uri, bucket_name, region)
+            index_embedding(opensearch_client, media_type, bucket_name, object_key, embedding, receive_count)
+            trace.attributes['outcome'] = 'completed'
+            
+        except Exception as file_error:
+            error_msg = str(file_error)
+            error_class = classify_error(file_error)
+            trace.attributes['outcome'] = error_class
+            if error_class != 'throttle':
+                failure_count += 1
+            print(f"Error processing file {s3_uri} ({error_class}, receive #{receive_count}, failure #{failure_count}): {error_msg}")
+            if error_class != 'throttle':
+                import traceback
+                print(f"Traceback: {traceback.format_exc()}")
+            
+            if error_class == 'permanent' or failure_budget_exhausted(failure_count, redrive_count):
+                # 永久错误或重试预算耗尽：直接转入DLQ，不再重试
+                send_to_dlq(sqs_record, error_msg, error_class)
+                update_embedding_status(
+                    s3_uri, 'failed', retry_count=receive_count, error_msg=error_msg, failure_count=failure_count,
+                    redrive_count=redrive_count, error_class=error_class
+                )
+                update_asset_catalog(s3_uri, 'failed', retry_count=receive_count, error_msg=error_msg)
+            else:
+                # 可重试错误：按错误类型设置该消息自己的退避时间
+                delay = backoff_delay(error_class, receive_count, failure_count)
+                update_embedding_status(
+                    s3_uri, 'retrying', retry_count=receive_count, error_msg=error_msg, failure_count=failure_count,
+                    redrive_count=redrive_count
+                )
+                update_asset_catalog(s3_uri, 'retrying', retry_count=receive_count, error_msg=error_msg)
+                defer_message(sqs_record, delay)
+                batch_item_failures.append({'itemIdentifier': sqs_record['messageId']})
+            break
+
+def parse_s3_records(message_body):
+    """
+    解析SQS消息体中的S3事件记录
+    EventBridge路由的"Object Created"事件转换为S3通知记录格式，兼容旧消息
+    """
+    message = json.loads(message_body)
+    if message.get('source') != 'aws.s3':
+        return message.get('Records', [])
     
-    # 创建OpenSearch客户端
-    client = OpenSearch(
-        hosts=[{'host': host, 'port': 443}],
-        http_auth=auth,
-        use_ssl=True,
-        verify_certs=True,
-        connection_class=RequestsHttpConnection,
-        pool_maxsize=20
+    detail = message['detail']
+    return [{
+        'eventName': message.get('detail-type'),
+        'eventTime': message.get('time'),
+        's3': {
+            'bucket': {'name': detail['bucket']['name']},
+            'object': {'key': detail['object']['key'], 'size': detail['object'].get('size')}
+        }
+    }]
+
+def ingest_lane(file_ext, size):
+    """按媒体类型和大小确定摄取通道（与CDK中EventBridge规则一致）"""
+    if file_ext in IMAGE_EXTENSIONS:
+        return 'image'
+    return 'media-small' if (size or 0) < SMALL_MEDIA_MAX_BYTES else 'media-large'
+
+def classify_error(error):
+    """错误分类：throttle（限流，退避但不消耗重试预算）、permanent（直接进DLQ）、transient（有限次数退避重试）"""
+    if isinstance(error, ConcurrencyLimitExceeded) or is_throttling_error(error):
+        return 'throttle'
+    error_code = getattr(error, 'response', {}).get('Error', {}).get('Code', '')
+    if error_code in PERMANENT_ERROR_CODES or any(code in str(error) for code in PERMANENT_ERROR_CODES):
+        return 'permanent'
+    if isinstance(error, ValueError) and 'Unsupported' in str(error):
+        return 'permanent'
+    return 'transient'
+
+def backoff_delay(error_class, receive_count, failure_count):
+    """指数退避 + full jitter：在[1, min(上限, 基数 * 2^n)]秒内均匀取值"""
+    if error_class == 'throttle':
+        ceiling = THROTTLE_BACKOFF_BASE * 2 ** min(receive_count - 1, 10)
+    else:
+        ceiling = TRANSIENT_BACKOFF_BASE * 2 ** min(failure_count - 1, 10)
+    return int(random.uniform(1, min(MAX_BACKOFF, ceiling)))
+
+def queue_url_from_arn(queue_arn):
+    """arn:aws:sqs:region:account:name -> 队列URL"""
+    _, _, _, region, account_id, queue_name = queue_arn.split(':')
+    return f"https://sqs.{region}.amazonaws.com/{account_id}/{queue_name}"
+
+def defer_message(sqs_record, delay):
+    """设置该消息的可见性超时，使其在delay秒后重新投递"""
+    try:
+        sqs_client.change_message_visibility(
+            QueueUrl=queue_url_from_arn(sqs_record['eventSourceARN']),
+            ReceiptHandle=sqs_record['receiptHandle'],
+            VisibilityTimeout=delay
+        )
+        print(f"Message {sqs_record['messageId']} will be retried in {delay}s")
+    except Exception as e:
+        # 失败时消息按队列默认可见性超时重新投递
+        print(f"Failed to change message visibility: {str(e)}")
+
+def send_to_dlq(sqs_record, error_msg, error_class):
+    """把消息直接转入DLQ（原消息随后作为成功处理被删除）"""
+    if not EMBEDDING_DLQ_URL:
+        print("EMBEDDING_DLQ_URL not set, dropping failed message")
+        return
+    sqs_client.send_message(
+        QueueUrl=EMBEDDING_DLQ_URL,
+        MessageBody=sqs_record['body'],
+        MessageAttributes={
+            'error_class': {'DataType': 'String', 'StringValue': error_class},
+            'error': {'DataType': 'String', 'StringValue': error_msg[:1000] or 'unknown'}
+        }
     )
-    return client
+    print(f"Moved message {sqs_record['messageId']} to DLQ ({error_class})")
+
+def object_exists(bucket_name, object_key):
+    """对象是否仍然存在；只有明确的404才视为已删除，其他错误交给后续处理重试"""
+    try:
+        s3_client.head_object(Bucket=bucket_name, Key=object_key)
+        return True
+    except Exception as e:
+        error_code = getattr(e, 'response', {}).get('Error', {}).get('Code', '')
+        return error_code not in ('404', 'NoSuchKey', 'NotFound')
+
+def get_failure_counts(s3_uri):
+    """读取该文件非限流错误的累计失败次数和DLQ重投次数"""
+    try:
+        table = dynamodb.Table(STATUS_TABLE_NAME)
+        item = table.get_item(Key={'s3_uri': s3_uri}, ProjectionExpression='failure_count, redrive_count').get('Item') or {}
+        return int(item.get('failure_count', 0)), int(item.get('redrive_count', 0))
+    except Exception as e:
+        print(f"Failed to read failure count for {s3_uri}: {str(e)}")
+        return 0, 0
+
+def failure_budget_exhausted(failure_count, redrive_count):
+    """failure_count跨重投累计不清零，每次DLQ重投增加一份MAX_FAILURE_ATTEMPTS的预算"""
+    return failure_count >= MAX_FAILURE_ATTEMPTS * (redrive_count + 1)
 
 def create_index_if_not_exists(client):
-    """创建索引（如果不存在）"""
-    if not client.indices.exists(OPENSEARCH_INDEX):
-        index_body = {
-            'settings': {
-                'index': {
-                    'knn': True,
-                    "mapping.total_fields.limit": 5000
-                }
-            },
-            'mappings': {
-                'properties': {
-                    'visual_embedding': {
-                        'type': 'knn_vector',
-                        'dimension': VECTOR_DIMENSION
-                    },
-                    'text_embedding': {
-                        'type': 'knn_vector',
-                        'dimension': VECTOR_DIMENSION
-                    },
-                    'audio_embedding': {
-                        'type': 'knn_vector',
-                        'dimension': VECTOR_DIMENSION
-                    },
-                    's3_uri': {'type': 'keyword'},
-                    'media_type': {'type': 'keyword'},
-                    'file_type': {'type': 'keyword'},
-                    'timestamp': {'type': 'date'},
-                    'segment_index': {'type': 'integer'},
-                    'start_time': {'type': 'float'},
-                    'end_time': {'type': 'float'},
-                    'duration': {'type': 'float'}
-                }
-            }
-        }
-        client.indices.create(OPENSEARCH_INDEX, body=index_body)
-        print(f"Created index: {OPENSEARCH_INDEX}")
+    """创建索引（如果不存在），物理索引通过别名OPENSEARCH_INDEX读写"""
+    if not index_exists(client, OPENSEARCH_INDEX):
+        index_body = build_index_body(alias=OPENSEARCH_INDEX)
+        # 固定的首个版本名，并发创建时只有一个成功
+        physical_index = f"{OPENSEARCH_INDEX}-v1"
+        try:
+            client.indices.create(physical_index, body=index_body)
+            print(f"Created index: {physical_index} (alias: {OPENSEARCH_INDEX})")
+        except Exception as e:
+            if 'resource_already_exists' not in str(e).lower():
+                raise e
 
-def get_embedding_from_marengo(media_type, s3_uri, bucket_name):
+def call_with_bedrock_slot(pool, lane, func, *args):
+    """在AIMD控制器分配给该通道的名额内调用Bedrock，结束后按是否被限流反馈给控制器"""
+    with span('bedrock.slot_wait', pool=pool, lane=lane):
+        lease_id = acquire_bedrock_slot(pool, lane, SLOT_WAIT_SECONDS)
+    throttled = False
+    try:
+        return func(*args)
+    except Exception as e:
+        throttled = is_throttling_error(e)
+        raise
+    finally:
+        release_bedrock_slot(pool, lane, lease_id, throttled)
+
+bedrock_router = BedrockRegionRouter(HOME_REGION, os.environ.get('UPLOAD_BUCKET'), BEDROCK_REGIONS)
+
+def get_embedding_from_marengo(media_type, s3_uri, bucket_name, region=HOME_REGION):
     """
     使用 Twelvelabs Marengo 模型获取嵌入向量
+    region为远端区域时，输入先复制到该区域的中转桶，输出也写入该中转桶
     """
+    staged_key = None
     try:
         # 获取账户ID作为bucket owner
-        sts_client = boto3.client('sts')
-        account_id = sts_client.get_caller_identity()['Account']
+        account_id = get_account_id()
+        
+        regional_bedrock = bedrock_router.client('bedrock-runtime', region)
+        input_uri = s3_uri
+        if region != HOME_REGION:
+            staged_key, input_uri = bedrock_router.stage_input(region, s3_uri)
+            bucket_name = bedrock_router.output_bucket(region)
         
         # 为输出结果生成一个唯一的S3路径
         output_key = f"bedrock-outputs/{uuid.uuid4()}/result.json"
@@ -208,7 +377,7 @@ def get_embedding_from_marengo(media_type, s3_uri, bucket_name):
                 "inputType": "image",
                 "mediaSource": {
                     "s3Location": {
-                        "uri": s3_uri,
+                        "uri": input_uri,
                         "bucketOwner": account_id
                     }
                 }
@@ -218,7 +387,7 @@ def get_embedding_from_marengo(media_type, s3_uri, bucket_name):
                 "inputType": "video",
                 "mediaSource": {
                     "s3Location": {
-                        "uri": s3_uri,
+                        "uri": input_uri,
                         "bucketOwner": account_id
                     }
                 }
@@ -229,7 +398,7 @@ def get_embedding_from_marengo(media_type, s3_uri, bucket_name):
                 "inputType": "audio",
                 "mediaSource": {
                     "s3Location": {
-                        "uri": s3_uri,
+                        "uri": input_uri,
                         "bucketOwner": account_id
                     }
                 }
@@ -247,7 +416,7 @@ def get_embedding_from_marengo(media_type, s3_uri, bucket_name):
         print(f"Starting async invoke with output to: {output_s3_uri}")
         
         # 发起异步调用
-        start_resp = bedrock_client.start_async_invoke(
+        start_resp = regional_bedrock.start_async_invoke(
             modelId=MARENG0_MODEL_ID,
             modelInput=model_input,
             outputDataConfig=output_data_config
@@ -255,46 +424,22 @@ def get_embedding_from_marengo(media_type, s3_uri, bucket_name):
             
         invocation_arn = start_resp["invocationArn"]
         print("Invocation ARN:", invocation_arn)
+        # 记录调用ARN，Lambda中途超时后清理任务可直接从输出恢复
+        record_invocation(s3_uri, invocation_arn)
         
-        # 轮询结果
+        # 轮询结果（开始轮询到输出就绪记为marengo.wait阶段）
         max_attempts = 60  # 最多等待5分钟
         attempt = 0
+        started = time.perf_counter()
         
         while attempt < max_attempts:
             try:
-                res = bedrock_client.get_async_invoke(invocationArn=invocation_arn)
+                res = regional_bedrock.get_async_invoke(invocationArn=invocation_arn)
                 print(f"Status (attempt {attempt + 1}): {res['status']}")
                 
                 if res["status"] == "Completed":
-                    # 从实际输出路径读取结果
-                    if "outputDataConfig" in res and "s3OutputDataConfig" in res["outputDataConfig"]:
-                        actual_output_s3_uri = res["outputDataConfig"]["s3OutputDataConfig"]["s3Uri"]
-                        print(f"Using actual output S3 URI: {actual_output_s3_uri}")
-
-                        alt_bucket, alt_prefix = extract_s3_uri(actual_output_s3_uri)
-                        output_key = alt_prefix + "/output.json" if alt_prefix else "output.json"
-
-                        try:
-                            output_resp = s3_client.get_object(Bucket=alt_bucket, Key=output_key)
-                            output_json = json.loads(output_resp["Body"].read().decode("utf-8"))
-                            print("output_json", output_json)
-                            # 处理不同媒体类型的embedding
-                            if media_type == "video":
-                                # 视频文件：返回所有时间段的embedding数据
-                                return output_json["data"]
-                            elif media_type == "audio":
-                                # 音频文件：返回所有时间段的embedding数据
-                                return output_json["data"]
-                            elif media_type == "image":
-                                # 图片文件：只有一个embedding
-                                return output_json["data"]
-                            elif media_type == "text":
-                                # 文本：只有一个embedding
-                                return output_json["data"]
-                            return output_json["data"]
-                        except Exception as s3_error:
-                            print(f"Failed to read output.json from path: {output_key}")
-                            raise s3_error
+                    record_span('marengo.wait', started, region=region, attempts=attempt + 1)
+                    return read_async_invoke_output(res, bedrock_router.client('s3', region))
                         
                 elif res["status"] in ("Failed", "Cancelled"):
                     error_msg = res.get("failureMessage", "Unknown error")
@@ -316,6 +461,39 @@ def get_embedding_from_marengo(media_type, s3_uri, bucket_name):
     except Exception as e:
         print(f"Error in get_embedding_from_marengo: {str(e)}")
         raise e
+    finally:
+        if staged_key:
+            bedrock_router.delete_staged_input(region, staged_key)
+
+def read_async_invoke_output(res, output_s3_client=None):
+    """从已完成的异步调用的实际输出路径读取embedding数据（远端区域的输出使用该区域的S3客户端）"""
+    output_s3_client = output_s3_client or s3_client
+    actual_output_s3_uri = res["outputDataConfig"]["s3OutputDataConfig"]["s3Uri"]
+    print(f"Using actual output S3 URI: {actual_output_s3_uri}")
+    
+    alt_bucket, alt_prefix = extract_s3_uri(actual_output_s3_uri)
+    output_key = alt_prefix + "/output.json" if alt_prefix else "output.json"
+    
+    try:
+        output_resp = output_s3_client.get_object(Bucket=alt_bucket, Key=output_key)
+    except Exception as s3_error:
+        print(f"Failed to read output.json from path: {output_key}")
+        raise s3_error
+    output_json = json.loads(output_resp["Body"].read().decode("utf-8"))
+    # 图片只有一个embedding，音视频为各时间段的embedding
+    return output_json["data"]
+
+def record_invocation(s3_uri, invocation_arn):
+    """在状态记录上保存Bedrock异步调用ARN"""
+    try:
+        dynamodb.Table(STATUS_TABLE_NAME).update_item(
+            Key={'s3_uri': s3_uri},
+            UpdateExpression="SET invocation_arn = :arn",
+            ConditionExpression="attribute_exists(s3_uri)",
+            ExpressionAttributeValues={':arn': invocation_arn}
+        )
+    except Exception as e:
+        print(f"Failed to record invocation for {s3_uri}: {str(e)}")
 
 def extract_s3_uri(s3_uri):
     """
@@ -384,9 +562,11 @@ def store_embedding(client, media_type, s3_uri, embedding_data, file_type):
     print(f"Stored {len(responses)} embedding segments for {s3_uri}")
     return responses
 
-def update_embedding_status(s3_uri, status, retry_count=0, error_msg=None, clear_error=False):
+def update_embedding_status(s3_uri, status, retry_count=0, error_msg=None, clear_error=False, failure_count=0, size=None,
+                            redrive_count=0, error_class=None):
     """
     更新embedding状态到DynamoDB
+    redrive_count由DLQ重投Lambda递增，整条写入时需带上以免丢失；error_class记录转入DLQ时的错误类型
     """
     try:
         table = dynamodb.Table(STATUS_TABLE_NAME)
@@ -396,8 +576,18 @@ def update_embedding_status(s3_uri, status, retry_count=0, error_msg=None, clear
             's3_uri': s3_uri,
             'status': status,
             'retry_count': retry_count,
+            'failure_count': failure_count,
             'last_updated': datetime.now().isoformat()
         }
+        if status in ACTIVE_STATUSES:
+            # 稀疏索引键：终态记录不带该属性，不会出现在索引中
+            item['active_status'] = status
+        if size is not None:
+            item['size'] = size
+        if redrive_count:
+            item['redrive_count'] = redrive_count
+        if error_class:
+            item['last_error_class'] = error_class
         
         if clear_error:
             item['last_error'] = None
@@ -411,4 +601,456 @@ def update_embedding_status(s3_uri, status, retry_count=0, error_msg=None, clear
         
     except Exception as e:
         print(f"Failed to update status for {s3_uri}: {str(e)}")
-        # 不抛出异常，避免影响主流程
\ No newline at end of file
+        # 不抛出异常，避免影响主流程
+
+def index_embedding(opensearch_client, media_type, bucket_name, object_key, embedding, retry_count):
+    """写入向量、生成衍生文件，并把状态和素材目录更新为已完成"""
+    s3_uri = f"s3://{bucket_name}/{object_key}"
+    file_ext = object_key.split('.')[-1].lower()
+    store_embedding(opensearch_client, media_type, s3_uri, embedding, file_ext)
+    if media_type == 'video':
+        # 视频转码和关键帧探测耗时与时长相关，交给衍生文件Lambda异步完成后再写入目录
+        schedule_derivatives(bucket_name, object_key, media_type)
+        derivatives = None
+    else:
+        derivatives = generate_derivatives(bucket_name, object_key, media_type)
+    
+    print(f"SUCCESS: Completed processing {s3_uri}")
+    update_embedding_status(s3_uri, 'completed', clear_error=True)
+    update_asset_catalog(
+        s3_uri, 'completed', retry_count=retry_count, clear_error=True,
+        segment_counts=count_segments(media_type, embedding),
+        derivatives=derivatives
+    )
+
+def media_type_for_extension(file_ext):
+    """文件扩展名对应的媒体类型"""
+    if file_ext in IMAGE_EXTENSIONS:
+        return 'image'
+    return 'video' if file_ext in ['mp4', 'mov'] else 'audio'
+
+def sweep_stale_jobs(context):
+    """
+    定时清理卡住的任务：状态停留在processing/retrying超过STALE_AFTER_SECONDS的记录
+    Bedrock调用仍在运行则等待下一轮；已完成则直接从输出恢复建索引；否则重新入队
+    """
+    from boto3.dynamodb.conditions import Key
+    
+    table = dynamodb.Table(STATUS_TABLE_NAME)
+    cutoff = (datetime.now() - timedelta(seconds=STALE_AFTER_SECONDS)).isoformat()
+    summary = {'resumed': 0, 'requeued': 0, 'waiting': 0, 'failed': 0, 'skipped': 0, 'errors': 0}
+    opensearch_client = None
+    
+    for status in ACTIVE_STATUSES:
+        query_kwargs = {
+            'IndexName': ACTIVE_STATUS_INDEX,
+            'KeyConditionExpression': Key('active_status').eq(status) & Key('last_updated').lt(cutoff)
+        }
+        while True:
+            response = table.query(**query_kwargs)
+            for item in response.get('Items', []):
+                if context.get_remaining_time_in_millis() < SWEEP_MIN_REMAINING_MS:
+                    print(f"Sweep stopped early (time budget): {summary}")
+                    return summary
+                try:
+                    if opensearch_client is None and item.get('invocation_arn'):
+                        opensearch_client = get_opensearch_client()
+                    summary[heal_stale_job(item, opensearch_client)] += 1
+                except Exception as e:
+                    print(f"Failed to heal stale job {item['s3_uri']}: {str(e)}")
+                    summary['errors'] += 1
+            if 'LastEvaluatedKey' not in response:
+                break
+            query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    
+    print(f"Sweep completed: {summary}")
+    return summary
+
+def heal_stale_job(item, opensearch_client):
+    """处理单条卡住的记录，返回处理结果"""
+    s3_uri = item['s3_uri']
+    bucket_name, object_key = extract_s3_uri(s3_uri)
+    media_type = media_type_for_extension(object_key.split('.')[-1].lower())
+    retry_count = int(item.get('retry_count', 0))
+    failure_count = int(item.get('failure_count', 0))
+    redrive_count = int(item.get('redrive_count', 0))
+    
+    invocation = None
+    if item.get('invocation_arn'):
+        try:
+            invocation_region = region_from_arn(item['invocation_arn'])
+            invocation = bedrock_router.client('bedrock-runtime', invocation_region).get_async_invoke(
+                invocationArn=item['invocation_arn']
+            )
+        except Exception as e:
+            print(f"Failed to get invocation for {s3_uri}: {str(e)}")
+    if invocation and invocation['status'] == 'InProgress':
+        print(f"Bedrock invocation still running for {s3_uri}, checking again next sweep")
+        return 'waiting'
+    
+    # 条件更新last_updated认领记录，避免与正常重试或并发清理重复处理
+    if not claim_stale_job(item):
+        return 'skipped'
+    
+    if invocation and invocation['status'] == 'Completed':
+        print(f"Resuming indexing from completed invocation for {s3_uri}")
+        embedding = read_async_invoke_output(invocation, bedrock_router.client('s3', invocation_region))
+        create_index_if_not_exists(opensearch_client)
+        index_embedding(opensearch_client, media_type, bucket_name, object_key, embedding, retry_count)
+        return 'resumed'
+    
+    # 卡住一次计入非限流重试预算
+    failure_count += 1
+    error_msg = f"Stale {item['status']} job since {item['last_updated']}"
+    if failure_budget_exhausted(failure_count, redrive_count):
+        update_embedding_status(
+            s3_uri, 'failed', retry_count=retry_count, error_msg=error_msg, failure_count=failure_count,
+            redrive_count=redrive_count
+        )
+        update_asset_catalog(s3_uri, 'failed', retry_count=retry_count, error_msg=error_msg)
+        return 'failed'
+    
+    if item.get('size') is not None:
+        size = int(item['size'])
+    else:
+        try:
+            size = s3_client.head_object(Bucket=bucket_name, Key=object_key)['ContentLength']
+        except Exception as e:
+            # 源文件已被删除，不再重试
+            print(f"Source object unavailable for {s3_uri}: {str(e)}")
+            update_embedding_status(
+                s3_uri, 'failed', retry_count=retry_count, error_msg=str(e), failure_count=failure_count,
+                redrive_count=redrive_count, error_class='permanent'
+            )
+            update_asset_catalog(s3_uri, 'failed', retry_count=retry_count, error_msg=str(e))
+            return 'failed'
+    requeue_object(bucket_name, object_key, size)
+    update_embedding_status(
+        s3_uri, 'retrying', retry_count=retry_count, error_msg=error_msg,
+        failure_count=failure_count, size=size, redrive_count=redrive_count
+    )
+    update_asset_catalog(s3_uri, 'retrying', retry_count=retry_count, error_msg=error_msg)
+    return 'requeued'
+
+def claim_stale_job(item):
+    """仅当记录在查询后未被更新时刷新last_updated，返回是否认领成功"""
+    try:
+        dynamodb.Table(STATUS_TABLE_NAME).update_item(
+            Key={'s3_uri': item['s3_uri']},
+            UpdateExpression="SET last_updated = :now",
+            ConditionExpression="last_updated = :seen",
+            ExpressionAttributeValues={':now': datetime.now().isoformat(), ':seen': item['last_updated']}
+        )
+        return True
+    except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+        return False
+
+def requeue_object(bucket_name, object_key, size):
+    """以S3通知格式把对象重新投递到对应的摄取通道队列"""
+    lane = ingest_lane(object_key.split('.')[-1].lower(), size)
+    sqs_client.send_message(
+        QueueUrl=EMBEDDING_QUEUE_URLS[lane],
+        MessageBody=json.dumps({'Records': [{
+            'eventName': 'ObjectCreated:Requeue',
+            'eventTime': datetime.now().isoformat(),
+            's3': {'bucket': {'name': bucket_name}, 'object': {'key': object_key, 'size': size}}
+        }]})
+    )
+    print(f"Re-enqueued s3://{bucket_name}/{object_key} to {lane} lane")
+
+def count_segments(media_type, embedding_data):
+    """
+    统计各embedding类型的分段数量（与store_embedding的字段映射保持一致）
+    """
+    segment_counts = {'visual': 0, 'text': 0, 'audio': 0}
+    
+    for item in embedding_data:
+        if media_type == "video":
+            embedding_option = item.get('embeddingOption')
+            if embedding_option == 'visual-image':
+                segment_counts['visual'] += 1
+            elif embedding_option == 'visual-text':
+                segment_counts['text'] += 1
+            elif embedding_option == 'audio':
+                segment_counts['audio'] += 1
+        elif media_type == "audio":
+            segment_counts['audio'] += 1
+        elif media_type == "image":
+            segment_counts['visual'] += 1
+        elif media_type == "text":
+            segment_counts['text'] += 1
+    
+    return segment_counts
+
+def get_ffmpeg_path():
+    """查找ffmpeg（可放在Layer的bin目录，即/opt/bin），不可用时返回None"""
+    return os.environ.get('FFMPEG_PATH') or shutil.which('ffmpeg') or (
+        '/opt/bin/ffmpeg' if os.path.exists('/opt/bin/ffmpeg') else None
+    )
+
+def schedule_derivatives(bucket_name, object_key, media_type):
+    """异步调用衍生文件Lambda；失败只记录日志，不影响embedding结果"""
+    if not DERIVATIVES_FUNCTION_NAME:
+        print(f"DERIVATIVES_FUNCTION_NAME not set, skipping derivatives for {object_key}")
+        return
+    try:
+        lambda_client.invoke(
+            FunctionName=DERIVATIVES_FUNCTION_NAME,
+            InvocationType='Event',
+            Payload=json.dumps({'bucket': bucket_name, 'key': object_key, 'media_type': media_type})
+        )
+        print(f"Scheduled derivatives for {object_key}")
+    except Exception as e:
+        print(f"Failed to schedule derivatives for {object_key}: {str(e)}")
+
+def derivatives_handler(event, context):
+    """
+    衍生文件Lambda（与embedding共用代码包）：生成视频封面、预览和关键帧索引，完成后写入素材目录
+    """
+    bucket_name, object_key = event['bucket'], event['key']
+    derivatives = generate_derivatives(bucket_name, object_key, event['media_type'], context)
+    if derivatives:
+        update_catalog_derivatives(object_key, derivatives)
+    return derivatives
+
+def update_catalog_derivatives(object_key, derivatives):
+    """只更新素材目录的衍生文件字段；目录记录已被删除（如清库）时不重新创建"""
+    try:
+        dynamodb.Table(CATALOG_TABLE_NAME).update_item(
+            Key={'asset_key': object_key},
+            UpdateExpression="SET derivatives = :derivatives, updated_at = :updated_at",
+            ConditionExpression="attribute_exists(asset_key)",
+            ExpressionAttributeValues={
+                ':derivatives': derivatives,
+                ':updated_at': datetime.now().isoformat()
+            }
+        )
+        print(f"Updated catalog derivatives for {object_key}")
+    except Exception as e:
+        print(f"Failed to update catalog derivatives for {object_key}: {str(e)}")
+
+def ffmpeg_step_timeout(context):
+    """
+    本次调用剩余时间内一步ffmpeg/ffprobe可用的超时（秒）；
+    剩余时间不足FFMPEG_MIN_SECONDS时返回None，调用方跳过该步
+    """
+    if context is None:
+        return FFMPEG_TIMEOUT
+    available = (context.get_remaining_time_in_millis() - DERIVATIVES_TIME_MARGIN_MS) / 1000
+    if available < FFMPEG_MIN_SECONDS:
+        return None
+    return min(FFMPEG_TIMEOUT, available)
+
+def extract_poster(ffmpeg, source_url, poster_path, timeout):
+    """截取第1秒的帧作为封面；不足1秒的视频在该位置没有帧，回退到第0秒"""
+    for offset in ('1', '0'):
+        try:
+            subprocess.run(
+                [ffmpeg, '-y', '-ss', offset, '-i', source_url, '-frames:v', '1',
+                 '-vf', f"scale='min({THUMBNAIL_SIZE},iw)':-2", '-q:v', '4', poster_path],
+                check=True, capture_output=True, timeout=timeout
+            )
+        except subprocess.CalledProcessError as e:
+            print(f"Poster extraction at {offset}s failed: {(e.stderr or b'').decode('utf-8', 'replace')[-300:]}")
+            continue
+        if os.path.exists(poster_path) and os.path.getsize(poster_path) > 0:
+            return True
+    return False
+
+def upload_poster(ffmpeg, source_url, bucket_name, base_key, timeout):
+    """截取封面帧并上传，返回对象键；截取失败时返回None"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        poster_path = os.path.join(work_dir, 'poster.jpg')
+        if not extract_poster(ffmpeg, source_url, poster_path, timeout):
+            return None
+        poster_key = f"{base_key}/poster.jpg"
+        s3_client.upload_file(poster_path, bucket_name, poster_key, ExtraArgs={'ContentType': 'image/jpeg'})
+        return poster_key
+
+def upload_preview(ffmpeg, source_url, bucket_name, base_key, timeout):
+    """转码前PREVIEW_MAX_SECONDS秒的低码率无声预览并上传，返回对象键"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        preview_path = os.path.join(work_dir, 'preview.mp4')
+        subprocess.run(
+            [ffmpeg, '-y', '-i', source_url, '-t', str(PREVIEW_MAX_SECONDS),
+             '-vf', "scale=-2:'min(360,ih)'", '-c:v', 'libx264', '-preset', 'veryfast',
+             '-b:v', '400k', '-an', '-movflags', '+faststart', preview_path],
+            check=True, capture_output=True, timeout=timeout
+        )
+        preview_key = f"{base_key}/preview.mp4"
+        s3_client.upload_file(preview_path, bucket_name, preview_key, ExtraArgs={'ContentType': 'video/mp4'})
+        return preview_key
+
+def run_derivative_step(name, object_key, step, *args):
+    """执行一个衍生文件步骤，失败（ffmpeg报错、超时、上传失败）只记录日志并返回None"""
+    try:
+        return step(*args)
+    except subprocess.CalledProcessError as e:
+        print(f"Failed to generate {name} for {object_key}: {(e.stderr or b'').decode('utf-8', 'replace')[-300:]}")
+    except Exception as e:
+        print(f"Failed to generate {name} for {object_key}: {str(e)}")
+    return None
+
+def generate_derivatives(bucket_name, object_key, media_type, context=None):
+    """
+    生成结果展示用的衍生文件，存放在 derivatives/{object_key}/ 下
+    图片: WebP缩略图（需要Pillow）；视频: 封面帧、低码率预览和关键帧索引（需要ffmpeg，在衍生文件Lambda中执行）
+    传入context时每步ffmpeg前检查剩余时间，不足时跳过后续步骤；单个步骤失败只跳过该衍生文件
+    失败不影响embedding结果，返回 {类型: 对象键}
+    """
+    derivatives = {}
+    base_key = f"{DERIVATIVES_PREFIX}{object_key}"
+    
+    try:
+        if media_type == 'image':
+            try:
+                from PIL import Image, ImageOps
+            except ImportError:
+                print("Pillow not available, skipping image thumbnail")
+                return derivatives
+            
+            response = s3_client.get_object(Bucket=bucket_name, Key=object_key)
+            image = ImageOps.exif_transpose(Image.open(io.BytesIO(response['Body'].read())))
+            image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+            
+            buffer = io.BytesIO()
+            image.save(buffer, format='WEBP', quality=80)
+            thumbnail_key = f"{base_key}/thumbnail.webp"
+            s3_client.put_object(Bucket=bucket_name, Key=thumbnail_key, Body=buffer.getvalue(), ContentType='image/webp')
+            derivatives['thumbnail'] = thumbnail_key
+            
+        elif media_type == 'video':
+            ffmpeg = get_ffmpeg_path()
+            if not ffmpeg:
+                print("ffmpeg not available, skipping video poster and preview")
+                return derivatives
+            
+            # ffmpeg通过预签名URL按需读取，不需要把整个视频下载到/tmp
+            source_url = s3_client.generate_presigned_url(
+                'get_object',
+                Params={'Bucket': bucket_name, 'Key': object_key},
+                ExpiresIn=900
+            )
+            # 每一步单独捕获异常，一个衍生文件失败不影响其余步骤
+            for name, step in (('poster', upload_poster), ('preview', upload_preview), ('keyframes', build_keyframe_index)):
+                timeout = ffmpeg_step_timeout(context)
+                if not timeout:
+                    print(f"Time budget exhausted, partial derivatives for {object_key}: {sorted(derivatives)}")
+                    break
+                derivative_key = run_derivative_step(name, object_key, step, ffmpeg, source_url, bucket_name, base_key, timeout)
+                if derivative_key:
+                    derivatives[name] = derivative_key
+        
+        if derivatives:
+            print(f"Generated derivatives for {object_key}: {derivatives}")
+        
+    except Exception as e:
+        print(f"Failed to generate derivatives for {object_key}: {str(e)}")
+        # 不抛出异常，避免影响主流程
+    
+    return derivatives
+
+def build_keyframe_index(ffmpeg, source_url, bucket_name, base_key, timeout=FFMPEG_TIMEOUT):
+    """
+    用ffprobe生成视频关键帧索引（时间和字节偏移），供搜索API的片段接口返回Range提示
+    索引格式: {"size": 文件字节数, "duration": 秒, "keyframes": [[时间, 字节偏移], ...]}
+    """
+    ffprobe = os.path.join(os.path.dirname(ffmpeg), 'ffprobe')
+    if not os.path.exists(ffprobe):
+        ffprobe = shutil.which('ffprobe')
+    if not ffprobe:
+        print("ffprobe not available, skipping keyframe index")
+        return None
+    
+    result = subprocess.run(
+        [ffprobe, '-v', 'error', '-select_streams', 'v:0',
+         '-show_entries', 'packet=pts_time,pos,flags:format=size,duration',
+         '-of', 'json', source_url],
+        check=True, capture_output=True, timeout=timeout
+    )
+    probe = json.loads(result.stdout)
+    
+    keyframes = [
+        [round(float(packet['pts_time']), 3), int(packet['pos'])]
+        for packet in probe.get('packets', [])
+        if 'K' in packet.get('flags', '') and packet.get('pts_time') not in (None, 'N/A') and packet.get('pos') not in (None, 'N/A')
+    ]
+    keyframes.sort()
+    index = {
+        'size': int(probe.get('format', {}).get('size', 0)),
+        'duration': float(probe.get('format', {}).get('duration', 0)),
+        'keyframes': keyframes
+    }
+    
+    keyframes_key = f"{base_key}/keyframes.json"
+    s3_client.put_object(
+        Bucket=bucket_name,
+        Key=keyframes_key,
+        Body=json.dumps(index, separators=(',', ':')),
+        ContentType='application/json'
+    )
+    print(f"Built keyframe index with {len(keyframes)} keyframes: {keyframes_key}")
+    return keyframes_key
+
+def update_asset_catalog(s3_uri, status, retry_count=0, error_msg=None, clear_error=False,
+                         size=None, last_modified=None, segment_counts=None, derivatives=None):
+    """
+    增量更新素材目录表（/api/materials直接查询该表，无需逐个文件查询OpenSearch）
+    """
+    try:
+        table = dynamodb.Table(CATALOG_TABLE_NAME)
+        _, object_key = extract_s3_uri(s3_uri)
+        file_ext = object_key.split('.')[-1].lower()
+        now = datetime.now().isoformat()
+        
+        # 只SET传入的字段，避免覆盖上传时写入的大小和时间
+        update_expression = (
+            "SET #status = :status, retry_count = :retry_count, updated_at = :updated_at, "
+            "s3_uri = :s3_uri, catalog_pk = :catalog_pk, file_type = :file_type, "
+            "last_modified = if_not_exists(last_modified, :now)"
+        )
+        expression_attribute_names = {"#status": "status"}
+        expression_attribute_values = {
+            ":status": status,
+            ":retry_count": retry_count,
+            ":updated_at": now,
+            ":s3_uri": s3_uri,
+            ":catalog_pk": CATALOG_PARTITION,
+            ":file_type": file_ext,
+            ":now": utc_timestamp(last_modified)
+        }
+        
+        if size is not None:
+            update_expression += ", #size = :size"
+            expression_attribute_names["#size"] = "size"
+            expression_attribute_values[":size"] = size
+            
+        if segment_counts is not None:
+            update_expression += ", segment_counts = :segment_counts, segment_count = :segment_count"
+            expression_attribute_values[":segment_counts"] = segment_counts
+            expression_attribute_values[":segment_count"] = sum(segment_counts.values())
+        
+        if derivatives:
+            update_expression += ", derivatives = :derivatives"
+            expression_attribute_values[":derivatives"] = derivatives
+        
+        if clear_error:
+            update_expression += " REMOVE last_error, last_error_time"
+        elif error_msg:
+            update_expression += ", last_error = :last_error, last_error_time = :last_error_time"
+            expression_attribute_values[":last_error"] = error_msg[:1000]
+            expression_attribute_values[":last_error_time"] = now
+        
+        table.update_item(
+            Key={'asset_key': object_key},
+            UpdateExpression=update_expression,
+            ExpressionAttributeNames=expression_attribute_names,
+            ExpressionAttributeValues=expression_attribute_values
+        )
+        print(f"Updated catalog for {object_key}: {status}")
+        
+    except Exception as e:
+        print(f"Failed to update catalog for {s3_uri}: {str(e)}")
+        # 不抛出异常，避免影响主流程
@@ -0,0 +1,9 @@
+"""
+素材目录表的共享约定（随opensearch_layer发布，app、embedding和回填脚本共用）
+所有写入方用同一个utc_timestamp生成排序键，保证last_modified格式一致、可按字符串比较
+"""
+from asset_catalog.timestamps import utc_timestamp
+
+__all__ = [
+    'utc_timestamp'
+]
@@ -0,0 +1,16 @@
+from datetime import datetime, timezone
+
+def utc_timestamp(value=None):
+    """
+    目录排序键last_modified统一为UTC ISO-8601毫秒格式（2025-01-25T10:00:00.000Z），
+    上传时间、S3 eventTime和查询范围按同一格式比较；不带时区的时间按UTC处理
+    """
+    if value is None:
+        moment = datetime.now(timezone.utc)
+    elif isinstance(value, datetime):
+        moment = value
+    else:
+        moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
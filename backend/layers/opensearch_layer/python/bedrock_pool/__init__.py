@@ -0,0 +1,37 @@
+"""
+Bedrock调用的共享并发池和多区域路由（随opensearch_layer发布，embedding和search worker共用）
+aimd：DynamoDB中按池保存的AIMD并发上限和按通道登记的租约；
+router：在传输成本可接受的区域中选择并发余量最大的区域，并负责跨区域中转输入
+"""
+from bedrock_pool.aimd import (
+    CONCURRENCY_POOL,
+    SEARCH_LANE,
+    LANE_SHARES,
+    ConcurrencyLimitExceeded,
+    is_throttling_error,
+    get_concurrency_state,
+    lane_limit,
+    try_acquire_bedrock_slot,
+    acquire_bedrock_slot,
+    release_bedrock_slot,
+    pool_max_limit,
+    pool_headroom
+)
+from bedrock_pool.router import BedrockRegionRouter, region_from_arn
+
+__all__ = [
+    'CONCURRENCY_POOL',
+    'SEARCH_LANE',
+    'LANE_SHARES',
+    'ConcurrencyLimitExceeded',
+    'is_throttling_error',
+    'get_concurrency_state',
+    'lane_limit',
+    'try_acquire_bedrock_slot',
+    'acquire_bedrock_slot',
+    'release_bedrock_slot',
+    'pool_max_limit',
+    'pool_headroom',
+    'BedrockRegionRouter',
+    'region_from_arn'
+]
@@ -0,0 +1,221 @@
+import json
+import math
+import os
+import random
+import time
+import uuid
+from decimal import Decimal
+from warm_clients import lazy_resource
+
+dynamodb = lazy_resource('dynamodb')
+
+# AIMD自适应并发控制：embedding各通道和search worker共用同一个marengo池（远端区域为marengo@<region>），
+# 各通道只能占用共享上限的一定份额（LANE_SHARES）
+CONCURRENCY_TABLE_NAME = os.environ.get('CONCURRENCY_TABLE_NAME', 'multimodal-search-concurrency')
+CONCURRENCY_POOL = 'marengo'
+AIMD_INITIAL_LIMIT = 2
+AIMD_MIN_LIMIT = 1
+AIMD_MAX_LIMIT = int(os.environ.get('AIMD_MAX_LIMIT', '20'))  # 本区域Marengo并发配额
+AIMD_DECREASE_COOLDOWN = 30  # 秒，同一轮限流只减半一次
+LEASE_SECONDS = 600  # 租约超过该时间视为持有者已退出
+
+# 摄取通道的份额之和小于1，剩余部分留给交互式搜索（search通道份额为1，可使用全部空闲名额）
+SEARCH_LANE = 'search'
+LANE_SHARES = {
+    'image': float(os.environ.get('IMAGE_LANE_SHARE', '0.4')),
+    'media-small': float(os.environ.get('MEDIA_SMALL_LANE_SHARE', '0.25')),
+    'media-large': float(os.environ.get('MEDIA_LARGE_LANE_SHARE', '0.15')),
+    SEARCH_LANE: 1.0
+}
+
+# 远端区域池的上限取BEDROCK_REGIONS中该区域的maxConcurrency
+REGION_MAX_CONCURRENCY = {
+    config['region']: config.get('maxConcurrency')
+    for config in json.loads(os.environ.get('BEDROCK_REGIONS', '[]'))
+}
+
+class ConcurrencyLimitExceeded(Exception):
+    """自适应并发控制器当前没有空闲的Bedrock调用名额（消息中包含throttl，按限流错误重试）"""
+    pass
+
+def is_throttling_error(error):
+    """判断是否为Bedrock限流/配额错误"""
+    error_msg = str(error).lower()
+    return any(keyword in error_msg for keyword in ['throttl', 'quota', 'too many', 'rate exceeded'])
+
+def get_concurrency_state(pool):
+    """读取（必要时初始化）共享的并发控制状态"""
+    table = dynamodb.Table(CONCURRENCY_TABLE_NAME)
+    item = table.get_item(Key={'pool': pool}, ConsistentRead=True).get('Item')
+    if item:
+        return item
+
+    item = {
+        'pool': pool,
+        'limit': Decimal(str(AIMD_INITIAL_LIMIT)),
+        'leases': {},
+        'lane_leases': {},
+        'last_decrease': 0
+    }
+    try:
+        table.put_item(Item=item, ConditionExpression="attribute_not_exists(pool)")
+        return item
+    except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+        return table.get_item(Key={'pool': pool}, ConsistentRead=True)['Item']
+
+def ensure_lane_leases(pool, state, lane):
+    """租约按通道登记在lane_leases.<lane>下；首次使用该通道时创建空map（两步，DynamoDB不允许同时写父子路径）"""
+    if lane in state.get('lane_leases', {}):
+        return
+    table = dynamodb.Table(CONCURRENCY_TABLE_NAME)
+    table.update_item(
+        Key={'pool': pool},
+        UpdateExpression="SET lane_leases = if_not_exists(lane_leases, :empty)",
+        ExpressionAttributeValues={':empty': {}}
+    )
+    table.update_item(
+        Key={'pool': pool},
+        UpdateExpression="SET lane_leases.#lane = if_not_exists(lane_leases.#lane, :empty)",
+        ExpressionAttributeNames={'#lane': lane},
+        ExpressionAttributeValues={':empty': {}}
+    )
+    state.setdefault('lane_leases', {})[lane] = {}
+
+def reap_expired_leases(pool, state, now):
+    """移除持有者已超时（Lambda中途退出）的租约"""
+    expired = [lease_id for lease_id, expires_at in state.get('leases', {}).items() if expires_at < now]
+    if not expired:
+        return
+
+    lane_of = {
+        lease_id: lane
+        for lane, leases in state.get('lane_leases', {}).items()
+        for lease_id in leases
+    }
+    table = dynamodb.Table(CONCURRENCY_TABLE_NAME)
+    for lease_id in expired:
+        update_expression = "REMOVE leases.#lease"
+        names = {'#lease': lease_id}
+        if lease_id in lane_of:
+            update_expression += ", lane_leases.#lane.#lease"
+            names['#lane'] = lane_of[lease_id]
+        try:
+            table.update_item(
+                Key={'pool': pool},
+                UpdateExpression=update_expression,
+                ConditionExpression="leases.#lease = :expires_at",
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues={':expires_at': state['leases'][lease_id]}
+            )
+            print(f"Reaped expired concurrency lease {lease_id}")
+        except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+            pass
+
+def lane_limit(lane, limit):
+    """通道在共享并发上限中的份额（至少1个名额）"""
+    return max(1, math.ceil(LANE_SHARES.get(lane, 1.0) * limit))
+
+def try_acquire_bedrock_slot(pool, lane, lease_id):
+    """在共享并发上限及该通道份额内尝试登记一个租约，返回(是否成功, 当前上限)；失败时顺带清理过期租约"""
+    table = dynamodb.Table(CONCURRENCY_TABLE_NAME)
+    state = get_concurrency_state(pool)
+    ensure_lane_leases(pool, state, lane)
+    now = int(time.time())
+    limit = max(AIMD_MIN_LIMIT, int(state['limit']))
+    share = lane_limit(lane, limit)
+    try:
+        table.update_item(
+            Key={'pool': pool},
+            UpdateExpression="SET leases.#lease = :expires_at, lane_leases.#lane.#lease = :expires_at",
+            ConditionExpression="size(leases) < :limit AND size(lane_leases.#lane) < :share",
+            ExpressionAttributeNames={'#lease': lease_id, '#lane': lane},
+            ExpressionAttributeValues={':expires_at': now + LEASE_SECONDS, ':limit': limit, ':share': share}
+        )
+        print(f"Acquired Bedrock slot {lease_id} for {lane} ({len(state.get('leases', {})) + 1}/{limit}, lane share {share})")
+        return True, limit
+    except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+        reap_expired_leases(pool, state, now)
+        return False, limit
+
+def acquire_bedrock_slot(pool, lane, wait_seconds):
+    """
+    AIMD控制器：在共享并发上限及该通道份额内获取一个Bedrock调用租约
+    wait_seconds内获取不到时抛出ConcurrencyLimitExceeded，返回租约ID（asyncio调用方用try_acquire_bedrock_slot自行等待）
+    """
+    lease_id = str(uuid.uuid4())
+    deadline = time.time() + wait_seconds
+    delay = 1
+
+    while True:
+        acquired, limit = try_acquire_bedrock_slot(pool, lane, lease_id)
+        if acquired:
+            return lease_id
+
+        if time.time() + delay > deadline:
+            raise ConcurrencyLimitExceeded(f"Bedrock concurrency limit {limit} (lane {lane}) reached, throttled locally")
+        time.sleep(delay + random.uniform(0, delay))
+        delay = min(delay * 2, 10)
+
+def release_bedrock_slot(pool, lane, lease_id, throttled=False):
+    """
+    释放租约并调整共享并发上限：成功时加性增加（每轮约+1），限流时减半（冷却期内只减一次）
+    """
+    table = dynamodb.Table(CONCURRENCY_TABLE_NAME)
+    names = {'#lease': lease_id, '#lane': lane}
+    try:
+        state = get_concurrency_state(pool)
+        now = int(time.time())
+        limit = float(state['limit'])
+
+        if throttled:
+            new_limit = max(AIMD_MIN_LIMIT, limit / 2)
+            table.update_item(
+                Key={'pool': pool},
+                UpdateExpression="REMOVE leases.#lease, lane_leases.#lane.#lease SET #limit = :limit, last_decrease = :now",
+                ConditionExpression="last_decrease < :cooldown",
+                ExpressionAttributeNames={**names, '#limit': 'limit'},
+                ExpressionAttributeValues={
+                    ':limit': Decimal(str(round(new_limit, 3))),
+                    ':now': now,
+                    ':cooldown': now - AIMD_DECREASE_COOLDOWN
+                }
+            )
+            print(f"Bedrock throttled: concurrency limit {limit:.2f} -> {new_limit:.2f}")
+        else:
+            new_limit = min(pool_max_limit(pool), limit + 1 / max(limit, 1))
+            table.update_item(
+                Key={'pool': pool},
+                UpdateExpression="REMOVE leases.#lease, lane_leases.#lane.#lease SET #limit = :limit",
+                ExpressionAttributeNames={**names, '#limit': 'limit'},
+                ExpressionAttributeValues={':limit': Decimal(str(round(new_limit, 3)))}
+            )
+        return
+    except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+        # 冷却期内已经减半过，只释放租约
+        pass
+    except Exception as e:
+        print(f"Failed to update concurrency limit: {str(e)}")
+
+    try:
+        table.update_item(
+            Key={'pool': pool},
+            UpdateExpression="REMOVE leases.#lease, lane_leases.#lane.#lease",
+            ExpressionAttributeNames=names
+        )
+    except Exception as e:
+        print(f"Failed to release Bedrock slot {lease_id}: {str(e)}")
+
+def pool_max_limit(pool):
+    """共享并发池的上限（本区域为账户配额；远端区域的池使用该区域配置的上限）"""
+    if '@' in pool:
+        region_limit = REGION_MAX_CONCURRENCY.get(pool.split('@', 1)[1])
+        if region_limit:
+            return int(region_limit)
+    return AIMD_MAX_LIMIT
+
+def pool_headroom(pool, lane):
+    """该通道在并发池中当前可用的名额数（共享余量和通道份额余量中较小者）"""
+    state = get_concurrency_state(pool)
+    limit = max(AIMD_MIN_LIMIT, int(state['limit']))
+    lane_held = len(state.get('lane_leases', {}).get(lane, {}))
+    return min(limit - len(state.get('leases', {})), lane_limit(lane, limit) - lane_held)
@@ -0,0 +1,83 @@
+import os
+import uuid
+from warm_clients import get_client
+from bedrock_pool.aimd import pool_headroom
+
+MAX_TRANSFER_COST_PER_JOB = float(os.environ.get('MAX_TRANSFER_COST_PER_JOB', '0.005'))  # 美元，超过则只在本区域处理
+
+class BedrockRegionRouter:
+    """
+    多区域Bedrock路由：在传输成本可接受的区域中选择AIMD并发余量最大的区域
+    各区域的bedrock-runtime/s3客户端按区域缓存复用；client_factory和headroom_fn可替换为测试桩
+    """
+    def __init__(self, home_region, home_bucket, regions, max_transfer_cost=MAX_TRANSFER_COST_PER_JOB,
+                 client_factory=None, headroom_fn=None):
+        self.home_region = home_region
+        self.regions = {home_region: {'region': home_region, 'outputBucket': home_bucket, 'transferCostPerGb': 0}}
+        for config in regions:
+            if config['region'] != home_region:
+                self.regions[config['region']] = config
+        self.max_transfer_cost = max_transfer_cost
+        self.client_factory = client_factory or get_client
+        self.headroom_fn = headroom_fn or pool_headroom
+        self._clients = {}
+
+    def client(self, service, region):
+        """区域客户端（同一容器内复用）"""
+        key = (service, region)
+        if key not in self._clients:
+            self._clients[key] = self.client_factory(service, region)
+        return self._clients[key]
+
+    def output_bucket(self, region):
+        return self.regions[region]['outputBucket']
+
+    def max_concurrency(self, region):
+        return self.regions[region].get('maxConcurrency')
+
+    def pool_for(self, base_pool, region):
+        """本区域使用共享池，远端区域使用独立的池（各自的配额预算）"""
+        return base_pool if region == self.home_region else f"{base_pool}@{region}"
+
+    def transfer_cost(self, region, size):
+        """把输入复制到该区域的估算传输费用（美元）"""
+        return (size or 0) / 1024 ** 3 * float(self.regions[region].get('transferCostPerGb', 0))
+
+    def choose(self, base_pool, lane, size=0):
+        """返回(区域, 并发池)；按该通道在各区域的余量选择，余量相同时选传输成本低的，本区域优先"""
+        candidates = [
+            region for region in self.regions
+            if region == self.home_region or self.transfer_cost(region, size) <= self.max_transfer_cost
+        ]
+        best = max(candidates, key=lambda region: (
+            self.headroom_fn(self.pool_for(base_pool, region), lane),
+            -self.transfer_cost(region, size),
+            region == self.home_region
+        ))
+        if best != self.home_region:
+            print(f"Routing Bedrock call to {best}")
+        return best, self.pool_for(base_pool, best)
+
+    def stage_input(self, region, s3_uri):
+        """把输入复制到目标区域的中转桶（Bedrock只能读取同区域的S3输入），返回(中转key, 中转URI)"""
+        source_bucket, source_key = s3_uri[len('s3://'):].split('/', 1)
+        staging_bucket = self.output_bucket(region)
+        staged_key = f"bedrock-inputs/{uuid.uuid4()}/{source_key.split('/')[-1]}"
+        self.client('s3', region).copy_object(
+            Bucket=staging_bucket,
+            Key=staged_key,
+            CopySource={'Bucket': source_bucket, 'Key': source_key}
+        )
+        print(f"Staged {s3_uri} to s3://{staging_bucket}/{staged_key}")
+        return staged_key, f"s3://{staging_bucket}/{staged_key}"
+
+    def delete_staged_input(self, region, staged_key):
+        """删除中转输入（失败时由中转桶的生命周期规则清理）"""
+        try:
+            self.client('s3', region).delete_object(Bucket=self.output_bucket(region), Key=staged_key)
+        except Exception as e:
+            print(f"Failed to delete staged input {staged_key}: {str(e)}")
+
+def region_from_arn(arn):
+    """arn:aws:bedrock:<region>:... -> region"""
+    return arn.split(':')[3]
@@ -0,0 +1,18 @@
+"""
+embeddings索引的唯一定义（随opensearch_layer发布，各Lambda和脚本共用）
+新建物理索引时优先克隆别名当前指向索引的settings和mappings，
+保留重建索引工具迁移后的HNSW参数；别名不存在时才使用默认定义
+"""
+from index_schema.schema import (
+    VECTOR_DIMENSION,
+    build_index_body,
+    clone_index_body,
+    live_index_body
+)
+
+__all__ = [
+    'VECTOR_DIMENSION',
+    'build_index_body',
+    'clone_index_body',
+    'live_index_body'
+]
@@ -0,0 +1,86 @@
+import copy
+
+VECTOR_DIMENSION = 1024
+
+# 由集群生成、创建索引时不能指定的settings
+GENERATED_SETTINGS = {'uuid', 'creation_date', 'provided_name', 'version', 'number_of_shards', 'number_of_replicas'}
+
+def build_index_body(method=None, alias=None):
+    """
+    构建默认索引定义
+    method: 可选的knn_vector HNSW参数（engine/space_type/m/ef_construction/encoder）
+    alias: 可选，创建时直接挂载的别名
+    """
+    vector_field = {
+        'type': 'knn_vector',
+        'dimension': VECTOR_DIMENSION
+    }
+    if method:
+        vector_field['method'] = method
+
+    index_body = {
+        'settings': {
+            'index': {
+                'knn': True,
+                "mapping.total_fields.limit": 5000
+            }
+        },
+        'mappings': {
+            'properties': {
+                'visual_embedding': dict(vector_field),
+                'text_embedding': dict(vector_field),
+                'audio_embedding': dict(vector_field),
+                's3_uri': {'type': 'keyword'},
+                'media_type': {'type': 'keyword'},
+                'file_type': {'type': 'keyword'},
+                'timestamp': {'type': 'date'},
+                'segment_index': {'type': 'integer'},
+                'start_time': {'type': 'float'},
+                'end_time': {'type': 'float'},
+                'duration': {'type': 'float'}
+            }
+        }
+    }
+    if alias:
+        index_body['aliases'] = {alias: {'is_write_index': True}}
+    return index_body
+
+def live_index_body(client, index):
+    """
+    读取索引（或别名当前指向的物理索引）的settings和mappings，去掉集群生成的字段
+    返回可直接用于indices.create的定义；索引不存在时返回None
+    """
+    if not client.indices.exists(index=index):
+        return None
+
+    mappings = client.indices.get_mapping(index=index)
+    settings = client.indices.get_settings(index=index)
+    # 别名指向多个索引时以写索引优先，其次按名称取最新版本
+    physical_index = sorted(mappings.keys())[-1]
+    if client.indices.exists_alias(name=index):
+        aliases = client.indices.get_alias(name=index)
+        write_indices = [name for name, info in aliases.items()
+                         if info.get('aliases', {}).get(index, {}).get('is_write_index')]
+        if write_indices:
+            physical_index = write_indices[0]
+
+    index_settings = copy.deepcopy(settings[physical_index]['settings'].get('index', {}))
+    for key in GENERATED_SETTINGS:
+        index_settings.pop(key, None)
+
+    return {
+        'settings': {'index': index_settings},
+        'mappings': copy.deepcopy(mappings[physical_index]['mappings'])
+    }
+
+def clone_index_body(client, index, alias=None):
+    """
+    克隆现有索引的定义用于新建物理索引；不存在时回退到默认定义
+    alias: 可选，创建时直接挂载的别名
+    """
+    index_body = live_index_body(client, index)
+    if index_body is None:
+        return build_index_body(alias=alias)
+    if alias:
+        index_body['aliases'] = {alias: {'is_write_index': True}}
+    return index_body
@@ -0,0 +1,33 @@
+"""
+请求链路的分阶段耗时追踪（随opensearch_layer发布，各Lambda共用）
+API创建trace，traceparent通过SQS消息属性传给worker/embedding Lambda，
+warm_clients创建的boto3/OpenSearch客户端自动为每次调用记录span，
+结束时以CloudWatch EMF输出各阶段耗时指标
+"""
+from tracing.trace import (
+    Trace,
+    start_trace,
+    current_trace,
+    end_trace,
+    span,
+    record_span,
+    record_stage,
+    sqs_trace_attributes,
+    trace_from_sqs_record,
+    instrument_boto_client,
+    instrument_opensearch_client
+)
+
+__all__ = [
+    'Trace',
+    'start_trace',
+    'current_trace',
+    'end_trace',
+    'span',
+    'record_span',
+    'record_stage',
+    'sqs_trace_attributes',
+    'trace_from_sqs_record',
+    'instrument_boto_client',
+    'instrument_opensearch_client'
+]
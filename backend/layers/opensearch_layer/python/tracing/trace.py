@@ -0,0 +1,200 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+SERVICE_NAME = os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'local')
+METRICS_NAMESPACE = os.environ.get('TRACE_METRICS_NAMESPACE', 'MultimodalSearch/Latency')
+MAX_SPANS = 200  # 每条trace日志最多保留的span明细，阶段汇总不受限制
+
+# 当前trace：asyncio任务和asyncio.to_thread会复制上下文，并发处理的请求各自独立
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+
+class Trace:
+    """
+    一次请求的trace：trace_id沿API -> SQS -> worker传递，
+    span明细和按阶段汇总的耗时（毫秒，同一阶段并发的调用耗时累加）
+    """
+    def __init__(self, trace_id=None, parent_id=None, started_at=None, **attributes):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.started_at = started_at or time.time()  # 秒，链路起点（API收到请求的时间）
+        self.attributes = attributes
+        self.spans = []
+        self.stages = {}
+        self._lock = threading.Lock()
+        self._token = None
+
+    def add_span(self, name, duration_ms, error=None, **attributes):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0) + duration_ms
+            if len(self.spans) < MAX_SPANS:
+                span = {'name': name, 'ms': round(duration_ms, 1), **attributes}
+                if error:
+                    span['error'] = error
+                self.spans.append(span)
+
+    def traceparent(self):
+        """W3C traceparent格式，下游以本span为父span"""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def timings(self):
+        """各阶段耗时（整数毫秒），total为从链路起点到现在的端到端耗时"""
+        with self._lock:
+            timings = {name: int(round(ms)) for name, ms in self.stages.items()}
+        timings['total'] = int(round((time.time() - self.started_at) * 1000))
+        return timings
+
+    def message_attributes(self):
+        """传递给下游的SQS消息属性"""
+        return sqs_trace_attributes(self.traceparent(), self.started_at)
+
+def parse_traceparent(traceparent):
+    """traceparent -> (trace_id, parent_span_id)，格式不合法时返回(None, None)"""
+    parts = (traceparent or '').split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None
+    return parts[1], parts[2]
+
+def start_trace(traceparent=None, started_at=None, **attributes):
+    """开始（或按traceparent延续）一个trace并设为当前trace"""
+    trace_id, parent_id = parse_traceparent(traceparent)
+    trace = Trace(trace_id, parent_id, started_at, **attributes)
+    trace._token = _current_trace.set(trace)
+    return trace
+
+def current_trace():
+    return _current_trace.get()
+
+def end_trace(trace, **dimensions):
+    """结束trace：以CloudWatch EMF格式输出各阶段耗时指标和span明细，并清除当前trace"""
+    try:
+        emit_trace(trace, dimensions)
+    except Exception as e:
+        print(f"Failed to emit trace {trace.trace_id}: {str(e)}")
+    if trace._token is not None:
+        try:
+            _current_trace.reset(trace._token)
+        except ValueError:
+            # 在其他上下文中结束（例如跨任务），只清空当前值
+            _current_trace.set(None)
+        trace._token = None
+
+def emit_trace(trace, dimensions):
+    """
+    一条EMF日志：各阶段耗时为指标（维度Service + 传入的维度），
+    trace_id、父span、属性和span明细为日志字段，可在Logs Insights中按trace_id查询
+    """
+    timings = trace.timings()
+    dimensions = {'Service': SERVICE_NAME, **{key: str(value) for key, value in dimensions.items()}}
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [list(dimensions)],
+                'Metrics': [{'Name': name, 'Unit': 'Milliseconds'} for name in timings]
+            }]
+        },
+        **dimensions,
+        **timings,
+        'trace_id': trace.trace_id,
+        'span_id': trace.span_id,
+        'parent_id': trace.parent_id,
+        'attributes': trace.attributes,
+        'spans': trace.spans
+    }
+    print(json.dumps(record, default=str))
+
+def record_span(name, started, error=None, **attributes):
+    """把从started（time.perf_counter()）到现在的耗时记入当前trace；没有trace时忽略"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_span(name, (time.perf_counter() - started) * 1000, error, **attributes)
+
+@contextmanager
+def span(name, **attributes):
+    """计时代码块并记入当前trace（同步和协程代码中都可使用）"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        record_span(name, started, error=type(e).__name__, **attributes)
+        raise
+    record_span(name, started, **attributes)
+
+def record_stage(name, duration_ms):
+    """记录不是由代码块计时的阶段（如SQS排队时间）"""
+    trace = _current_trace.get()
+    if trace is not None and duration_ms is not None:
+        trace.add_span(name, max(0, duration_ms))
+
+def sqs_trace_attributes(traceparent, started_at):
+    """SQS send_message的MessageAttributes：traceparent和链路起点（毫秒时间戳）"""
+    return {
+        'traceparent': {'DataType': 'String', 'StringValue': traceparent},
+        'trace_started_at': {'DataType': 'Number', 'StringValue': str(int(started_at * 1000))}
+    }
+
+def trace_from_sqs_record(record, **attributes):
+    """
+    从Lambda的SQS事件记录延续trace（没有trace属性时开始新trace），
+    并记录api（链路起点到入队）和queue（入队到开始处理）两个阶段
+    """
+    message_attributes = record.get('messageAttributes') or {}
+    traceparent = (message_attributes.get('traceparent') or {}).get('stringValue')
+    started_at_ms = (message_attributes.get('trace_started_at') or {}).get('stringValue')
+    sent_at_ms = int((record.get('attributes') or {}).get('SentTimestamp', 0)) or None
+    now_ms = time.time() * 1000
+
+    started_at = int(started_at_ms) / 1000 if started_at_ms else (sent_at_ms / 1000 if sent_at_ms else None)
+    trace = start_trace(traceparent, started_at, message_id=record.get('messageId'), **attributes)
+    if started_at_ms and sent_at_ms:
+        record_stage('api', sent_at_ms - int(started_at_ms))
+    if sent_at_ms:
+        record_stage('queue', now_ms - sent_at_ms)
+    return trace
+
+def _before_aws_call(model, context, **kwargs):
+    if _current_trace.get() is not None:
+        context['trace_span'] = (f"{model.service_model.service_name}.{model.name}", time.perf_counter())
+
+def _after_aws_call(context, exception=None, **kwargs):
+    # after-call-error事件不带model参数，span名在before-call时记下
+    trace_span = context.pop('trace_span', None)
+    if trace_span is not None:
+        error = type(exception).__name__ if exception is not None else None
+        record_span(trace_span[0], trace_span[1], error=error)
+
+def instrument_boto_client(client):
+    """为boto3客户端的每次API调用（含重试）记录span，span名为 服务.操作（如 s3.GetObject）"""
+    events = client.meta.events
+    events.register('before-call', _before_aws_call, unique_id='trace-before-call')
+    events.register('after-call', _after_aws_call, unique_id='trace-after-call')
+    events.register('after-call-error', _after_aws_call, unique_id='trace-after-call-error')
+    return client
+
+def opensearch_operation(method, url):
+    """/embeddings/_search -> search，/_msearch -> msearch，其余为HTTP方法"""
+    for part in reversed(url.split('?')[0].split('/')):
+        if part.startswith('_'):
+            return part.lstrip('_')
+    return method.lower()
+
+def instrument_opensearch_client(client):
+    """为OpenSearch客户端的每次请求记录span，span名为 opensearch.操作（如 opensearch.msearch）"""
+    transport = client.transport
+    perform_request = transport.perform_request
+
+    def traced_perform_request(method, url, *args, **kwargs):
+        if _current_trace.get() is None:
+            return perform_request(method, url, *args, **kwargs)
+        with span(f"opensearch.{opensearch_operation(method, url)}"):
+            return perform_request(method, url, *args, **kwargs)
+
+    transport.perform_request = traced_perform_request
+    return client
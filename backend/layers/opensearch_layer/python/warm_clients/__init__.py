@@ -0,0 +1,30 @@
+"""
+Lambda容器内复用的客户端（随opensearch_layer发布，各Lambda共用）
+boto3客户端、OpenSearch客户端、账户ID和索引存在性检查都在首次使用时创建并缓存，
+热启动的调用不再重复建立连接、签名认证和STS/索引检查请求；
+boto3/opensearchpy在首次使用时才导入，冷启动只为实际用到的客户端付出初始化成本；
+客户端的每次调用自动记入当前trace（见tracing）
+"""
+from warm_clients.clients import (
+    get_client,
+    get_resource,
+    get_account_id,
+    get_opensearch_client,
+    index_exists,
+    lazy_client,
+    lazy_resource,
+    prime,
+    register_priming
+)
+
+__all__ = [
+    'get_client',
+    'get_resource',
+    'get_account_id',
+    'get_opensearch_client',
+    'index_exists',
+    'lazy_client',
+    'lazy_resource',
+    'prime',
+    'register_priming'
+]
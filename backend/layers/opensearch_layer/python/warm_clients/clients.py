@@ -0,0 +1,147 @@
+import os
+import threading
+from tracing import instrument_boto_client, instrument_opensearch_client
+
+DEFAULT_REGION = os.environ.get('AWS_REGION', 'us-east-1')
+MAX_POOL_CONNECTIONS = int(os.environ.get('CLIENT_MAX_POOL_CONNECTIONS', '25'))
+OPENSEARCH_POOL_MAXSIZE = int(os.environ.get('OPENSEARCH_POOL_MAXSIZE', '20'))
+
+PRIME_ON_INIT = os.environ.get('PRIME_ON_INIT', 'false').lower() == 'true'
+
+# boto3 Session创建客户端不是线程安全的，创建过程加锁
+_lock = threading.Lock()
+_session = None
+_boto_config = None
+_clients = {}
+_resources = {}
+_opensearch_clients = {}
+_account_id = None
+_known_indices = set()
+
+def get_session():
+    """容器内共享的boto3 Session（凭证由Session按需刷新）；boto3在首次使用时才导入"""
+    global _session, _boto_config
+    if _session is None:
+        with _lock:
+            if _session is None:
+                import boto3
+                from botocore.config import Config
+                # 连接池放大并开启TCP keep-alive，供线程池并发调用复用
+                _boto_config = Config(max_pool_connections=MAX_POOL_CONNECTIONS, tcp_keepalive=True)
+                _session = boto3.session.Session()
+    return _session
+
+def get_client(service, region=None):
+    """按(服务, 区域)缓存的boto3客户端"""
+    key = (service, region or DEFAULT_REGION)
+    client = _clients.get(key)
+    if client is None:
+        session = get_session()
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = instrument_boto_client(session.client(service, region_name=key[1], config=_boto_config))
+                _clients[key] = client
+    return client
+
+def get_resource(service, region=None):
+    """按(服务, 区域)缓存的boto3 resource（如dynamodb）"""
+    key = (service, region or DEFAULT_REGION)
+    resource = _resources.get(key)
+    if resource is None:
+        session = get_session()
+        with _lock:
+            resource = _resources.get(key)
+            if resource is None:
+                resource = session.resource(service, region_name=key[1], config=_boto_config)
+                instrument_boto_client(resource.meta.client)
+                _resources[key] = resource
+    return resource
+
+def get_account_id():
+    """当前账户ID（容器内只调用一次STS）"""
+    global _account_id
+    if _account_id is None:
+        _account_id = get_client('sts').get_caller_identity()['Account']
+    return _account_id
+
+def get_opensearch_client(endpoint=None, region=None):
+    """
+    缓存的OpenSearch Serverless客户端（requests连接池保持长连接）
+    签名使用Session的可刷新凭证对象，过期时在签名时刷新，无需重建客户端
+    """
+    endpoint = endpoint or os.environ.get('OPENSEARCH_ENDPOINT')
+    if not endpoint:
+        raise ValueError("OPENSEARCH_ENDPOINT environment variable not set")
+
+    key = (endpoint, region or DEFAULT_REGION)
+    client = _opensearch_clients.get(key)
+    if client is None:
+        from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
+
+        auth = AWSV4SignerAuth(get_session().get_credentials(), key[1], 'aoss')
+        with _lock:
+            client = _opensearch_clients.get(key)
+            if client is None:
+                client = OpenSearch(
+                    hosts=[{'host': endpoint.replace('https://', ''), 'port': 443}],
+                    http_auth=auth,
+                    use_ssl=True,
+                    verify_certs=True,
+                    connection_class=RequestsHttpConnection,
+                    pool_maxsize=OPENSEARCH_POOL_MAXSIZE
+                )
+                instrument_opensearch_client(client)
+                _opensearch_clients[key] = client
+    return client
+
+def index_exists(client, index):
+    """索引或别名是否存在；存在的结果在容器内缓存，不存在时每次都重新检查"""
+    if index in _known_indices:
+        return True
+    exists = client.indices.exists(index=index)
+    if exists:
+        _known_indices.add(index)
+    return exists
+
+class LazyClient:
+    """首次访问属性时才创建的客户端代理，模块级定义的客户端不再拖慢导入"""
+    def __init__(self, factory, service, region=None):
+        self._factory = factory
+        self._service = service
+        self._region = region
+        self._target = None
+
+    def __getattr__(self, name):
+        if self._target is None:
+            self._target = self._factory(self._service, self._region)
+        return getattr(self._target, name)
+
+def lazy_client(service, region=None):
+    """延迟创建的boto3客户端"""
+    return LazyClient(get_client, service, region)
+
+def lazy_resource(service, region=None):
+    """延迟创建的boto3 resource"""
+    return LazyClient(get_resource, service, region)
+
+def prime(clients=(), resources=(), opensearch=False):
+    """预先创建客户端并完成重量级导入（快照前或预置并发的初始化阶段调用）"""
+    for service in clients:
+        get_client(service)
+    for service in resources:
+        get_resource(service)
+    if opensearch and os.environ.get('OPENSEARCH_ENDPOINT'):
+        get_opensearch_client()
+
+def register_priming(clients=(), resources=(), opensearch=False):
+    """
+    注册预热：SnapStart运行时中在创建快照前预热（恢复后直接复用），
+    设置PRIME_ON_INIT=true时在初始化阶段预热（适合预置并发）；否则保持按需创建
+    """
+    try:
+        from snapshot_restore_py import register_before_snapshot
+        register_before_snapshot(lambda: prime(clients, resources, opensearch))
+    except ImportError:
+        if PRIME_ON_INIT:
+            prime(clients, resources, opensearch)
@@ -0,0 +1,211 @@
+import json
+import os
+from datetime import datetime
+from warm_clients import lazy_client, lazy_resource, get_opensearch_client
+from index_schema import clone_index_body
+
+# 初始化客户端（容器内复用）
+s3_client = lazy_client('s3')
+lambda_client = lazy_client('lambda')
+dynamodb = lazy_resource('dynamodb')
+
+# 配置
+OPENSEARCH_ENDPOINT = os.environ.get('OPENSEARCH_ENDPOINT')
+OPENSEARCH_INDEX = os.environ.get('OPENSEARCH_INDEX', 'embeddings')  # 读写统一使用的别名
+UPLOAD_BUCKET = os.environ.get('UPLOAD_BUCKET', 'multimodal-search-uploads')
+JOBS_TABLE_NAME = os.environ.get('JOBS_TABLE_NAME', 'multimodal-search-maintenance-jobs')
+SEARCH_TABLE_NAME = os.environ.get('SEARCH_TABLE_NAME', 'multimodal-search-search-tasks')
+STATUS_TABLE_NAME = os.environ.get('STATUS_TABLE_NAME', 'multimodal-search-embedding-status')
+CATALOG_TABLE_NAME = os.environ.get('CATALOG_TABLE_NAME', 'multimodal-search-asset-catalog')
+RESUME_THRESHOLD_MS = 60 * 1000  # 剩余时间不足时保存进度并异步续跑
+
+# 清库步骤（按顺序执行，每步完成后持久化进度）
+PURGE_STEPS = ['swap_index', 's3', 'search_table', 'status_table', 'catalog_table', 'done']
+PURGE_TABLES = {
+    'search_table': (SEARCH_TABLE_NAME, 'search_id'),
+    'status_table': (STATUS_TABLE_NAME, 's3_uri'),
+    'catalog_table': (CATALOG_TABLE_NAME, 'asset_key')
+}
+
+class ResumeLater(Exception):
+    """Lambda剩余时间不足，需要异步续跑"""
+    pass
+
+def handler(event, context):
+    """
+    维护任务Lambda - 异步执行可续跑的清库任务
+    """
+    job_id = event['job_id']
+    table = dynamodb.Table(JOBS_TABLE_NAME)
+    job = table.get_item(Key={'job_id': job_id}).get('Item')
+
+    if not job:
+        print(f"Job not found: {job_id}")
+        return {'statusCode': 404}
+    if job['status'] in ('completed', 'failed'):
+        print(f"Job {job_id} already {job['status']}, skipping")
+        return {'statusCode': 200}
+
+    print(f"Running purge job {job_id} from step {job.get('step')}")
+    update_job(job_id, status='running')
+
+    try:
+        run_purge(job, context)
+        update_job(job_id, status='completed', step='done')
+        print(f"Purge job {job_id} completed")
+
+    except ResumeLater:
+        # 进度已保存，异步调用自身从断点继续
+        print(f"Purge job {job_id} paused at step {job.get('step')}, resuming asynchronously")
+        lambda_client.invoke(
+            FunctionName=context.function_name,
+            InvocationType='Event',
+            Payload=json.dumps({'job_id': job_id})
+        )
+
+    except Exception as e:
+        print(f"Purge job {job_id} failed: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        update_job(job_id, status='failed', error=str(e)[:1000])
+
+    return {'statusCode': 200}
+
+def run_purge(job, context):
+    """按步骤执行清库，每步之间持久化进度"""
+    job_id = job['job_id']
+    progress = job.get('progress', {})
+    step = job.get('step', PURGE_STEPS[0])
+
+    while step != 'done':
+        cursor = job.get('cursor')
+
+        if step == 'swap_index':
+            if OPENSEARCH_ENDPOINT:
+                new_index, old_indices = swap_to_fresh_index(get_opensearch_client(), job_id)
+                progress['new_index'] = new_index
+                progress['dropped_indices'] = old_indices
+        elif step == 's3':
+            progress['s3_deleted'] = purge_bucket(job_id, cursor, progress.get('s3_deleted', 0), context)
+        else:
+            table_name, key_name = PURGE_TABLES[step]
+            progress[step] = purge_table(job_id, step, table_name, key_name, cursor, progress.get(step, 0), context)
+
+        step = PURGE_STEPS[PURGE_STEPS.index(step) + 1]
+        job['cursor'] = None
+        update_job(job_id, step=step, progress=progress, cursor=None)
+
+def swap_to_fresh_index(client, job_id):
+    """
+    创建新的空索引并原子切换别名，然后删除旧索引
+    读者始终通过别名访问，切换对读请求是O(1)的
+    """
+    # 索引名由任务ID决定，任务中断重跑时不会产生孤儿索引
+    new_index = f"{OPENSEARCH_INDEX}-purge-{job_id[:8]}"
+
+    # 查询别名当前指向的物理索引
+    old_indices = []
+    legacy_index = False
+    if client.indices.exists_alias(name=OPENSEARCH_INDEX):
+        old_indices = [index for index in client.indices.get_alias(name=OPENSEARCH_INDEX).keys() if index != new_index]
+    elif client.indices.exists(index=OPENSEARCH_INDEX):
+        # 旧部署中别名名称是一个真实索引，必须先删除才能创建同名别名
+        legacy_index = True
+        old_indices = [OPENSEARCH_INDEX]
+
+    if not client.indices.exists(index=new_index):
+        # 克隆当前索引的定义，保留重建索引工具迁移后的mapping
+        client.indices.create(index=new_index, body=clone_index_body(client, OPENSEARCH_INDEX))
+        print(f"Created fresh index: {new_index}")
+
+    if legacy_index:
+        client.indices.delete(index=OPENSEARCH_INDEX)
+        print(f"Deleted legacy concrete index: {OPENSEARCH_INDEX}")
+
+    # 单次_aliases请求内完成移除和添加，保证原子性
+    actions = [{'remove': {'index': index, 'alias': OPENSEARCH_INDEX}} for index in old_indices if not legacy_index]
+    actions.append({'add': {'index': new_index, 'alias': OPENSEARCH_INDEX, 'is_write_index': True}})
+    client.indices.update_aliases(body={'actions': actions})
+    print(f"Alias {OPENSEARCH_INDEX} now points to {new_index}")
+
+    if not legacy_index:
+        for index in old_indices:
+            client.indices.delete(index=index)
+            print(f"Dropped old index: {index}")
+
+    return new_index, old_indices
+
+def purge_bucket(job_id, continuation_token, deleted_count, context):
+    """分页删除上传桶中的所有对象，每页后保存续跑游标"""
+    while True:
+        list_kwargs = {'Bucket': UPLOAD_BUCKET, 'MaxKeys': 1000}
+        if continuation_token:
+            list_kwargs['ContinuationToken'] = continuation_token
+        response = s3_client.list_objects_v2(**list_kwargs)
+
+        objects = [{'Key': obj['Key']} for obj in response.get('Contents', [])]
+        if objects:
+            # S3批量删除最多1000个
+            s3_client.delete_objects(Bucket=UPLOAD_BUCKET, Delete={'Objects': objects, 'Quiet': True})
+            deleted_count += len(objects)
+            print(f"Deleted {len(objects)} S3 objects, total: {deleted_count}")
+
+        if not response.get('IsTruncated'):
+            return deleted_count
+
+        # 保存游标，续跑时从下一页开始
+        continuation_token = response.get('NextContinuationToken')
+        update_job(job_id, cursor=continuation_token, progress_key='s3_deleted', progress_value=deleted_count)
+        check_remaining_time(context)
+
+def purge_table(job_id, step, table_name, key_name, start_key, deleted_count, context):
+    """扫描删除DynamoDB表记录（仅投影主键），每页后保存续跑游标"""
+    table = dynamodb.Table(table_name)
+    scan_kwargs = {'ProjectionExpression': '#k', 'ExpressionAttributeNames': {'#k': key_name}}
+    if start_key:
+        scan_kwargs['ExclusiveStartKey'] = json.loads(start_key)
+
+    while True:
+        response = table.scan(**scan_kwargs)
+        with table.batch_writer() as batch:
+            for item in response.get('Items', []):
+                batch.delete_item(Key={key_name: item[key_name]})
+                deleted_count += 1
+
+        if 'LastEvaluatedKey' not in response:
+            print(f"DynamoDB deleted {deleted_count} records from {table_name}")
+            return deleted_count
+
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        update_job(job_id, cursor=json.dumps(response['LastEvaluatedKey']), progress_key=step, progress_value=deleted_count)
+        check_remaining_time(context)
+
+def check_remaining_time(context):
+    """剩余执行时间不足时中断，由handler异步续跑"""
+    if context and context.get_remaining_time_in_millis() < RESUME_THRESHOLD_MS:
+        raise ResumeLater()
+
+def update_job(job_id, progress_key=None, progress_value=None, **fields):
+    """更新维护任务记录（只SET传入的字段，避免覆盖续跑游标）"""
+    table = dynamodb.Table(JOBS_TABLE_NAME)
+    fields['updated_at'] = datetime.now().isoformat()
+
+    set_clauses = []
+    expression_attribute_names = {}
+    expression_attribute_values = {}
+    for name, value in fields.items():
+        set_clauses.append(f"#{name} = :{name}")
+        expression_attribute_names[f"#{name}"] = name
+        expression_attribute_values[f":{name}"] = value
+
+    if progress_key is not None:
+        set_clauses.append("progress.#progress_key = :progress_value")
+        expression_attribute_names["#progress_key"] = progress_key
+        expression_attribute_values[":progress_value"] = progress_value
+
+    table.update_item(
+        Key={'job_id': job_id},
+        UpdateExpression="SET " + ", ".join(set_clauses),
+        ExpressionAttributeNames=expression_attribute_names,
+        ExpressionAttributeValues=expression_attribute_values
+    )
@@ -296,6 +296,7 @@ def search_similar_images(client, query_vector, top_k=5):
             's3_uri': s3_uri,
             'file_type': hit['_source']['file_type'],
             'timestamp': hit['_source']['timestamp'],
+            'asset_id': object_key,
             'image_url': presigned_url
         })
     
@@ -1,33 +1,113 @@
 import json
-import boto3
 import uuid
 import base64
 from datetime import datetime
 import os
+import time
+import math
+import hashlib
+import shutil
+import subprocess
+import tempfile
+from warm_clients import lazy_client, lazy_resource, register_priming
+from tracing import start_trace, current_trace, end_trace, span, sqs_trace_attributes
 
-# 初始化客户端
-dynamodb = boto3.resource('dynamodb')
-sqs = boto3.client('sqs')
-s3_client = boto3.client('s3')
+# 初始化客户端（容器内复用）
+dynamodb = lazy_resource('dynamodb')
+sqs = lazy_client('sqs')
+s3_client = lazy_client('s3')
+register_priming(clients=['sqs', 's3'], resources=['dynamodb'])
 
 # 配置
 SEARCH_TABLE_NAME = os.environ.get('SEARCH_TABLE_NAME')
 SEARCH_QUEUE_URL = os.environ.get('SEARCH_QUEUE_URL')
 UPLOAD_BUCKET = os.environ.get('UPLOAD_BUCKET', 'multimodal-usw2-uploads')
+MAX_QUERY_FILE_SIZE = int(os.environ.get('MAX_QUERY_FILE_SIZE', str(500 * 1024 * 1024)))
+QUERY_UPLOAD_EXPIRES = 900
+MAX_WAIT_MS = 25000  # API Gateway集成超时29秒，留出余量
+WAIT_POLL_INITIAL = 0.2
+WAIT_POLL_MAX = 1.0
+TERMINAL_STATUSES = ('completed', 'failed')
+MAX_BATCH_QUERIES = int(os.environ.get('MAX_BATCH_QUERIES', '500'))
+MAX_SQS_MESSAGE_SIZE = 256 * 1024
+ASSET_URL_EXPIRES = 3600
+ASSET_URL_REUSE = 2700  # 签发后45分钟内复用缓存，保证返回的URL至少还有15分钟有效期
+MAX_URL_BATCH = 100
+MAX_URL_CACHE_ENTRIES = 10000
+RESULTS_URL_EXPIRES = 300  # 转存S3的搜索结果只返回短期URL，客户端拿到后立即下载
+UPLOAD_PREFIX = 'uploads/'  # 已入库的素材（搜索命中的asset_id）
+DERIVATIVES_PREFIX = 'derivatives/'
+# /urls只为搜索命中的素材及其衍生文件签发URL；temp/、bedrock-outputs/、search-results/等其他前缀一律拒绝
+ASSET_PREFIXES = (UPLOAD_PREFIX, DERIVATIVES_PREFIX)
+VIDEO_TYPES = ('mp4', 'mov')
+CLIP_CUT_TIMEOUT = 20  # 秒，需在API Gateway超时内完成
+LATENCY_EWMA_ALPHA = 0.3
+# 冷启动时各搜索模式的预估耗时（秒），之后由观测到的完成耗时修正
+DEFAULT_MODE_LATENCY = {
+    'text': 4,
+    'batch': 60,
+    'visual-image': 8,
+    'visual-text': 8,
+    'audio': 10
+}
+
+# 相同查询的合并窗口：窗口内进行中或已完成的搜索直接复用
+COALESCE_WINDOW = int(os.environ.get('COALESCE_WINDOW', '300'))
+CLAIM_GRACE = 10  # 指针已写入但搜索记录仍不存在超过该秒数，视为认领者失败
+ACTIVE_STATUSES = ('awaiting_upload', 'pending', 'processing', 'completed')
+
+# 本容器内已签发的素材URL: asset_id -> (url, expires_at)
+_asset_url_cache = {}
+
+# 本容器内观测到的各搜索模式耗时EWMA
+_latency_ewma = {}
 
 def handler(event, context):
     """
     异步搜索API - 快速返回搜索ID
+    每个请求一个trace：搜索请求的trace随SQS消息传给worker，结束时输出本请求的分阶段耗时
     """
+    trace = start_trace()
+    try:
+        return route_request(event)
+    finally:
+        end_trace(trace, Operation=api_operation(event))
+
+def api_operation(event):
+    """trace指标的Operation维度：/status/{id} -> status，POST / -> search"""
+    if event.get('source') == 'aws.s3':
+        return 'query_upload'
+    return event.get('path', '/').strip('/').split('/')[0] or 'search'
+
+def trace_message_attributes():
+    """当前trace的SQS消息属性（没有trace时为空）"""
+    trace = current_trace()
+    return trace.message_attributes() if trace else {}
+
+def route_request(event):
+    """按路径分发请求"""
     try:
+        # S3（EventBridge）通知：查询文件已上传到temp/，入队搜索任务
+        if event.get('source') == 'aws.s3':
+            return handle_query_upload_event(event)
+        
         path = event.get('path', '/')
         method = event.get('httpMethod', 'GET')
         
         if path == '/' and method == 'POST':
             return start_search(event)
+        elif path == '/batch' and method == 'POST':
+            return start_batch_search(event)
+        elif path == '/urls' and method == 'POST':
+            return mint_asset_urls(event)
+        elif path == '/clip' and method == 'GET':
+            return get_clip(event)
         elif path.startswith('/status/') and method == 'GET':
             search_id = path.split('/')[-1]
-            return get_search_status(search_id)
+            return get_search_status(search_id, event)
+        elif path.startswith('/commit/') and method == 'POST':
+            search_id = path.split('/')[-1]
+            return commit_search(search_id, event)
         else:
             return {
                 'statusCode': 404,
@@ -50,18 +130,29 @@ def start_search(event):
         search_type = body.get('searchType', 'file')  # 'file' 或 'text'
         search_mode = body.get('searchMode', 'visual-image')  # 搜索模式
         
+        # 先校验再认领合并指针，无效请求不能占住指针让后续相同的有效请求合并到不存在的搜索
+        error = validate_search_request(search_type, body)
+        if error:
+            return {
+                'statusCode': 400,
+                'headers': get_cors_headers(),
+                'body': json.dumps({'error': error})
+            }
+        
         # 生成搜索ID
         search_id = str(uuid.uuid4())
         
+        # 相同查询合并：已有进行中或最近完成的搜索时直接返回其search_id
+        query_key = coalesce_key(event, body, search_type, search_mode)
+        if query_key:
+            existing = claim_query(query_key, search_id)
+            if existing:
+                print(f"Coalesced search {search_id} into {existing['search_id']}")
+                return coalesced_response(existing, body)
+        
         if search_type == 'text':
             # 文本搜索
             query_text = body.get('queryText')
-            if not query_text:
-                return {
-                    'statusCode': 400,
-                    'headers': get_cors_headers(),
-                    'body': json.dumps({'error': 'Missing query text'})
-                }
             
             # 在DynamoDB中创建搜索任务记录
             table = dynamodb.Table(SEARCH_TABLE_NAME)
@@ -85,22 +176,16 @@ def start_search(event):
                     'search_type': 'text',
                     'search_mode': search_mode,
                     'query_text': query_text
-                })
+                }),
+                MessageAttributes=trace_message_attributes()
             )
             
-        else:
-            # 文件搜索
+        elif body.get('file'):
+            # 文件搜索（旧版：base64放在请求体中，受API Gateway 10MB限制）
             file_data = body.get('file')
             file_name = body.get('fileName')
             file_type = body.get('fileType')
             
-            if not all([file_data, file_name, file_type]):
-                return {
-                    'statusCode': 400,
-                    'headers': get_cors_headers(),
-                    'body': json.dumps({'error': 'Missing file data or filename'})
-                }
-            
             # 临时存储文件到S3
             temp_key = f"temp/{search_id}.{file_name.split('.')[-1]}"
             file_content = base64.b64decode(file_data)
@@ -138,59 +223,767 @@ def start_search(event):
                     'file_name': file_name,
                     'file_type': file_type,
                     's3_key': temp_key
-                })
+                }),
+                MessageAttributes=trace_message_attributes()
             )
+            
+        else:
+            # 文件搜索：返回预签名POST，浏览器直传S3后再入队
+            return create_file_search(search_id, search_mode, body)
         
+        return search_started_response(search_id, parse_wait_ms(body))
+        
+    except Exception as e:
+        print(f"Error starting search: {str(e)}")
         return {
-            'statusCode': 202,
+            'statusCode': 500,
             'headers': get_cors_headers(),
-            'body': json.dumps({
+            'body': json.dumps({'error': str(e)})
+        }
+
+def start_batch_search(event):
+    """
+    启动批量文本搜索：N条查询只创建一条搜索记录和一条SQS消息，结果写入同一个结果文档
+    请求体: {"queries": ["text", {"queryText": "...", "id": "..."}], "topK": 20, "waitMs": 0}
+    """
+    try:
+        body = json.loads(event.get('body') or '{}')
+        raw_queries = body.get('queries')
+        
+        if not isinstance(raw_queries, list) or not raw_queries:
+            return {
+                'statusCode': 400,
+                'headers': get_cors_headers(),
+                'body': json.dumps({'error': 'queries must be a non-empty list'})
+            }
+        if len(raw_queries) > MAX_BATCH_QUERIES:
+            return {
+                'statusCode': 400,
+                'headers': get_cors_headers(),
+                'body': json.dumps({'error': f'At most {MAX_BATCH_QUERIES} queries per batch'})
+            }
+        
+        queries = []
+        for raw_query in raw_queries:
+            query = {'query_text': raw_query} if isinstance(raw_query, str) else {
+                'query_text': raw_query.get('queryText'),
+                'id': raw_query.get('id')
+            }
+            if not isinstance(query['query_text'], str) or not query['query_text'].strip():
+                return {
+                    'statusCode': 400,
+                    'headers': get_cors_headers(),
+                    'body': json.dumps({'error': 'Every query needs a non-empty queryText'})
+                }
+            queries.append(query)
+        
+        search_id = str(uuid.uuid4())
+        message_body = json.dumps({
+            'search_id': search_id,
+            'search_type': 'batch',
+            'search_mode': 'visual-text',
+            'queries': queries,
+            'top_k': max(1, min(int(body.get('topK', 20)), 100))
+        })
+        if len(message_body.encode('utf-8')) > MAX_SQS_MESSAGE_SIZE:
+            return {
+                'statusCode': 413,
+                'headers': get_cors_headers(),
+                'body': json.dumps({'error': 'Batch too large, split it into smaller batches'})
+            }
+        
+        table = dynamodb.Table(SEARCH_TABLE_NAME)
+        table.put_item(
+            Item={
                 'search_id': search_id,
                 'status': 'pending',
-                'message': 'Search started successfully'
-            })
+                'search_type': 'batch',
+                'search_mode': 'visual-text',
+                'query_count': len(queries),
+                'created_at': datetime.now().isoformat(),
+                'updated_at': datetime.now().isoformat()
+            }
+        )
+        sqs.send_message(QueueUrl=SEARCH_QUEUE_URL, MessageBody=message_body, MessageAttributes=trace_message_attributes())
+        print(f"Started batch search {search_id} with {len(queries)} queries")
+        
+        return search_started_response(search_id, parse_wait_ms(body))
+        
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': get_cors_headers(),
+            'body': json.dumps({'error': str(e)})
+        }
+    except Exception as e:
+        print(f"Error starting batch search: {str(e)}")
+        return {
+            'statusCode': 500,
+            'headers': get_cors_headers(),
+            'body': json.dumps({'error': str(e)})
+        }
+
+def presign_asset(asset_id, now):
+    """签发素材URL，复用本容器内仍有足够有效期的缓存，返回(url, expires_at)"""
+    cached = _asset_url_cache.get(asset_id)
+    if not cached or cached[1] - now < ASSET_URL_EXPIRES - ASSET_URL_REUSE:
+        with span('s3.presign'):
+            url = s3_client.generate_presigned_url(
+                'get_object',
+                Params={'Bucket': UPLOAD_BUCKET, 'Key': asset_id},
+                ExpiresIn=ASSET_URL_EXPIRES
+            )
+        cached = (url, now + ASSET_URL_EXPIRES)
+        _asset_url_cache[asset_id] = cached
+    return cached
+
+def mint_asset_urls(event):
+    """
+    批量签发素材访问URL：搜索结果只保存asset_id，前端按当前页面需要的素材请求URL
+    请求体: {"assetIds": ["xxx.jpg", ...]}
+    """
+    try:
+        body = json.loads(event.get('body') or '{}')
+        asset_ids = body.get('assetIds')
+        
+        if not isinstance(asset_ids, list) or len(asset_ids) > MAX_URL_BATCH:
+            return {
+                'statusCode': 400,
+                'headers': get_cors_headers(),
+                'body': json.dumps({'error': f'assetIds must be a list of at most {MAX_URL_BATCH} ids'})
+            }
+        
+        now = int(time.time())
+        if len(_asset_url_cache) > MAX_URL_CACHE_ENTRIES:
+            _asset_url_cache.clear()
+        
+        urls = {}
+        for asset_id in dict.fromkeys(asset_ids):
+            if not isinstance(asset_id, str) or not asset_id.startswith(ASSET_PREFIXES):
+                continue
+            
+            url, expires_at = presign_asset(asset_id, now)
+            urls[asset_id] = {'url': url, 'expires_at': expires_at}
+        
+        return {
+            'statusCode': 200,
+            'headers': get_cors_headers(),
+            'body': json.dumps({'urls': urls})
         }
         
     except Exception as e:
-        print(f"Error starting search: {str(e)}")
+        print(f"Error minting asset urls: {str(e)}")
         return {
             'statusCode': 500,
             'headers': get_cors_headers(),
             'body': json.dumps({'error': str(e)})
         }
 
-def get_search_status(search_id):
-    """获取搜索状态和结果"""
+def get_clip(event):
+    """
+    视频片段接口: GET /clip?assetId=xxx.mp4&start=12.5&end=22.5[&cut=1]
+    返回带媒体片段偏移(#t=start,end)的预签名URL，以及由ingest时的关键帧索引得到的字节范围提示；
+    cut=1且ffmpeg可用时按关键帧无损截取片段并缓存到S3；截取失败或超时时不返回clip_url，客户端使用url中的偏移
+    """
     try:
-        table = dynamodb.Table(SEARCH_TABLE_NAME)
-        response = table.get_item(Key={'search_id': search_id})
+        params = event.get('queryStringParameters') or {}
+        asset_id = params.get('assetId') or ''
+        try:
+            start = max(0.0, float(params.get('start', 0)))
+            end = float(params['end'])
+        except (KeyError, TypeError, ValueError):
+            return {
+                'statusCode': 400,
+                'headers': get_cors_headers(),
+                'body': json.dumps({'error': 'start and end must be numbers'})
+            }
         
-        if 'Item' not in response:
+        if end <= start or not asset_id.startswith(UPLOAD_PREFIX) or asset_id.split('.')[-1].lower() not in VIDEO_TYPES:
             return {
-                'statusCode': 404,
+                'statusCode': 400,
                 'headers': get_cors_headers(),
-                'body': json.dumps({'error': 'Search not found'})
+                'body': json.dumps({'error': 'assetId must be a video and end must be greater than start'})
             }
         
-        item = response['Item']
+        now = int(time.time())
+        url, expires_at = presign_asset(asset_id, now)
         result = {
-            'search_id': search_id,
-            'status': item['status'],
-            'created_at': item['created_at'],
-            'updated_at': item['updated_at']
+            'asset_id': asset_id,
+            'start': start,
+            'end': end,
+            'url': f"{url}#t={start:g},{end:g}",
+            'expires_at': expires_at,
+            'byte_range': keyframe_byte_range(load_keyframe_index(asset_id), start, end)
         }
         
-        if item['status'] == 'completed' and 'results' in item:
-            result['results'] = json.loads(item['results'])
-        elif item['status'] == 'failed' and 'error' in item:
-            result['error'] = item['error']
-            
+        if params.get('cut') == '1':
+            # 截取失败或超时时降级为带偏移的源视频URL，不让整个请求失败
+            try:
+                clip_key = cut_clip(asset_id, url, start, end)
+                if clip_key:
+                    result['clip_url'], _ = presign_asset(clip_key, now)
+            except subprocess.CalledProcessError as e:
+                print(f"Clip cut failed for {asset_id}: {(e.stderr or b'').decode('utf-8', 'replace')[-300:]}")
+            except Exception as e:
+                print(f"Clip cut failed for {asset_id}: {str(e)}")
+        
         return {
             'statusCode': 200,
             'headers': get_cors_headers(),
             'body': json.dumps(result)
         }
         
+    except Exception as e:
+        print(f"Error getting clip: {str(e)}")
+        return {
+            'statusCode': 500,
+            'headers': get_cors_headers(),
+            'body': json.dumps({'error': str(e)})
+        }
+
+def load_keyframe_index(asset_id):
+    """读取ingest时生成的关键帧索引，不存在时返回None"""
+    try:
+        response = s3_client.get_object(Bucket=UPLOAD_BUCKET, Key=f"{DERIVATIVES_PREFIX}{asset_id}/keyframes.json")
+        return json.loads(response['Body'].read())
+    except s3_client.exceptions.NoSuchKey:
+        return None
+
+def keyframe_byte_range(index, start, end):
+    """
+    根据关键帧索引计算覆盖[start, end]的字节范围：
+    从start之前最近的关键帧开始，到end之后第一个关键帧之前结束（没有则到文件末尾）
+    """
+    if not index or not index.get('keyframes'):
+        return None
+    
+    keyframes = index['keyframes']
+    start_time, start_byte = keyframes[0]
+    for time_offset, position in keyframes:
+        if time_offset > start:
+            break
+        start_time, start_byte = time_offset, position
+    
+    end_time, end_byte = index.get('duration'), index['size'] - 1
+    for time_offset, position in keyframes:
+        if time_offset >= end:
+            end_time, end_byte = time_offset, position - 1
+            break
+    
+    return {
+        'start': start_byte,
+        'end': end_byte,
+        'keyframe_start_time': start_time,
+        'keyframe_end_time': end_time
+    }
+
+def get_ffmpeg_path():
+    """查找ffmpeg（媒体处理Layer的/opt/bin），不可用时返回None"""
+    return os.environ.get('FFMPEG_PATH') or shutil.which('ffmpeg') or (
+        '/opt/bin/ffmpeg' if os.path.exists('/opt/bin/ffmpeg') else None
+    )
+
+def cut_clip(asset_id, source_url, start, end):
+    """用ffmpeg无损截取片段并缓存到derivatives/{asset_id}/clips/，返回片段对象键；ffmpeg不可用时返回None"""
+    clip_key = f"{DERIVATIVES_PREFIX}{asset_id}/clips/{start:.1f}-{end:.1f}.mp4"
+    try:
+        s3_client.head_object(Bucket=UPLOAD_BUCKET, Key=clip_key)
+        return clip_key
+    except Exception:
+        pass
+    
+    ffmpeg = get_ffmpeg_path()
+    if not ffmpeg:
+        print("ffmpeg not available, skipping clip cut")
+        return None
+    
+    with tempfile.TemporaryDirectory() as work_dir:
+        clip_path = os.path.join(work_dir, 'clip.mp4')
+        # -ss放在-i之前按关键帧快速定位，流复制不重新编码
+        subprocess.run(
+            [ffmpeg, '-y', '-ss', f"{start:.1f}", '-i', source_url, '-t', f"{end - start:.1f}",
+             '-c', 'copy', '-movflags', '+faststart', clip_path],
+            check=True, capture_output=True, timeout=CLIP_CUT_TIMEOUT
+        )
+        s3_client.upload_file(clip_path, UPLOAD_BUCKET, clip_key, ExtraArgs={'ContentType': 'video/mp4'})
+    
+    print(f"Cut clip {clip_key}")
+    return clip_key
+
+def validate_search_request(search_type, body):
+    """校验搜索请求的必要参数，返回错误信息；有效时返回None"""
+    if search_type == 'text':
+        query_text = body.get('queryText')
+        if not isinstance(query_text, str) or not query_text.strip():
+            return 'Missing query text'
+    elif body.get('file'):
+        if not all([body.get('fileName'), body.get('fileType')]):
+            return 'Missing file data or filename'
+    elif not all([body.get('fileName'), body.get('fileType')]):
+        return 'Missing fileName or fileType'
+    return None
+
+def coalesce_key(event, body, search_type, search_mode):
+    """
+    计算查询的合并键：优先使用Idempotency-Key请求头，
+    否则文本搜索用规范化文本加搜索模式，请求体内联的文件用服务端计算的内容哈希；
+    预签名直传的文件此时还没有内容，上传后由coalesce_uploaded_file按S3的ETag合并，返回None
+    """
+    headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+    if headers.get('idempotency-key'):
+        return f"idem:{headers['idempotency-key']}"
+    
+    if search_type == 'text':
+        normalized = ' '.join((body.get('queryText') or '').lower().split())
+        if not normalized:
+            return None
+        return f"text:{search_mode}:{hashlib.sha256(normalized.encode('utf-8')).hexdigest()}"
+    
+    if body.get('file'):
+        file_content = base64.b64decode(body['file'])
+        return file_coalesce_key(search_mode, hashlib.md5(file_content).hexdigest(), len(file_content))
+    return None
+
+def file_coalesce_key(search_mode, content_md5, size):
+    """
+    文件查询的合并键：内容MD5加大小，只使用服务端得到的值（不信任客户端提供的哈希）；
+    单次上传（预签名POST）且SSE-S3加密的对象，S3的ETag即内容MD5，与内联文件共用同一个键空间
+    """
+    return f"file:{search_mode}:{content_md5}:{size}"
+
+def coalesce_uploaded_file(search_id, item):
+    """
+    查询文件上传完成后，按S3对象的ETag和大小合并相同文件的搜索
+    合并成功时把本搜索标记为coalesced并指向已有搜索（状态查询时跟随），返回已有搜索的ID；否则返回None
+    """
+    head = s3_client.head_object(Bucket=UPLOAD_BUCKET, Key=item['s3_key'])
+    etag = head['ETag'].strip('"')
+    if '-' in etag:
+        # 分片上传或KMS加密时ETag不是内容MD5，不合并
+        return None
+    
+    existing = claim_query(file_coalesce_key(item['search_mode'], etag, head['ContentLength']), search_id)
+    if not existing or existing['search_id'] == search_id:
+        return None
+    
+    dynamodb.Table(SEARCH_TABLE_NAME).update_item(
+        Key={'search_id': search_id},
+        UpdateExpression="SET #status = :coalesced, coalesced_into = :target, updated_at = :updated_at",
+        ExpressionAttributeNames={"#status": "status"},
+        ExpressionAttributeValues={
+            ":coalesced": "coalesced",
+            ":target": existing['search_id'],
+            ":updated_at": datetime.now().isoformat()
+        }
+    )
+    # 本搜索不会进入worker，查询文件在这里删除
+    try:
+        s3_client.delete_object(Bucket=UPLOAD_BUCKET, Key=item['s3_key'])
+    except Exception as e:
+        print(f"Failed to delete query file {item['s3_key']}: {str(e)}")
+    print(f"Coalesced uploaded search {search_id} into {existing['search_id']}")
+    return existing['search_id']
+
+def claim_query(query_key, search_id):
+    """
+    用条件写入认领查询指针（search_id = query#<key>）
+    认领成功返回None，由调用方创建新搜索；否则返回应复用的已有搜索记录
+    """
+    table = dynamodb.Table(SEARCH_TABLE_NAME)
+    pointer_id = f"query#{query_key}"
+    
+    for _ in range(3):
+        now = int(time.time())
+        pointer = {
+            'search_id': pointer_id,
+            'target_search_id': search_id,
+            'claimed_at': now,
+            'expires_at': now + COALESCE_WINDOW
+        }
+        try:
+            table.put_item(
+                Item=pointer,
+                ConditionExpression="attribute_not_exists(search_id) OR expires_at < :now",
+                ExpressionAttributeValues={':now': now}
+            )
+            return None
+        except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+            pass
+        
+        current = table.get_item(Key={'search_id': pointer_id}, ConsistentRead=True).get('Item')
+        if not current:
+            continue
+        
+        target_id = current['target_search_id']
+        target = table.get_item(Key={'search_id': target_id}, ConsistentRead=True).get('Item')
+        if target and target['status'] in ACTIVE_STATUSES:
+            return target
+        if not target and now - int(current['claimed_at']) < CLAIM_GRACE:
+            # 认领者还在创建搜索记录
+            return {'search_id': target_id, 'status': 'pending'}
+        
+        # 目标搜索失败或认领者未能创建记录：替换指针
+        try:
+            table.put_item(
+                Item=pointer,
+                ConditionExpression="target_search_id = :old",
+                ExpressionAttributeValues={':old': target_id}
+            )
+            return None
+        except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+            continue
+    
+    # 竞争激烈时放弃合并，按新搜索处理
+    return None
+
+def coalesced_response(existing, body):
+    """返回被合并到的已有搜索；对方仍在等待上传时同样下发预签名POST（入队由条件写入去重）"""
+    if existing['status'] == 'awaiting_upload':
+        return {
+            'statusCode': 201,
+            'headers': get_cors_headers(),
+            'body': json.dumps({
+                'search_id': existing['search_id'],
+                'status': 'awaiting_upload',
+                'upload': presign_query_upload(existing['s3_key'], existing['file_type']),
+                'coalesced': True,
+                'message': 'Upload the query file, then commit the search'
+            })
+        }
+    
+    response = search_started_response(existing['search_id'], parse_wait_ms(body))
+    if response['statusCode'] == 202:
+        response['body'] = json.dumps({
+            'search_id': existing['search_id'],
+            'status': existing['status'],
+            'coalesced': True,
+            'message': 'Identical search already in progress'
+        })
+    return response
+
+def presign_query_upload(temp_key, file_type):
+    """生成查询文件的预签名POST，限制内容类型和大小，防止被滥用"""
+    return s3_client.generate_presigned_post(
+        Bucket=UPLOAD_BUCKET,
+        Key=temp_key,
+        Fields={'Content-Type': file_type},
+        Conditions=[
+            {'Content-Type': file_type},
+            ['content-length-range', 1, MAX_QUERY_FILE_SIZE]
+        ],
+        ExpiresIn=QUERY_UPLOAD_EXPIRES
+    )
+
+def create_file_search(search_id, search_mode, body):
+    """创建等待上传的文件搜索任务，返回查询文件的预签名POST"""
+    file_name = body.get('fileName')
+    file_type = body.get('fileType')
+    temp_key = f"temp/{search_id}.{file_name.split('.')[-1].lower()}"
+    
+    # 上传完成后才入队，traceparent保存在搜索记录上，入队时再附到消息属性
+    trace = current_trace()
+    table = dynamodb.Table(SEARCH_TABLE_NAME)
+    table.put_item(
+        Item={
+            'search_id': search_id,
+            'status': 'awaiting_upload',
+            'traceparent': trace.traceparent() if trace else '',
+            'search_type': 'file',
+            'search_mode': search_mode,
+            'file_name': file_name,
+            'file_type': file_type,
+            's3_key': temp_key,
+            'created_at': datetime.now().isoformat(),
+            'updated_at': datetime.now().isoformat()
+        }
+    )
+    
+    upload = presign_query_upload(temp_key, file_type)
+    
+    return {
+        'statusCode': 201,
+        'headers': get_cors_headers(),
+        'body': json.dumps({
+            'search_id': search_id,
+            'status': 'awaiting_upload',
+            'upload': upload,
+            'message': 'Upload the query file, then commit the search'
+        })
+    }
+
+def enqueue_file_search(search_id):
+    """
+    上传完成后入队搜索任务
+    条件写入保证显式提交和S3事件只有一个生效，返回是否由本次调用入队
+    """
+    table = dynamodb.Table(SEARCH_TABLE_NAME)
+    try:
+        item = table.update_item(
+            Key={'search_id': search_id},
+            UpdateExpression="SET #status = :pending, updated_at = :updated_at",
+            ConditionExpression="#status = :awaiting",
+            ExpressionAttributeNames={"#status": "status"},
+            ExpressionAttributeValues={
+                ":pending": "pending",
+                ":awaiting": "awaiting_upload",
+                ":updated_at": datetime.now().isoformat()
+            },
+            ReturnValues="ALL_NEW"
+        )['Attributes']
+    except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+        print(f"Search {search_id} already enqueued or not awaiting upload")
+        return False
+    
+    # 相同文件的搜索正在进行或刚完成：不再入队，状态查询跟随到已有搜索
+    if coalesce_uploaded_file(search_id, item):
+        return True
+    
+    sqs.send_message(
+        QueueUrl=SEARCH_QUEUE_URL,
+        MessageBody=json.dumps({
+            'search_id': search_id,
+            'search_type': 'file',
+            'search_mode': item['search_mode'],
+            'file_name': item['file_name'],
+            'file_type': item['file_type'],
+            's3_key': item['s3_key']
+        }),
+        MessageAttributes=file_search_trace_attributes(item)
+    )
+    print(f"Enqueued file search {search_id}")
+    return True
+
+def file_search_trace_attributes(item):
+    """延续创建文件搜索时的trace，链路起点为搜索记录的创建时间（包含浏览器上传耗时）"""
+    if not item.get('traceparent'):
+        return trace_message_attributes()
+    return sqs_trace_attributes(item['traceparent'], datetime.fromisoformat(item['created_at']).timestamp())
+
+def commit_search(search_id, event):
+    """显式提交：确认查询文件已上传后入队"""
+    try:
+        body = json.loads(event.get('body') or '{}')
+        table = dynamodb.Table(SEARCH_TABLE_NAME)
+        item = table.get_item(Key={'search_id': search_id}).get('Item')
+        if not item:
+            return {
+                'statusCode': 404,
+                'headers': get_cors_headers(),
+                'body': json.dumps({'error': 'Search not found'})
+            }
+        
+        if item['status'] == 'awaiting_upload':
+            try:
+                s3_client.head_object(Bucket=UPLOAD_BUCKET, Key=item['s3_key'])
+            except Exception:
+                return {
+                    'statusCode': 409,
+                    'headers': get_cors_headers(),
+                    'body': json.dumps({'error': 'Query file has not been uploaded'})
+                }
+            enqueue_file_search(search_id)
+        
+        return search_started_response(search_id, parse_wait_ms(body))
+        
+    except Exception as e:
+        print(f"Error committing search: {str(e)}")
+        return {
+            'statusCode': 500,
+            'headers': get_cors_headers(),
+            'body': json.dumps({'error': str(e)})
+        }
+
+def handle_query_upload_event(event):
+    """EventBridge转发的S3 Object Created事件：temp/{search_id}.{ext}"""
+    key = event['detail']['object']['key']
+    search_id = key.split('/')[-1].rsplit('.', 1)[0]
+    print(f"Query file uploaded: {key}")
+    enqueue_file_search(search_id)
+    return {'statusCode': 200}
+
+def parse_wait_ms(body):
+    """解析请求中的waitMs等待预算，限制在[0, MAX_WAIT_MS]"""
+    try:
+        wait_ms = int(body.get('waitMs', 0))
+    except (TypeError, ValueError):
+        return 0
+    return max(0, min(wait_ms, MAX_WAIT_MS))
+
+def load_search_item(search_id):
+    """强一致读取搜索记录；已合并到其他搜索的记录返回被合并到的搜索"""
+    table = dynamodb.Table(SEARCH_TABLE_NAME)
+    item = table.get_item(Key={'search_id': search_id}, ConsistentRead=True).get('Item')
+    if item and item.get('coalesced_into'):
+        return table.get_item(Key={'search_id': item['coalesced_into']}, ConsistentRead=True).get('Item') or item
+    return item
+
+def wait_for_change(search_id, wait_ms, since=None, load_item=load_search_item):
+    """
+    在等待预算内轮询搜索记录（强一致读，间隔指数增长）
+    记录到达终态、或updated_at不同于since时立即返回；超时返回最后一次读到的记录
+    load_item可替换为内存实现，便于在本地驱动长轮询逻辑
+    """
+    deadline = time.time() + wait_ms / 1000
+    interval = WAIT_POLL_INITIAL
+    
+    while True:
+        item = load_item(search_id)
+        if not item or item['status'] in TERMINAL_STATUSES:
+            return item
+        if since is not None and item['updated_at'] != since:
+            return item
+        
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return item
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, WAIT_POLL_MAX)
+
+def search_started_response(search_id, wait_ms):
+    """
+    搜索已入队后的响应
+    设置了waitMs时等待worker完成，预算内完成则直接返回结果，否则返回search_id供轮询
+    """
+    if wait_ms > 0:
+        item = wait_for_change(search_id, wait_ms)
+        if item and item['status'] in TERMINAL_STATUSES:
+            record_latency(item)
+            return {
+                'statusCode': 200,
+                'headers': get_cors_headers(),
+                'body': build_search_body(item)
+            }
+    
+    return {
+        'statusCode': 202,
+        'headers': get_cors_headers(),
+        'body': json.dumps({
+            'search_id': search_id,
+            'status': 'pending',
+            'message': 'Search started successfully'
+        })
+    }
+
+def build_search_body(item):
+    """
+    把搜索记录转换为API响应体
+    内联结果已是序列化好的JSON，直接拼接进响应，不再反序列化；
+    转存S3的大结果只返回短期预签名URL（resultsUrl），不读回Lambda，响应大小与结果规模无关
+    """
+    result = {
+        'search_id': item['search_id'],
+        'status': item['status'],
+        'created_at': item['created_at'],
+        'updated_at': item['updated_at']
+    }
+    # worker记录的分阶段耗时（毫秒）和trace_id，用于定位慢在哪个阶段
+    if item.get('timings'):
+        result['timings'] = {stage: int(ms) for stage, ms in item['timings'].items()}
+    if item.get('trace_id'):
+        result['trace_id'] = item['trace_id']
+    
+    results_json = None
+    if item['status'] == 'completed':
+        if 'results_key' in item:
+            result['resultsUrl'] = presign_results(item['results_key'])
+        elif 'results' in item:
+            results_json = item['results']
+    elif item['status'] == 'failed' and 'error' in item:
+        result['error'] = item['error']
+    
+    body = json.dumps(result)
+    if results_json is not None:
+        body = body[:-1] + ', "results": ' + results_json + '}'
+    return body
+
+def presign_results(results_key):
+    """签发转存结果的短期下载URL（对象以Content-Encoding: gzip存储，浏览器和requests自动解压）"""
+    with span('s3.presign'):
+        return s3_client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': UPLOAD_BUCKET, 'Key': results_key},
+            ExpiresIn=RESULTS_URL_EXPIRES
+        )
+
+def search_duration(item):
+    """搜索从创建到最后一次更新的耗时（秒）"""
+    created_at = datetime.fromisoformat(item['created_at'])
+    updated_at = datetime.fromisoformat(item['updated_at'])
+    return (updated_at - created_at).total_seconds()
+
+def latency_key(item):
+    """耗时统计的分组键：文本和批量搜索按类型统计，文件搜索按搜索模式统计"""
+    if item.get('search_type') in ('text', 'batch'):
+        return item['search_type']
+    return item.get('search_mode', 'visual-image')
+
+def record_latency(item):
+    """
+    用已完成的搜索更新本容器内各搜索模式的耗时EWMA
+    每个搜索只计入一次：条件写入latency_recorded标记成功的请求才更新，
+    客户端反复轮询同一个已完成的搜索不会让EWMA偏向它
+    """
+    if item['status'] != 'completed' or item.get('latency_recorded'):
+        return
+    try:
+        dynamodb.Table(SEARCH_TABLE_NAME).update_item(
+            Key={'search_id': item['search_id']},
+            UpdateExpression='SET latency_recorded = :true',
+            ConditionExpression='attribute_not_exists(latency_recorded)',
+            ExpressionAttributeValues={':true': True}
+        )
+    except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+        return
+    except Exception as e:
+        print(f"Failed to mark latency recorded for {item['search_id']}: {str(e)}")
+        return
+    mode = latency_key(item)
+    duration = search_duration(item)
+    previous = _latency_ewma.get(mode)
+    _latency_ewma[mode] = duration if previous is None else (
+        LATENCY_EWMA_ALPHA * duration + (1 - LATENCY_EWMA_ALPHA) * previous
+    )
+
+def retry_after_seconds(item):
+    """根据该模式的观测耗时估计剩余等待时间，作为Retry-After提示"""
+    mode = latency_key(item)
+    expected = _latency_ewma.get(mode, DEFAULT_MODE_LATENCY.get(mode, 10))
+    elapsed = (datetime.now() - datetime.fromisoformat(item['created_at'])).total_seconds()
+    return max(1, math.ceil(expected - elapsed))
+
+def get_search_status(search_id, event):
+    """
+    获取搜索状态和结果
+    支持长轮询：?waitMs=20000&since=<updated_at>，记录变化或到达终态前保持请求
+    """
+    try:
+        params = event.get('queryStringParameters') or {}
+        wait_ms = parse_wait_ms(params)
+        
+        if wait_ms > 0:
+            item = wait_for_change(search_id, wait_ms, since=params.get('since'))
+        else:
+            item = load_search_item(search_id)
+        
+        if not item:
+            return {
+                'statusCode': 404,
+                'headers': get_cors_headers(),
+                'body': json.dumps({'error': 'Search not found'})
+            }
+        
+        headers = get_cors_headers()
+        if item['status'] in TERMINAL_STATUSES:
+            record_latency(item)
+        else:
+            headers['Retry-After'] = str(retry_after_seconds(item))
+        
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'body': build_search_body(item)
+        }
+        
     except Exception as e:
         print(f"Error getting search status: {str(e)}")
         return {
@@ -204,5 +997,6 @@ def get_cors_headers():
     return {
         'Access-Control-Allow-Origin': '*',
         'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type, Authorization'
+        'Access-Control-Allow-Headers': 'Content-Type, Authorization, Idempotency-Key',
+        'Access-Control-Expose-Headers': 'Retry-After'
     }
\ No newline at end of file
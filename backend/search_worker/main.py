@@ -1,57 +1,142 @@
 import json
-import boto3
 import base64
 from datetime import datetime
 import uuid
 import os
 import time
-from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
+import gzip
+import random
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from warm_clients import lazy_client, lazy_resource, get_account_id, get_opensearch_client, register_priming
+from tracing import trace_from_sqs_record, end_trace, span, record_span
+from bedrock_pool import (
+    CONCURRENCY_POOL, SEARCH_LANE, BedrockRegionRouter, ConcurrencyLimitExceeded, is_throttling_error,
+    try_acquire_bedrock_slot, release_bedrock_slot
+)
 
-# 初始化客户端
-dynamodb = boto3.resource('dynamodb')
-s3_client = boto3.client('s3')
-bedrock_client = boto3.client('bedrock-runtime')
+# 初始化客户端（容器内复用）
+dynamodb = lazy_resource('dynamodb')
+s3_client = lazy_client('s3')
+register_priming(clients=['s3', 'bedrock-runtime'], resources=['dynamodb'], opensearch=True)
 
 # 配置
 SEARCH_TABLE_NAME = os.environ.get('SEARCH_TABLE_NAME')
+CATALOG_TABLE_NAME = os.environ.get('CATALOG_TABLE_NAME', 'multimodal-search-asset-catalog')
+TERMINAL_STATUSES = ('completed', 'failed')  # 消息重投时不再重复执行的状态
 OPENSEARCH_ENDPOINT = os.environ.get('OPENSEARCH_ENDPOINT')
 OPENSEARCH_INDEX = os.environ.get('OPENSEARCH_INDEX', 'embeddings')
 UPLOAD_BUCKET = os.environ.get('UPLOAD_BUCKET', 'multimodal-usw2-uploads')
 MARENG0_MODEL_ID = 'twelvelabs.marengo-embed-2-7-v1:0'
+BATCH_EMBED_CONCURRENCY = int(os.environ.get('BATCH_EMBED_CONCURRENCY', '8'))  # 同时进行的Bedrock异步调用数
+BATCH_EMBED_MIN_INTERVAL = float(os.environ.get('BATCH_EMBED_MIN_INTERVAL', '0.2'))  # 两次发起调用之间的最小间隔（秒）
+MSEARCH_CHUNK_SIZE = 50  # 每个_msearch请求的子查询数
+
+# AIMD自适应并发控制（bedrock_pool）：与embedding各摄取通道共用同一个marengo池，
+# 搜索通道的份额为1，可使用共享上限内的全部空闲名额
+SLOT_WAIT_SECONDS = 60  # 等待空闲名额的最长时间
+
+# 多区域Bedrock路由（与embedding Lambda相同的BEDROCK_REGIONS配置），未配置时只使用本区域
+HOME_REGION = os.environ.get('AWS_REGION', 'us-east-1')
+BEDROCK_REGIONS = json.loads(os.environ.get('BEDROCK_REGIONS', '[]'))
+
+RESULTS_PREFIX = 'search-results/'
+RESULTS_INLINE_LIMIT = int(os.environ.get('RESULTS_INLINE_LIMIT', str(32 * 1024)))  # 超过该字节数的结果转存S3
+
+# asyncio运行时：阻塞的boto3/OpenSearch调用在线程池中执行（复用warm_clients的连接池），
+# 每个下游同时在途的请求数各自受限，避免一批查询压垮单个下游或耗尽连接池
+IO_THREADS = int(os.environ.get('WORKER_IO_THREADS', '48'))
+DOWNSTREAM_LIMITS = {
+    'bedrock': int(os.environ.get('BEDROCK_INFLIGHT_LIMIT', '8')),
+    's3': int(os.environ.get('S3_INFLIGHT_LIMIT', '16')),
+    'opensearch': int(os.environ.get('OPENSEARCH_INFLIGHT_LIMIT', '8')),
+    'dynamodb': int(os.environ.get('DYNAMODB_INFLIGHT_LIMIT', '16'))
+}
+DOWNSTREAM_SEMAPHORES = {name: asyncio.Semaphore(limit) for name, limit in DOWNSTREAM_LIMITS.items()}
+_event_loop = None
 
 def handler(event, context):
     """
     搜索处理Worker - 异步处理搜索任务
+    同一批SQS消息在asyncio事件循环中并发处理：一个查询等待Bedrock轮询时，其他查询的kNN和读写照常进行
     """
     try:
-        # 处理SQS消息
-        for record in event['Records']:
-            message_body = json.loads(record['body'])
-            search_id = message_body['search_id']
-            
-            print(f"Processing search task: {search_id}")
-            
-            # 更新状态为处理中
-            update_search_status(search_id, 'processing')
-            
-            try:
-                # 执行搜索
-                results = process_search(message_body)
-                
-                # 更新状态为完成
-                update_search_status(search_id, 'completed', results=results)
-                
-            except Exception as e:
-                print(f"Error processing search {search_id}: {str(e)}")
-                update_search_status(search_id, 'failed', error=str(e))
-                
-        return {'statusCode': 200}
+        records = event['Records']
+        outcomes = run_async(process_records(records))
+        batch_item_failures = []
+        for record, outcome in zip(records, outcomes):
+            if isinstance(outcome, Exception):
+                print(f"Error in worker for message {record['messageId']}: {str(outcome)}")
+                batch_item_failures.append({'itemIdentifier': record['messageId']})
+        
+        # 部分批处理失败：只有列出的消息会在可见性超时后重新投递
+        return {'batchItemFailures': batch_item_failures}
         
     except Exception as e:
         print(f"Error in worker: {str(e)}")
-        return {'statusCode': 500}
+        # handler级别的错误抛出异常，让SQS重试整批消息（已结束的搜索重投时会被跳过）
+        raise e
+
+def run_async(coro):
+    """在容器内复用的事件循环上运行协程（信号量和线程池绑定在该循环上，热启动直接复用）"""
+    global _event_loop
+    if _event_loop is None:
+        _event_loop = asyncio.new_event_loop()
+        _event_loop.set_default_executor(ThreadPoolExecutor(max_workers=IO_THREADS))
+        asyncio.set_event_loop(_event_loop)
+    return _event_loop.run_until_complete(coro)
 
-def process_search(message):
+async def call_downstream(name, func, *args, **kwargs):
+    """在线程池中执行阻塞的boto3/OpenSearch调用，同一下游同时在途的请求数受该下游的信号量限制"""
+    async with DOWNSTREAM_SEMAPHORES[name]:
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+async def process_records(records):
+    """并发处理一批消息，单条消息的异常不影响其他消息"""
+    return await asyncio.gather(*(process_record(record) for record in records), return_exceptions=True)
+
+async def process_record(record):
+    """
+    处理单条SQS消息（延续API创建的trace，分阶段耗时随最终状态写入搜索记录）
+    已结束的搜索（超时后整批重投、重复投递）直接跳过；状态写入失败时抛出异常，由handler报告该消息失败
+    """
+    message_body = json.loads(record['body'])
+    search_id = message_body['search_id']
+    search_type = message_body.get('search_type', 'file')
+    
+    status = await call_downstream('dynamodb', get_search_status, search_id)
+    if status in TERMINAL_STATUSES:
+        print(f"Search {search_id} already {status}, skipping redelivered message")
+        return
+    
+    trace = trace_from_sqs_record(record, search_id=search_id)
+    
+    print(f"Processing search task: {search_id} (trace {trace.trace_id})")
+    
+    try:
+        # 更新状态为处理中
+        await call_downstream('dynamodb', update_search_status, search_id, 'processing')
+        
+        try:
+            # 执行搜索
+            results = await process_search(message_body)
+            
+            # 更新状态为完成
+            await call_downstream(
+                'dynamodb', update_search_status, search_id, 'completed', results=results,
+                timings=trace.timings(), trace_id=trace.trace_id
+            )
+            
+        except Exception as e:
+            print(f"Error processing search {search_id}: {str(e)}")
+            await call_downstream(
+                'dynamodb', update_search_status, search_id, 'failed', error=str(e),
+                timings=trace.timings(), trace_id=trace.trace_id
+            )
+    finally:
+        end_trace(trace, Operation=search_type)
+
+async def process_search(message):
     """处理搜索任务"""
     search_id = message['search_id']
     search_type = message.get('search_type', 'file')  # 'file' 或 'text'
@@ -59,10 +144,13 @@ def process_search(message):
     
     print(f"Processing search: type={search_type}, mode={search_mode}")
     
+    if search_type == 'batch':
+        return await process_batch_search(message)
+    
     if search_type == 'text':
         # 文本搜索
         query_text = message['query_text']
-        query_embedding = get_text_embedding_from_marengo(query_text)
+        query_embedding = await call_with_bedrock_slot(get_text_embedding_from_marengo, query_text)
         embedding_field = 'text_embedding'
         search_media_type = 'text'
     else:
@@ -94,31 +182,246 @@ def process_search(message):
             embedding_field = 'visual_embedding'
         
         s3_uri = f"s3://{UPLOAD_BUCKET}/{s3_key}"
+        # 配置了远端区域时按文件大小估算跨区域复制成本
+        size = 0
+        if BEDROCK_REGIONS:
+            size = (await call_downstream('s3', s3_client.head_object, Bucket=UPLOAD_BUCKET, Key=s3_key))['ContentLength']
         # 使用用户选择的搜索模式
-        query_embedding = get_embedding_from_marengo(media_type, s3_uri, UPLOAD_BUCKET, search_mode)
+        query_embedding = await call_with_bedrock_slot(
+            get_embedding_from_marengo, media_type, s3_uri, UPLOAD_BUCKET, search_mode, size=size
+        )
         
         # 清理临时文件
         try:
-            s3_client.delete_object(Bucket=UPLOAD_BUCKET, Key=s3_key)
+            await call_downstream('s3', s3_client.delete_object, Bucket=UPLOAD_BUCKET, Key=s3_key)
         except:
             pass
     
     # 在OpenSearch中搜索相似内容
     opensearch_client = get_opensearch_client()
-    search_results = search_similar_embeddings(opensearch_client, query_embedding, embedding_field, search_media_type)
+    search_results = await search_similar_embeddings(opensearch_client, query_embedding, embedding_field, search_media_type)
     
     return search_results
 
-def get_text_embedding_from_marengo(text):
-    """使用Marengo模型获取文本embedding（异步调用）"""
+async def acquire_bedrock_slot(pool, lane, wait_seconds):
+    """
+    AIMD控制器：在共享并发上限及该通道份额内获取一个Bedrock调用租约
+    wait_seconds内获取不到时抛出ConcurrencyLimitExceeded，返回租约ID；等待期间让出事件循环
+    """
+    lease_id = str(uuid.uuid4())
+    deadline = time.time() + wait_seconds
+    delay = 1
+    
+    while True:
+        acquired, limit = await call_downstream('dynamodb', try_acquire_bedrock_slot, pool, lane, lease_id)
+        if acquired:
+            return lease_id
+        
+        if time.time() + delay > deadline:
+            raise ConcurrencyLimitExceeded(f"Bedrock concurrency limit {limit} reached, throttled locally")
+        await asyncio.sleep(delay + random.uniform(0, delay))
+        delay = min(delay * 2, 10)
+
+async def call_with_bedrock_slot(func, *args, size=0):
+    """
+    选择并发余量最大的区域，在该区域AIMD控制器分配的名额内调用Bedrock（func为协程函数，最后一个参数为区域），
+    结束后按是否被限流反馈给控制器
+    """
+    with span('bedrock.slot_wait'):
+        region, pool = await call_downstream('dynamodb', bedrock_router.choose, CONCURRENCY_POOL, SEARCH_LANE, size)
+        lease_id = await acquire_bedrock_slot(pool, SEARCH_LANE, SLOT_WAIT_SECONDS)
+    throttled = False
+    try:
+        return await func(*args, region)
+    except Exception as e:
+        throttled = is_throttling_error(e)
+        raise
+    finally:
+        await call_downstream('dynamodb', release_bedrock_slot, pool, SEARCH_LANE, lease_id, throttled)
+
+bedrock_router = BedrockRegionRouter(HOME_REGION, UPLOAD_BUCKET, BEDROCK_REGIONS)
+
+# 批量embedding的发起速率控制（同一事件循环内的协程共享）
+_embed_start_lock = asyncio.Lock()
+_last_embed_start = 0.0
+
+async def wait_for_embed_slot():
+    """保证两次Bedrock调用发起之间至少间隔BATCH_EMBED_MIN_INTERVAL秒"""
+    global _last_embed_start
+    async with _embed_start_lock:
+        delay = _last_embed_start + BATCH_EMBED_MIN_INTERVAL - time.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        _last_embed_start = time.time()
+
+async def embed_query_text(text, semaphore):
+    """限速后获取文本embedding，失败时返回异常而不是抛出，避免单条查询拖垮整个批次"""
+    async with semaphore:
+        await wait_for_embed_slot()
+        try:
+            return await call_with_bedrock_slot(get_text_embedding_from_marengo, text)
+        except Exception as e:
+            return e
+
+async def run_msearch(opensearch_client, chunk, hits_by_query, errors_by_query):
+    """执行一个_msearch请求，把命中按查询归类；请求失败时记为这些查询的错误"""
+    msearch_body = []
+    for _, _, _, search_body in chunk:
+        msearch_body.append({'index': OPENSEARCH_INDEX})
+        msearch_body.append(search_body)
+    
+    try:
+        response = await call_downstream('opensearch', opensearch_client.msearch, body=msearch_body)
+    except Exception as e:
+        print(f"_msearch failed: {str(e)}")
+        for index, _, _, _ in chunk:
+            errors_by_query[index] = str(e)
+        return
+    print(f"_msearch executed {len(chunk)} sub-queries")
+    
+    for (index, search_embedding_type, target_embedding_type, _), sub_response in zip(chunk, response['responses']):
+        if 'error' in sub_response:
+            errors_by_query[index] = str(sub_response['error'])
+            continue
+        for hit in sub_response['hits']['hits']:
+            hits_by_query[index].append(collect_hit(hit, 'text', search_embedding_type, target_embedding_type))
+
+async def process_batch_search(message):
+    """
+    批量文本搜索：限速并发获取embedding，每个文本的embedding一返回就把它的kNN子查询
+    （与同时就绪的其他文本合并）通过_msearch执行，kNN与其余文本的Bedrock轮询重叠进行
+    返回按输入顺序排列的每条查询结果
+    """
+    queries = message['queries']
+    top_k = message.get('top_k', 20)
+    
+    # 规范化后相同的文本只embedding一次
+    normalized = [' '.join(query['query_text'].split()) for query in queries]
+    unique_texts = list(dict.fromkeys(normalized))
+    print(f"Batch search: {len(queries)} queries, {len(unique_texts)} unique texts")
+    
+    indices_by_text = {}
+    for index, text in enumerate(normalized):
+        indices_by_text.setdefault(text, []).append(index)
+    
+    opensearch_client = get_opensearch_client()
+    embed_semaphore = asyncio.Semaphore(BATCH_EMBED_CONCURRENCY)
+    ready_texts = asyncio.Queue()
+    embeddings = {}
+    hits_by_query = {index: [] for index in range(len(queries))}
+    errors_by_query = {}
+    
+    async def embed_text(text):
+        embeddings[text] = await embed_query_text(text, embed_semaphore)
+        ready_texts.put_nowait(text)
+    
+    async def search_ready_texts():
+        """取出所有已就绪的文本，构建子查询并分块发起_msearch"""
+        msearch_tasks = []
+        finished = 0
+        while finished < len(unique_texts):
+            texts = [await ready_texts.get()]
+            while not ready_texts.empty():
+                texts.append(ready_texts.get_nowait())
+            finished += len(texts)
+            
+            # 构建子查询，记录每个子查询属于哪条查询
+            sub_searches = []
+            for text in texts:
+                if isinstance(embeddings[text], Exception):
+                    continue
+                knn_searches = build_knn_searches(embeddings[text], 'text_embedding', 'text', top_k)
+                for index in indices_by_text[text]:
+                    for search_embedding_type, target_embedding_type, search_body in knn_searches:
+                        sub_searches.append((index, search_embedding_type, target_embedding_type, search_body))
+            
+            for start in range(0, len(sub_searches), MSEARCH_CHUNK_SIZE):
+                msearch_tasks.append(asyncio.create_task(run_msearch(
+                    opensearch_client, sub_searches[start:start + MSEARCH_CHUNK_SIZE], hits_by_query, errors_by_query
+                )))
+        await asyncio.gather(*msearch_tasks)
+    
+    await asyncio.gather(search_ready_texts(), *(embed_text(text) for text in unique_texts))
+    
+    succeeded = [
+        index for index in range(len(queries))
+        if not isinstance(embeddings[normalized[index]], Exception) and index not in errors_by_query
+    ]
+    formatted = await asyncio.gather(*(
+        call_downstream('dynamodb', format_results, hits_by_query[index]) for index in succeeded
+    ))
+    results_by_query = dict(zip(succeeded, formatted))
+    
+    batch_results = []
+    for index, query in enumerate(queries):
+        entry = {'index': index, 'query_text': query['query_text']}
+        if query.get('id') is not None:
+            entry['id'] = query['id']
+        
+        embedding = embeddings[normalized[index]]
+        if isinstance(embedding, Exception):
+            entry['error'] = str(embedding)
+        elif index in errors_by_query:
+            entry['error'] = errors_by_query[index]
+        else:
+            entry['results'] = results_by_query[index]
+        batch_results.append(entry)
+    
+    failed = sum(1 for entry in batch_results if 'error' in entry)
+    print(f"Batch search finished: {len(batch_results) - failed} succeeded, {failed} failed")
+    return batch_results
+
+def read_async_invoke_output(res, output_s3_client):
+    """从已完成的异步调用的实际输出路径读取输出JSON（使用输出所在区域的S3客户端）"""
+    actual_output_s3_uri = res["outputDataConfig"]["s3OutputDataConfig"]["s3Uri"]
+    alt_bucket, alt_prefix = extract_s3_uri(actual_output_s3_uri)
+    output_key = alt_prefix + "/output.json" if alt_prefix else "output.json"
+    
+    output_resp = output_s3_client.get_object(Bucket=alt_bucket, Key=output_key)
+    return json.loads(output_resp["Body"].read().decode("utf-8"))
+
+async def poll_async_invoke(region, invocation_arn, interval, max_attempts, label):
+    """
+    轮询异步调用直到完成并返回输出JSON；两次轮询之间让出事件循环，不占用线程
+    从开始轮询到输出就绪记为marengo.wait阶段，读取输出另计为s3.GetObject
+    """
+    regional_bedrock = bedrock_router.client('bedrock-runtime', region)
+    attempt = 0
+    started = time.perf_counter()
+    
+    while attempt < max_attempts:
+        try:
+            res = await call_downstream('bedrock', regional_bedrock.get_async_invoke, invocationArn=invocation_arn)
+            print(f"{label} status (attempt {attempt + 1}): {res['status']}")
+            
+            if res["status"] == "Completed":
+                if "outputDataConfig" in res and "s3OutputDataConfig" in res["outputDataConfig"]:
+                    record_span('marengo.wait', started, region=region, attempts=attempt + 1)
+                    return await call_downstream('s3', read_async_invoke_output, res, bedrock_router.client('s3', region))
+                    
+            elif res["status"] in ("Failed", "Cancelled"):
+                error_msg = res.get("failureMessage", "Unknown error")
+                raise ValueError(f"{label} async invoke failed: {error_msg}")
+                
+            await asyncio.sleep(interval)
+            attempt += 1
+            
+        except Exception as e:
+            if attempt == max_attempts - 1:
+                raise e
+            await asyncio.sleep(interval)
+            attempt += 1
+    
+    raise TimeoutError(f"{label} async invoke timed out after maximum attempts")
+
+async def get_text_embedding_from_marengo(text, region=HOME_REGION):
+    """使用Marengo模型获取文本embedding（异步调用，输出写入所选区域的桶）"""
     try:
-        # 获取账户ID
-        sts_client = boto3.client('sts')
-        account_id = sts_client.get_caller_identity()['Account']
+        regional_bedrock = bedrock_router.client('bedrock-runtime', region)
         
         # 生成输出路径
         output_key = f"bedrock-outputs/{uuid.uuid4()}/result.json"
-        output_s3_uri = f"s3://{UPLOAD_BUCKET}/{output_key}"
+        output_s3_uri = f"s3://{bedrock_router.output_bucket(region)}/{output_key}"
         
         # 文本输入
         model_input = {
@@ -136,7 +439,9 @@ def get_text_embedding_from_marengo(text):
         print(f"Starting async text embedding for: {text[:50]}...")
         
         # 异步调用
-        start_resp = bedrock_client.start_async_invoke(
+        start_resp = await call_downstream(
+            'bedrock',
+            regional_bedrock.start_async_invoke,
             modelId=MARENG0_MODEL_ID,
             modelInput=model_input,
             outputDataConfig=output_data_config
@@ -145,51 +450,26 @@ def get_text_embedding_from_marengo(text):
         invocation_arn = start_resp["invocationArn"]
         print("Text embedding invocation ARN:", invocation_arn)
         
-        # 轮询结果
-        max_attempts = 30  # 文本处理通常很快
-        attempt = 0
-        
-        while attempt < max_attempts:
-            try:
-                res = bedrock_client.get_async_invoke(invocationArn=invocation_arn)
-                print(f"Text embedding status (attempt {attempt + 1}): {res['status']}")
-                
-                if res["status"] == "Completed":
-                    if "outputDataConfig" in res and "s3OutputDataConfig" in res["outputDataConfig"]:
-                        actual_output_s3_uri = res["outputDataConfig"]["s3OutputDataConfig"]["s3Uri"]
-                        alt_bucket, alt_prefix = extract_s3_uri(actual_output_s3_uri)
-                        output_key = alt_prefix + "/output.json" if alt_prefix else "output.json"
-                        
-                        output_resp = s3_client.get_object(Bucket=alt_bucket, Key=output_key)
-                        output_json = json.loads(output_resp["Body"].read().decode("utf-8"))
-                        
-                        return output_json['data'][0]['embedding']
-                        
-                elif res["status"] in ("Failed", "Cancelled"):
-                    error_msg = res.get("failureMessage", "Unknown error")
-                    raise ValueError(f"Text embedding async invoke failed: {error_msg}")
-                    
-                time.sleep(2)  # 文本处理较快，2秒间隔
-                attempt += 1
-                
-            except Exception as e:
-                if attempt == max_attempts - 1:
-                    raise e
-                time.sleep(2)
-                attempt += 1
-        
-        raise TimeoutError("Text embedding async invoke timed out")
+        # 轮询结果（文本处理通常很快，2秒间隔）
+        output_json = await poll_async_invoke(region, invocation_arn, 2, 30, 'Text embedding')
+        return output_json['data'][0]['embedding']
         
     except Exception as e:
         print(f"Error in get_text_embedding_from_marengo: {str(e)}")
         raise e
 
-def get_embedding_from_marengo(media_type, s3_uri, bucket_name, search_mode='visual-image'):
-    """使用Marengo模型获取embedding"""
+async def get_embedding_from_marengo(media_type, s3_uri, bucket_name, search_mode='visual-image', region=HOME_REGION):
+    """使用Marengo模型获取embedding（远端区域时输入先复制到该区域的中转桶）"""
+    staged_key = None
     try:
-        # 获取账户ID
-        sts_client = boto3.client('sts')
-        account_id = sts_client.get_caller_identity()['Account']
+        # 获取账户ID（容器内缓存）
+        account_id = await asyncio.to_thread(get_account_id)
+        
+        regional_bedrock = bedrock_router.client('bedrock-runtime', region)
+        input_uri = s3_uri
+        if region != HOME_REGION:
+            staged_key, input_uri = await call_downstream('s3', bedrock_router.stage_input, region, s3_uri)
+            bucket_name = bedrock_router.output_bucket(region)
         
         # 生成输出路径
         output_key = f"bedrock-outputs/{uuid.uuid4()}/result.json"
@@ -201,7 +481,7 @@ def get_embedding_from_marengo(media_type, s3_uri, bucket_name, search_mode='vis
                 "inputType": "image",
                 "mediaSource": {
                     "s3Location": {
-                        "uri": s3_uri,
+                        "uri": input_uri,
                         "bucketOwner": account_id
                     }
                 }
@@ -211,7 +491,7 @@ def get_embedding_from_marengo(media_type, s3_uri, bucket_name, search_mode='vis
                 "inputType": "video",
                 "mediaSource": {
                     "s3Location": {
-                        "uri": s3_uri,
+                        "uri": input_uri,
                         "bucketOwner": account_id
                     }
                 }
@@ -222,7 +502,7 @@ def get_embedding_from_marengo(media_type, s3_uri, bucket_name, search_mode='vis
                 "inputType": "audio",
                 "mediaSource": {
                     "s3Location": {
-                        "uri": s3_uri,
+                        "uri": input_uri,
                         "bucketOwner": account_id
                     }
                 }
@@ -240,7 +520,9 @@ def get_embedding_from_marengo(media_type, s3_uri, bucket_name, search_mode='vis
         print(f"Starting async invoke with output to: {output_s3_uri}")
         
         # 发起异步调用
-        start_resp = bedrock_client.start_async_invoke(
+        start_resp = await call_downstream(
+            'bedrock',
+            regional_bedrock.start_async_invoke,
             modelId=MARENG0_MODEL_ID,
             modelInput=model_input,
             outputDataConfig=output_data_config
@@ -250,61 +532,26 @@ def get_embedding_from_marengo(media_type, s3_uri, bucket_name, search_mode='vis
         print("Invocation ARN:", invocation_arn)
         
         # 轮询结果
-        max_attempts = 60
-        attempt = 0
+        output_json = await poll_async_invoke(region, invocation_arn, 5, 60, 'Embedding')
         
-        while attempt < max_attempts:
-            try:
-                res = bedrock_client.get_async_invoke(invocationArn=invocation_arn)
-                print(f"Status (attempt {attempt + 1}): {res['status']}")
-                
-                if res["status"] == "Completed":
-                    # 读取结果
-                    if "outputDataConfig" in res and "s3OutputDataConfig" in res["outputDataConfig"]:
-                        actual_output_s3_uri = res["outputDataConfig"]["s3OutputDataConfig"]["s3Uri"]
-                        alt_bucket, alt_prefix = extract_s3_uri(actual_output_s3_uri)
-                        output_key = alt_prefix + "/output.json" if alt_prefix else "output.json"
-
-                        output_resp = s3_client.get_object(Bucket=alt_bucket, Key=output_key)
-                        output_json = json.loads(output_resp["Body"].read().decode("utf-8"))
-                        
-                        # 根据搜索模式返回对应的embedding
-                        if media_type == "audio":
-                            # 音频文件直接返回embedding
-                            return output_json["data"][0]['embedding']
-                        elif media_type == "video":
-                            # 视频文件根据搜索模式返回对应embedding
-                            for item in output_json["data"]:
-                                if search_mode == 'visual-image' and item.get("embeddingOption") == "visual-image":
-                                    return item["embedding"]
-                                elif search_mode == 'visual-text' and item.get("embeddingOption") == "visual-text":
-                                    return item["embedding"]
-                                elif search_mode == 'audio' and item.get("embeddingOption") == "audio":
-                                    return item["embedding"]
-                            # 如果没有找到对应模式，返回第一个
-                            return output_json["data"][0]["embedding"]
-                        else:
-                            # 图片文件直接返回embedding
-                            return output_json["data"][0]['embedding']
-                        
-                elif res["status"] in ("Failed", "Cancelled"):
-                    error_msg = res.get("failureMessage", "Unknown error")
-                    raise ValueError(f"Async invoke failed: {error_msg}")
-                    
-                time.sleep(5)
-                attempt += 1
-                
-            except Exception as e:
-                if attempt == max_attempts - 1:
-                    raise e
-                time.sleep(5)
-                attempt += 1
-            
-        raise TimeoutError("Async invoke timed out after maximum attempts")
+        # 根据搜索模式返回对应的embedding
+        if media_type == "video":
+            # 视频文件根据搜索模式返回对应embedding
+            for item in output_json["data"]:
+                if item.get("embeddingOption") == search_mode:
+                    return item["embedding"]
+            # 如果没有找到对应模式，返回第一个
+            return output_json["data"][0]["embedding"]
+        
+        # 图片和音频文件直接返回embedding
+        return output_json["data"][0]['embedding']
             
     except Exception as e:
         print(f"Error in get_embedding_from_marengo: {str(e)}")
         raise e
+    finally:
+        if staged_key:
+            await call_downstream('s3', bedrock_router.delete_staged_input, region, staged_key)
 
 def extract_s3_uri(s3_uri):
     """从S3 URI中提取bucket和prefix"""
@@ -318,30 +565,12 @@ def extract_s3_uri(s3_uri):
     
     return bucket, prefix
 
-def get_opensearch_client():
-    """初始化OpenSearch客户端"""
-    if not OPENSEARCH_ENDPOINT:
-        raise ValueError("OPENSEARCH_ENDPOINT environment variable not set")
-    
-    host = OPENSEARCH_ENDPOINT.replace("https://", "")
-    region = os.environ.get('AWS_REGION', 'us-east-1')
-    
-    credentials = boto3.Session().get_credentials()
-    auth = AWSV4SignerAuth(credentials, region, 'aoss')
-    
-    client = OpenSearch(
-        hosts=[{'host': host, 'port': 443}],
-        http_auth=auth,
-        use_ssl=True,
-        verify_certs=True,
-        connection_class=RequestsHttpConnection,
-        pool_maxsize=20
-    )
-    return client
-
-def search_similar_embeddings(client, query_embedding, embedding_field, search_media_type='file', top_k=20):
-    """在OpenSearch中搜索相似embedding - 智能跨模态搜索"""
-    results = []
+def build_knn_searches(query_embedding, embedding_field, search_media_type='file', top_k=20):
+    """
+    根据搜索类型和目标媒体类型构建kNN子查询 - 智能跨模态搜索
+    返回 [(search_embedding_type, target_embedding_type, search_body), ...]
+    """
+    searches = []
     embedding_types = ['visual_embedding', 'text_embedding', 'audio_embedding']
     
     # 根据搜索类型和目标媒体类型进行智能匹配
@@ -420,50 +649,75 @@ def search_similar_embeddings(client, query_embedding, embedding_field, search_m
                 "_source": ["s3_uri", "file_type", "timestamp", "media_type", "segment_index", "start_time", "end_time", "duration"]
             }
             
-            print(f"Searching for {search_embedding_type} with {target_embedding_type} in OpenSearch index: {OPENSEARCH_INDEX}")
-            
-            response = client.search(index=OPENSEARCH_INDEX, body=search_body)
-            
-            for hit in response['hits']['hits']:
-                source = hit['_source']
-                score = hit['_score']
-                
-                # 生成预签名URL
-                s3_key = source['s3_uri'].replace(f's3://{UPLOAD_BUCKET}/', '')
-                image_url = s3_client.generate_presigned_url(
-                    'get_object',
-                    Params={'Bucket': UPLOAD_BUCKET, 'Key': s3_key},
-                    ExpiresIn=3600
-                )
-                
-                results.append({
-                    'id': hit['_id'],
-                    'score': score,
-                    'similarity_percentage': f"{(score * 100):.2f}%",
-                    's3_uri': source['s3_uri'],
-                    'search_media_type': search_media_type,
-                    'search_embedding_type': search_embedding_type,
-                    'target_embedding_type': target_embedding_type,
-                    'media_type': source.get('media_type', 'unknown'),
-                    'file_type': source['file_type'],
-                    'timestamp': source['timestamp'],
-                    'image_url': image_url,
-                    'segment_index': source.get('segment_index'),
-                    'start_time': source.get('start_time'),
-                    'end_time': source.get('end_time'),
-                    'duration': source.get('duration')
-                })
-    
-    # 按分数排序并返回前top_k个结果
+            searches.append((search_embedding_type, target_embedding_type, search_body))
+    
+    return searches
+
+def collect_hit(hit, search_media_type, search_embedding_type, target_embedding_type):
+    """
+    把OpenSearch命中转换为中间结果
+    只保存稳定的asset_id（上传桶中的对象键），访问URL由搜索API的/urls接口按需批量签发
+    """
+    source = hit['_source']
+    score = hit['_score']
+    
+    return {
+        'id': hit['_id'],
+        'score': score,
+        'similarity_percentage': f"{(score * 100):.2f}%",
+        's3_uri': source['s3_uri'],
+        'search_media_type': search_media_type,
+        'search_embedding_type': search_embedding_type,
+        'target_embedding_type': target_embedding_type,
+        'media_type': source.get('media_type', 'unknown'),
+        'file_type': source['file_type'],
+        'timestamp': source['timestamp'],
+        'asset_id': source['s3_uri'].replace(f's3://{UPLOAD_BUCKET}/', ''),
+        'segment_index': source.get('segment_index'),
+        'start_time': source.get('start_time'),
+        'end_time': source.get('end_time'),
+        'duration': source.get('duration')
+    }
+
+def get_asset_derivatives(asset_ids):
+    """从素材目录批量读取ingest时生成的衍生文件（缩略图/封面/预览），返回 {asset_id: derivatives}"""
+    derivatives = {}
+    asset_ids = list(dict.fromkeys(asset_ids))
+    
+    try:
+        # BatchGetItem每次最多100个键
+        for start in range(0, len(asset_ids), 100):
+            request = {
+                CATALOG_TABLE_NAME: {
+                    'Keys': [{'asset_key': asset_id} for asset_id in asset_ids[start:start + 100]],
+                    'ProjectionExpression': 'asset_key, derivatives'
+                }
+            }
+            while request:
+                response = dynamodb.batch_get_item(RequestItems=request)
+                for item in response['Responses'].get(CATALOG_TABLE_NAME, []):
+                    if item.get('derivatives'):
+                        derivatives[item['asset_key']] = item['derivatives']
+                request = response.get('UnprocessedKeys')
+    except Exception as e:
+        print(f"Failed to load asset derivatives: {str(e)}")
+        # 不抛出异常，没有衍生文件时前端回退到原文件
+    
+    return derivatives
+
+def format_results(results):
+    """按分数排序并转换为API返回格式"""
     results.sort(key=lambda x: x['score'], reverse=True)
     all_hits = results  # [:top_k]
+    derivatives = get_asset_derivatives([hit['asset_id'] for hit in all_hits])
     
     return [{
         'score': hit['score'],
         's3_uri': hit['s3_uri'],
         'file_type': hit['file_type'],
         'timestamp': hit['timestamp'],
-        'image_url': hit['image_url'],
+        'asset_id': hit['asset_id'],
+        'derivatives': derivatives.get(hit['asset_id'], {}),
         'segment_info': {
             'segment_index': hit.get('segment_index'),
             'start_time': hit.get('start_time'),
@@ -478,8 +732,50 @@ def search_similar_embeddings(client, query_embedding, embedding_field, search_m
         }
     } for hit in all_hits]
 
-def update_search_status(search_id, status, results=None, error=None):
-    """更新搜索任务状态"""
+async def search_similar_embeddings(client, query_embedding, embedding_field, search_media_type='file', top_k=20):
+    """在OpenSearch中搜索相似embedding - 智能跨模态搜索（各子查询并发执行）"""
+    knn_searches = build_knn_searches(query_embedding, embedding_field, search_media_type, top_k)
+    for search_embedding_type, target_embedding_type, _ in knn_searches:
+        print(f"Searching for {search_embedding_type} with {target_embedding_type} in OpenSearch index: {OPENSEARCH_INDEX}")
+    
+    responses = await asyncio.gather(*(
+        call_downstream('opensearch', client.search, index=OPENSEARCH_INDEX, body=search_body)
+        for _, _, search_body in knn_searches
+    ))
+    
+    results = []
+    for (search_embedding_type, target_embedding_type, _), response in zip(knn_searches, responses):
+        for hit in response['hits']['hits']:
+            results.append(collect_hit(hit, search_media_type, search_embedding_type, target_embedding_type))
+    
+    return await call_downstream('dynamodb', format_results, results)
+
+def store_results_blob(search_id, payload):
+    """把搜索结果以gzip压缩的JSON写入S3，返回对象键"""
+    results_key = f"{RESULTS_PREFIX}{search_id}.json.gz"
+    s3_client.put_object(
+        Bucket=UPLOAD_BUCKET,
+        Key=results_key,
+        Body=gzip.compress(payload.encode('utf-8')),
+        ContentType='application/json',
+        ContentEncoding='gzip'
+    )
+    print(f"Stored {len(payload)} bytes of results at s3://{UPLOAD_BUCKET}/{results_key}")
+    return results_key
+
+def get_search_status(search_id):
+    """读取搜索任务的当前状态（强一致读，刚写入的终态也能读到）"""
+    table = dynamodb.Table(SEARCH_TABLE_NAME)
+    item = table.get_item(
+        Key={'search_id': search_id},
+        ConsistentRead=True,
+        ProjectionExpression='#status',
+        ExpressionAttributeNames={'#status': 'status'}
+    ).get('Item') or {}
+    return item.get('status')
+
+def update_search_status(search_id, status, results=None, error=None, timings=None, trace_id=None):
+    """更新搜索任务状态（结束时附带分阶段耗时和trace_id）；失败时抛出异常，消息随后重新投递"""
     try:
         table = dynamodb.Table(SEARCH_TABLE_NAME)
         
@@ -491,14 +787,26 @@ def update_search_status(search_id, status, results=None, error=None):
         }
         
         if results is not None:
-            update_expression += ", results = :results"
-            expression_attribute_values[":results"] = json.dumps(results)
+            # 紧凑序列化；超过阈值时gzip压缩后存入S3，DynamoDB只保存指针
+            payload = json.dumps(results, separators=(',', ':'))
+            if len(payload) > RESULTS_INLINE_LIMIT:
+                results_key = store_results_blob(search_id, payload)
+                update_expression += ", results_key = :results_key"
+                expression_attribute_values[":results_key"] = results_key
+            else:
+                update_expression += ", results = :results"
+                expression_attribute_values[":results"] = payload
             
         if error is not None:
             update_expression += ", #error = :error"
             expression_attribute_names["#error"] = "error"
             expression_attribute_values[":error"] = error
         
+        if timings is not None:
+            update_expression += ", timings = :timings, trace_id = :trace_id"
+            expression_attribute_values[":timings"] = timings
+            expression_attribute_values[":trace_id"] = trace_id
+        
         table.update_item(
             Key={'search_id': search_id},
             UpdateExpression=update_expression,
@@ -509,4 +817,5 @@ def update_search_status(search_id, status, results=None, error=None):
         print(f"Updated search {search_id} status to {status}")
         
     except Exception as e:
-        print(f"Error updating search status: {str(e)}")
\ No newline at end of file
+        print(f"Error updating search status: {str(e)}")
+        raise
\ No newline at end of file
@@ -12,6 +12,10 @@ UPLOAD_BUCKET_NAME = f"{SERVICE_PREFIX}-uploads"
 OPENSEARCH_COLLECTION_NAME = f"{SERVICE_PREFIX}-embeddings"
 CLOUDFRONT_DISTRIBUTION_NAME = f"{SERVICE_PREFIX}-cdn"
 
+# 多区域Bedrock路由（可选）：JSON列表，每项包含该区域的中转桶，例如
+# [{"region": "us-west-2", "outputBucket": "my-usw2-bedrock-staging", "maxConcurrency": 4, "transferCostPerGb": 0.02}]
+BEDROCK_REGIONS = os.getenv("BEDROCK_REGIONS", "[]")
+
 # 环境配置
 ENVIRONMENT = os.getenv("ENVIRONMENT", "dev")
 AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
\ No newline at end of file
@@ -29,7 +29,8 @@ echo "   AWS区域: $AWS_REGION"
 # 构建OpenSearch Layer
 echo "🔧 构建OpenSearch Layer..."
 cd backend/layers/opensearch_layer
-if [ ! -d "python" ]; then
+# python/warm_clients（共享客户端包）随仓库提供，只需安装opensearch-py
+if [ ! -d "python/opensearchpy" ]; then
     mkdir -p python
     pip3 install opensearch-py==2.8.0 -t python/
     echo "✅ OpenSearch Layer构建完成"
@@ -38,6 +39,21 @@ else
 fi
 cd ../../../
 
+# 构建媒体处理Layer（Pillow需要Lambda平台的二进制包）
+echo "🔧 构建媒体处理Layer..."
+cd backend/layers/media_layer
+if [ ! -d "python" ]; then
+    mkdir -p python
+    pip3 install -r requirements.txt -t python/ --platform manylinux2014_x86_64 --python-version 3.11 --only-binary=:all:
+    echo "✅ 媒体处理Layer构建完成"
+else
+    echo "✅ 媒体处理Layer已存在"
+fi
+if [ ! -x "bin/ffmpeg" ]; then
+    echo "ℹ️  未找到 backend/layers/media_layer/bin/ffmpeg，视频封面和预览将被跳过（可放入静态编译的ffmpeg启用）"
+fi
+cd ../../../
+
 # 安装CDK依赖
 echo "📦 安装CDK依赖..."
 cd infrastructure
@@ -5,12 +5,13 @@ from aws_cdk import (
     aws_s3 as s3,
     aws_cloudfront as cloudfront,
     aws_cloudfront_origins as origins,
-    aws_s3_notifications as s3n,
     aws_opensearchserverless as opensearch,
     aws_iam as iam,
     aws_dynamodb as dynamodb,
     aws_sqs as sqs,
     aws_lambda_event_sources as lambda_event_sources,
+    aws_events as events,
+    aws_events_targets as targets,
     Duration,
     RemovalPolicy
 )
@@ -26,7 +27,8 @@ from config.settings import (
     API_GATEWAY_NAME,
     S3_BUCKET_NAME,
     CLOUDFRONT_DISTRIBUTION_NAME,
-    SERVICE_PREFIX
+    SERVICE_PREFIX,
+    BEDROCK_REGIONS
 )
 
 class CloudscapeStack(Stack):
@@ -41,6 +43,14 @@ class CloudscapeStack(Stack):
             layer_version_name=f"{SERVICE_PREFIX}-opensearch"
         )
         
+        # 媒体处理Layer：Pillow（WebP缩略图），可选在bin/放入静态ffmpeg（视频封面和预览）
+        media_layer = _lambda.LayerVersion(
+            self, "MediaLayer",
+            code=_lambda.Code.from_asset("../backend/layers/media_layer"),
+            compatible_runtimes=[_lambda.Runtime.PYTHON_3_11],
+            layer_version_name=f"{SERVICE_PREFIX}-media"
+        )
+        
         # Lambda函数
         lambda_function = _lambda.Function(
             self, "ApiFunction",
@@ -90,7 +100,28 @@ class CloudscapeStack(Stack):
             self, "UploadBucket",
             bucket_name=f"{SERVICE_PREFIX}-uploads",
             removal_policy=RemovalPolicy.DESTROY,
-            auto_delete_objects=True
+            auto_delete_objects=True,
+            # 浏览器通过预签名URL直接分片上传，需要暴露ETag
+            cors=[s3.CorsRule(
+                allowed_methods=[s3.HttpMethods.PUT, s3.HttpMethods.POST, s3.HttpMethods.GET],
+                allowed_origins=["*"],
+                allowed_headers=["*"],
+                exposed_headers=["ETag"],
+                max_age=3000
+            )],
+            # 清理未完成的分片上传
+            lifecycle_rules=[
+                s3.LifecycleRule(
+                    abort_incomplete_multipart_upload_after=Duration.days(1)
+                ),
+                # 转存到S3的搜索结果只需保留到客户端取回
+                s3.LifecycleRule(
+                    prefix="search-results/",
+                    expiration=Duration.days(7)
+                )
+            ],
+            # 通过EventBridge转发查询文件上传事件（与原生S3通知互不冲突）
+            event_bridge_enabled=True
         )
         
         # 给Lambda授权访问上传存储桶
@@ -102,6 +133,8 @@ class CloudscapeStack(Stack):
             table_name=f"{SERVICE_PREFIX}-search-tasks",
             partition_key=dynamodb.Attribute(name="search_id", type=dynamodb.AttributeType.STRING),
             billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            # 查询合并指针（query#<key>）到期自动删除
+            time_to_live_attribute="expires_at",
             removal_policy=RemovalPolicy.DESTROY
         )
         
@@ -114,11 +147,70 @@ class CloudscapeStack(Stack):
             removal_policy=RemovalPolicy.DESTROY
         )
         
-        # SQS队列处理搜索任务
+        # 稀疏索引：只有processing/retrying记录带active_status，供卡住任务清理按last_updated查询
+        status_table.add_global_secondary_index(
+            index_name="active-status-index",
+            partition_key=dynamodb.Attribute(name="active_status", type=dynamodb.AttributeType.STRING),
+            sort_key=dynamodb.Attribute(name="last_updated", type=dynamodb.AttributeType.STRING),
+            projection_type=dynamodb.ProjectionType.ALL
+        )
+        
+        # DynamoDB表 - 素材目录（每个素材一条记录，由embedding流水线增量维护）
+        catalog_table = dynamodb.Table(
+            self, "AssetCatalogTable",
+            table_name=f"{SERVICE_PREFIX}-asset-catalog",
+            partition_key=dynamodb.Attribute(name="asset_key", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY
+        )
+        
+        # 按上传时间排序的GSI，/api/materials通过单分区Query分页读取
+        catalog_table.add_global_secondary_index(
+            index_name="catalog-by-time",
+            partition_key=dynamodb.Attribute(name="catalog_pk", type=dynamodb.AttributeType.STRING),
+            sort_key=dynamodb.Attribute(name="last_modified", type=dynamodb.AttributeType.STRING)
+        )
+        
+        # 按状态的GSI，/api/stats按状态计数（只投影键，计数时读取量最小）
+        catalog_table.add_global_secondary_index(
+            index_name="catalog-status-index",
+            partition_key=dynamodb.Attribute(name="status", type=dynamodb.AttributeType.STRING),
+            projection_type=dynamodb.ProjectionType.KEYS_ONLY
+        )
+        
+        # DynamoDB表 - 后台维护任务（清库等）进度
+        jobs_table = dynamodb.Table(
+            self, "MaintenanceJobsTable",
+            table_name=f"{SERVICE_PREFIX}-maintenance-jobs",
+            partition_key=dynamodb.Attribute(name="job_id", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY
+        )
+        
+        # DynamoDB表 - Bedrock调用的AIMD自适应并发控制状态：embedding各通道和search worker共用一个marengo池
+        # （远端区域各一个marengo@<region>池），各摄取通道按份额占用共享上限
+        concurrency_table = dynamodb.Table(
+            self, "ConcurrencyTable",
+            table_name=f"{SERVICE_PREFIX}-concurrency",
+            partition_key=dynamodb.Attribute(name="pool", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY
+        )
+        
+        # SQS队列处理搜索任务；worker逐条报告失败的消息，反复失败的消息转入死信队列
+        search_dlq = sqs.Queue(
+            self, "SearchDLQ",
+            queue_name=f"{SERVICE_PREFIX}-search-dlq",
+            retention_period=Duration.days(4)
+        )
         search_queue = sqs.Queue(
             self, "SearchQueue",
             queue_name=f"{SERVICE_PREFIX}-search-queue",
-            visibility_timeout=Duration.minutes(10)
+            visibility_timeout=Duration.minutes(10),
+            dead_letter_queue=sqs.DeadLetterQueue(
+                max_receive_count=3,
+                queue=search_dlq
+            )
         )
         
         # Embedding处理队列和死信队列
@@ -128,28 +220,26 @@ class CloudscapeStack(Stack):
             retention_period=Duration.days(14)
         )
         
-        # 延迟重试队列（用于Quota限制重试）- 优化为45秒延迟
-        embedding_retry_queue = sqs.Queue(
-            self, "EmbeddingRetryQueue",
-            queue_name=f"{SERVICE_PREFIX}-embedding-retry-queue",
-            visibility_timeout=Duration.seconds(90),  # 减少到90秒
-            delivery_delay=Duration.seconds(45),  # 45秒延迟，适配1分钟2次quota
-            dead_letter_queue=sqs.DeadLetterQueue(
-                max_receive_count=3,  # 保持3次重试
-                queue=embedding_dlq
+        # 摄取优先级通道：图片、小音视频、大音视频各自排队，长视频积压不再阻塞图片
+        # (通道, 该通道最多占用的Lambda并发)，合计不超过embedding Lambda的保留并发
+        ingest_lanes = [('image', 5), ('media-small', 3), ('media-large', 3)]
+        small_media_max_bytes = 50 * 1024 * 1024
+        
+        # 重试退避由Lambda逐条消息设置（ChangeMessageVisibility + full jitter），
+        # 永久错误和预算耗尽的消息由Lambda直接转入DLQ；maxReceiveCount只是兜底
+        embedding_lane_queues = {}
+        for lane, _ in ingest_lanes:
+            lane_id = "".join(part.capitalize() for part in lane.split('-'))
+            embedding_lane_queues[lane] = sqs.Queue(
+                self, f"Embedding{lane_id}Queue",
+                queue_name=f"{SERVICE_PREFIX}-embedding-{lane}-queue",
+                visibility_timeout=Duration.minutes(6),  # 不小于Lambda超时
+                dead_letter_queue=sqs.DeadLetterQueue(
+                    max_receive_count=30,  # 限流重试不计入失败预算，兜底上限放宽
+                    queue=embedding_dlq
+                ),
+                receive_message_wait_time=Duration.seconds(20)
             )
-        )
-        
-        embedding_queue = sqs.Queue(
-            self, "EmbeddingQueue",
-            queue_name=f"{SERVICE_PREFIX}-embedding-queue",
-            visibility_timeout=Duration.seconds(90),  # 减少到90秒
-            dead_letter_queue=sqs.DeadLetterQueue(
-                max_receive_count=2,  # 主队列重试2次后转到延迟队列
-                queue=embedding_retry_queue  # 失败后转到延迟队列
-            ),
-            receive_message_wait_time=Duration.seconds(20)
-        )
         
         # Embedding处理Lambda - 设置并发限制
         embedding_function = _lambda.Function(
@@ -160,8 +250,22 @@ class CloudscapeStack(Stack):
             code=_lambda.Code.from_asset("../backend/embedding"),
             timeout=Duration.minutes(5),
             memory_size=1024,
-            layers=[opensearch_layer],
-            reserved_concurrent_executions=1  # 限制并发为1，避免quota超限
+            layers=[opensearch_layer, media_layer],
+            # Bedrock并发由共享AIMD池按通道份额限制，这里只是各通道Lambda并发之和
+            reserved_concurrent_executions=11
+        )
+        
+        # 衍生文件Lambda - 与embedding共用代码包，异步生成视频封面/预览/关键帧索引（ffmpeg耗时不占用embedding的超时）
+        derivatives_function = _lambda.Function(
+            self, "DerivativesFunction",
+            function_name=f"{SERVICE_PREFIX}-derivatives",
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            handler="main.derivatives_handler",
+            code=_lambda.Code.from_asset("../backend/embedding"),
+            timeout=Duration.minutes(5),
+            memory_size=2048,
+            layers=[opensearch_layer, media_layer],
+            retry_attempts=0
         )
         
         # 搜索API Lambda - 快速返回搜索ID
@@ -173,6 +277,7 @@ class CloudscapeStack(Stack):
             code=_lambda.Code.from_asset("../backend/search_api"),
             timeout=Duration.seconds(30),
             memory_size=512,
+            layers=[opensearch_layer, media_layer],  # 共享客户端包；/clip?cut=1 使用ffmpeg截取片段
             environment={
                 "SEARCH_TABLE_NAME": search_table.table_name,
                 "SEARCH_QUEUE_URL": search_queue.queue_url,
@@ -196,6 +301,26 @@ class CloudscapeStack(Stack):
             }
         )
         
+        # 维护Lambda - 异步执行可续跑的清库任务
+        maintenance_function_name = f"{SERVICE_PREFIX}-maintenance"
+        maintenance_function = _lambda.Function(
+            self, "MaintenanceFunction",
+            function_name=maintenance_function_name,
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            handler="main.handler",
+            code=_lambda.Code.from_asset("../backend/maintenance"),
+            timeout=Duration.minutes(15),
+            memory_size=512,
+            layers=[opensearch_layer],
+            environment={
+                "UPLOAD_BUCKET": upload_bucket.bucket_name,
+                "JOBS_TABLE_NAME": jobs_table.table_name,
+                "SEARCH_TABLE_NAME": search_table.table_name,
+                "STATUS_TABLE_NAME": status_table.table_name,
+                "CATALOG_TABLE_NAME": catalog_table.table_name
+            }
+        )
+        
         # OpenSearch Serverless安全策略
         encryption_policy = opensearch.CfnSecurityPolicy(
             self, "EncryptionPolicy",
@@ -259,14 +384,28 @@ class CloudscapeStack(Stack):
         lambda_function.add_environment("OPENSEARCH_ENDPOINT", opensearch_collection.attr_collection_endpoint)
         lambda_function.add_environment("OPENSEARCH_INDEX", "embeddings")
         lambda_function.add_environment("STATUS_TABLE_NAME", status_table.table_name)
+        lambda_function.add_environment("CATALOG_TABLE_NAME", catalog_table.table_name)
         
         embedding_function.add_environment("OPENSEARCH_ENDPOINT", opensearch_collection.attr_collection_endpoint)
         embedding_function.add_environment("OPENSEARCH_INDEX", "embeddings")
         embedding_function.add_environment("STATUS_TABLE_NAME", status_table.table_name)
+        embedding_function.add_environment("CATALOG_TABLE_NAME", catalog_table.table_name)
+        embedding_function.add_environment("DERIVATIVES_FUNCTION_NAME", derivatives_function.function_name)
+        derivatives_function.add_environment("CATALOG_TABLE_NAME", catalog_table.table_name)
+        search_worker_function.add_environment("CATALOG_TABLE_NAME", catalog_table.table_name)
+        for func in [embedding_function, search_worker_function]:
+            func.add_environment("CONCURRENCY_TABLE_NAME", concurrency_table.table_name)
+            concurrency_table.grant_read_write_data(func)
         
         search_worker_function.add_environment("OPENSEARCH_ENDPOINT", opensearch_collection.attr_collection_endpoint)
         search_worker_function.add_environment("OPENSEARCH_INDEX", "embeddings")
         
+        maintenance_function.add_environment("OPENSEARCH_ENDPOINT", opensearch_collection.attr_collection_endpoint)
+        maintenance_function.add_environment("OPENSEARCH_INDEX", "embeddings")
+        
+        lambda_function.add_environment("JOBS_TABLE_NAME", jobs_table.table_name)
+        lambda_function.add_environment("MAINTENANCE_FUNCTION_NAME", maintenance_function.function_name)
+        
         # search_function已经被重命名为search_api_function和search_worker_function
         
         # 给Embedding Lambda授权
@@ -275,21 +414,54 @@ class CloudscapeStack(Stack):
         search_table.grant_read_write_data(search_worker_function)
         status_table.grant_read_write_data(embedding_function)
         status_table.grant_read_write_data(lambda_function)
+        catalog_table.grant_read_write_data(embedding_function)
+        catalog_table.grant_read_write_data(derivatives_function)
+        derivatives_function.grant_invoke(embedding_function)
+        catalog_table.grant_read_write_data(lambda_function)
+        catalog_table.grant_read_data(search_worker_function)
+        jobs_table.grant_read_write_data(lambda_function)
+        jobs_table.grant_read_write_data(maintenance_function)
+        search_table.grant_read_write_data(maintenance_function)
+        status_table.grant_read_write_data(maintenance_function)
+        catalog_table.grant_read_write_data(maintenance_function)
+        maintenance_function.grant_invoke(lambda_function)
+        
+        # 维护Lambda续跑时异步调用自身（使用固定函数名构造ARN，避免循环依赖）
+        maintenance_function.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["lambda:InvokeFunction"],
+                resources=[f"arn:aws:lambda:{self.region}:{self.account}:function:{maintenance_function_name}"]
+            )
+        )
         search_queue.grant_send_messages(search_api_function)
         search_queue.grant_consume_messages(search_worker_function)
         
         # Embedding队列授权
-        embedding_queue.grant_consume_messages(embedding_function)
-        embedding_retry_queue.grant_consume_messages(embedding_function)
+        for queue in embedding_lane_queues.values():
+            queue.grant_consume_messages(embedding_function)
+            # 卡住任务清理时重新入队
+            queue.grant_send_messages(embedding_function)
+        embedding_function.add_environment("EMBEDDING_QUEUE_URLS", json.dumps(
+            {lane: queue.queue_url for lane, queue in embedding_lane_queues.items()}
+        ))
         embedding_dlq.grant_send_messages(embedding_function)
+        embedding_function.add_environment("EMBEDDING_DLQ_URL", embedding_dlq.queue_url)
+        embedding_function.add_environment("SMALL_MEDIA_MAX_BYTES", str(small_media_max_bytes))
         
-        # SQS触发器
+        # SQS触发器（worker在事件循环中并发处理整批消息，短批处理窗口兼顾交互延迟）；
+        # 只有处理失败的消息重新投递，已结束的搜索在重投时由worker跳过
         search_worker_function.add_event_source(
-            lambda_event_sources.SqsEventSource(search_queue, batch_size=1)
+            lambda_event_sources.SqsEventSource(
+                search_queue,
+                batch_size=10,
+                max_batching_window=Duration.seconds(1),
+                report_batch_item_failures=True
+            )
         )
         
         # 给Lambda授权
-        for func in [lambda_function, embedding_function, search_api_function, search_worker_function]:
+        for func in [lambda_function, embedding_function, search_api_function, search_worker_function, maintenance_function]:
             func.add_to_role_policy(
                 iam.PolicyStatement(
                     effect=iam.Effect.ALLOW,
@@ -311,7 +483,9 @@ class CloudscapeStack(Stack):
                         "s3:PutObject",
                         "s3:DeleteObject",
                         "s3:ListBucket",
-                        "s3:GetBucketLocation"
+                        "s3:GetBucketLocation",
+                        "s3:AbortMultipartUpload",
+                        "s3:ListMultipartUploadParts"
                     ],
                     resources=[
                         upload_bucket.bucket_arn,
@@ -347,6 +521,7 @@ class CloudscapeStack(Stack):
             )
         
         upload_bucket.grant_read(embedding_function)
+        upload_bucket.grant_read_write(derivatives_function)
         upload_bucket.grant_write(search_api_function)
         upload_bucket.grant_read(search_api_function)
         upload_bucket.grant_write(search_worker_function)
@@ -381,30 +556,122 @@ class CloudscapeStack(Stack):
         for func in [embedding_function, search_worker_function]:
             func.add_environment("BEDROCK_SERVICE_ROLE_ARN", bedrock_service_role.role_arn)
         
-        # S3触发器改为发送到SQS队列
-        upload_bucket.add_event_notification(
-            s3.EventType.OBJECT_CREATED,
-            s3n.SqsDestination(embedding_queue)
-        )
+        # 多区域Bedrock路由：远端区域的中转桶由各区域自行创建（建议对bedrock-inputs/和bedrock-outputs/设置过期规则）
+        remote_staging_buckets = [config['outputBucket'] for config in json.loads(BEDROCK_REGIONS)]
+        for func in [embedding_function, search_worker_function]:
+            func.add_environment("BEDROCK_REGIONS", BEDROCK_REGIONS)
+            if remote_staging_buckets:
+                func.add_to_role_policy(
+                    iam.PolicyStatement(
+                        effect=iam.Effect.ALLOW,
+                        actions=["s3:GetObject", "s3:PutObject", "s3:DeleteObject"],
+                        resources=[f"arn:aws:s3:::{bucket}/*" for bucket in remote_staging_buckets]
+                    )
+                )
         
-        # SQS触发器处理embedding
-        embedding_function.add_event_source(
-            lambda_event_sources.SqsEventSource(
-                embedding_queue, 
-                batch_size=1,
-                max_batching_window=Duration.seconds(5)
+        # 上传对象经EventBridge按类型和大小路由到各通道队列
+        # 只匹配uploads/前缀，bedrock-outputs/、temp/、衍生文件等写入不会唤醒embedding Lambda
+        image_keys = [{"wildcard": f"uploads/*.{ext}"} for ext in ['png', 'jpeg', 'jpg', 'webp']]
+        media_keys = [{"wildcard": f"uploads/*.{ext}"} for ext in ['mp4', 'mov', 'wav', 'mp3', 'm4a']]
+        lane_object_patterns = {
+            'image': {"key": image_keys},
+            'media-small': {"key": media_keys, "size": [{"numeric": ["<", small_media_max_bytes]}]},
+            'media-large': {"key": media_keys, "size": [{"numeric": [">=", small_media_max_bytes]}]}
+        }
+        for lane, object_pattern in lane_object_patterns.items():
+            lane_id = "".join(part.capitalize() for part in lane.split('-'))
+            lane_rule = events.Rule(
+                self, f"Ingest{lane_id}Rule",
+                event_pattern=events.EventPattern(
+                    source=["aws.s3"],
+                    detail_type=["Object Created"],
+                    detail={
+                        "bucket": {"name": [upload_bucket.bucket_name]},
+                        "object": object_pattern
+                    }
+                )
+            )
+            lane_rule.add_target(targets.SqsQueue(embedding_lane_queues[lane]))
+        
+        # 查询文件直传到temp/后自动入队搜索任务（客户端也可显式调用/commit）
+        query_upload_rule = events.Rule(
+            self, "QueryUploadRule",
+            event_pattern=events.EventPattern(
+                source=["aws.s3"],
+                detail_type=["Object Created"],
+                detail={
+                    "bucket": {"name": [upload_bucket.bucket_name]},
+                    "object": {"key": [{"prefix": "temp/"}]}
+                }
             )
         )
+        query_upload_rule.add_target(targets.LambdaFunction(search_api_function))
         
-        # 延迟重试队列也使用同一个Lambda处理
-        embedding_function.add_event_source(
-            lambda_event_sources.SqsEventSource(
-                embedding_retry_queue,
-                batch_size=1,
-                max_batching_window=Duration.seconds(5)
+        # 定时清理卡住的embedding任务（恢复已完成的Bedrock调用或重新入队）
+        stale_job_sweep_rule = events.Rule(
+            self, "StaleJobSweepRule",
+            schedule=events.Schedule.rate(Duration.minutes(5))
+        )
+        stale_job_sweep_rule.add_target(targets.LambdaFunction(embedding_function))
+        
+        # DLQ重投Lambda - 定时小批量重投（也可由scripts/redrive_dlq.py手动调用）
+        dlq_redrive_function = _lambda.Function(
+            self, "DlqRedriveFunction",
+            function_name=f"{SERVICE_PREFIX}-dlq-redrive",
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            handler="main.handler",
+            code=_lambda.Code.from_asset("../backend/dlq_redrive"),
+            timeout=Duration.minutes(5),
+            memory_size=256,
+            layers=[opensearch_layer],
+            reserved_concurrent_executions=1,  # 同一时间只有一个重投任务
+            environment={
+                "OPENSEARCH_ENDPOINT": opensearch_collection.attr_collection_endpoint,
+                "OPENSEARCH_INDEX": "embeddings",
+                "STATUS_TABLE_NAME": status_table.table_name,
+                "CATALOG_TABLE_NAME": catalog_table.table_name,
+                "CONCURRENCY_TABLE_NAME": concurrency_table.table_name,
+                "EMBEDDING_DLQ_URL": embedding_dlq.queue_url,
+                "EMBEDDING_QUEUE_URLS": json.dumps(
+                    {lane: queue.queue_url for lane, queue in embedding_lane_queues.items()}
+                ),
+                "SMALL_MEDIA_MAX_BYTES": str(small_media_max_bytes)
+            }
+        )
+        embedding_dlq.grant_consume_messages(dlq_redrive_function)
+        for queue in embedding_lane_queues.values():
+            queue.grant_send_messages(dlq_redrive_function)
+        status_table.grant_read_write_data(dlq_redrive_function)
+        catalog_table.grant_read_write_data(dlq_redrive_function)
+        concurrency_table.grant_read_data(dlq_redrive_function)
+        upload_bucket.grant_read(dlq_redrive_function)
+        dlq_redrive_function.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["aoss:*"],
+                resources=["*"]
             )
         )
         
+        dlq_redrive_rule = events.Rule(
+            self, "DlqRedriveRule",
+            schedule=events.Schedule.rate(Duration.minutes(15))
+        )
+        dlq_redrive_rule.add_target(targets.LambdaFunction(dlq_redrive_function))
+        
+        # SQS触发器处理embedding（部分批处理失败，只重投失败的消息）
+        # 每个通道限制最大并发，保证图片通道始终有可用的Lambda并发
+        for lane, max_concurrency in ingest_lanes:
+            embedding_function.add_event_source(
+                lambda_event_sources.SqsEventSource(
+                    embedding_lane_queues[lane],
+                    batch_size=1,
+                    max_batching_window=Duration.seconds(5),
+                    report_batch_item_failures=True,
+                    max_concurrency=max_concurrency
+                )
+            )
+        
         # 搜索API使用129秒超时，配置CORS支持直接访问
         search_api = apigateway.RestApi(
             self, "SearchApi",
@@ -418,7 +685,7 @@ class CloudscapeStack(Stack):
             default_cors_preflight_options=apigateway.CorsOptions(
                 allow_origins=["*"],
                 allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-                allow_headers=["Content-Type", "X-Amz-Date", "Authorization", "X-Api-Key", "X-Amz-Security-Token"],
+                allow_headers=["Content-Type", "X-Amz-Date", "Authorization", "X-Api-Key", "X-Amz-Security-Token", "Idempotency-Key"],
                 allow_credentials=False
             )
         )
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+回填素材目录表
+为已存在于S3的素材生成目录记录（一次性迁移，之后由embedding流水线增量维护）
+"""
+import boto3
+import os
+import sys
+from datetime import datetime
+from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
+
+# 目录时间格式与Lambda共用opensearch_layer中的定义
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'layers', 'opensearch_layer', 'python'))
+from asset_catalog import utc_timestamp  # noqa: E402
+
+SERVICE_PREFIX = os.environ.get('SERVICE_PREFIX', 'multimodal-search')
+UPLOAD_BUCKET = os.environ.get('UPLOAD_BUCKET', f'{SERVICE_PREFIX}-uploads')
+STATUS_TABLE_NAME = os.environ.get('STATUS_TABLE_NAME', f'{SERVICE_PREFIX}-embedding-status')
+CATALOG_TABLE_NAME = os.environ.get('CATALOG_TABLE_NAME', f'{SERVICE_PREFIX}-asset-catalog')
+OPENSEARCH_ENDPOINT = os.environ.get('OPENSEARCH_ENDPOINT')
+OPENSEARCH_INDEX = os.environ.get('OPENSEARCH_INDEX', 'embeddings')
+ALLOWED_TYPES = ['png', 'jpeg', 'jpg', 'webp', 'mp4', 'mov', 'wav', 'mp3', 'm4a']
+
+def get_opensearch_client():
+    """初始化OpenSearch客户端"""
+    host = OPENSEARCH_ENDPOINT.replace("https://", "")
+    region = os.environ.get('AWS_REGION', boto3.Session().region_name or 'us-east-1')
+
+    credentials = boto3.Session().get_credentials()
+    auth = AWSV4SignerAuth(credentials, region, 'aoss')
+
+    client = OpenSearch(
+        hosts=[{'host': host, 'port': 443}],
+        http_auth=auth,
+        use_ssl=True,
+        verify_certs=True,
+        connection_class=RequestsHttpConnection
+    )
+    return client
+
+def count_segments(client, s3_uri):
+    """用filters聚合一次统计各embedding类型的分段数量（不返回向量数据）"""
+    result = client.search(
+        index=OPENSEARCH_INDEX,
+        body={
+            'size': 0,
+            'query': {'term': {'s3_uri': s3_uri}},
+            'aggs': {
+                'segments': {
+                    'filters': {
+                        'filters': {
+                            'visual': {'exists': {'field': 'visual_embedding'}},
+                            'text': {'exists': {'field': 'text_embedding'}},
+                            'audio': {'exists': {'field': 'audio_embedding'}}
+                        }
+                    }
+                }
+            }
+        }
+    )
+    buckets = result['aggregations']['segments']['buckets']
+    return {name: buckets[name]['doc_count'] for name in ['visual', 'text', 'audio']}
+
+def main():
+    s3_client = boto3.client('s3')
+    dynamodb = boto3.resource('dynamodb')
+    status_table = dynamodb.Table(STATUS_TABLE_NAME)
+    catalog_table = dynamodb.Table(CATALOG_TABLE_NAME)
+    opensearch_client = get_opensearch_client() if OPENSEARCH_ENDPOINT else None
+
+    total = 0
+    paginator = s3_client.get_paginator('list_objects_v2')
+
+    with catalog_table.batch_writer() as batch:
+        for page in paginator.paginate(Bucket=UPLOAD_BUCKET):
+            for obj in page.get('Contents', []):
+                key = obj['Key']
+                if key.startswith(('bedrock-outputs/', 'temp/', 'search-results/', 'derivatives/')):
+                    continue
+
+                s3_uri = f"s3://{UPLOAD_BUCKET}/{key}"
+                file_ext = key.split('.')[-1].lower()
+                segment_counts = {'visual': 0, 'text': 0, 'audio': 0}
+                if opensearch_client and file_ext in ALLOWED_TYPES:
+                    segment_counts = count_segments(opensearch_client, s3_uri)
+
+                status_info = status_table.get_item(Key={'s3_uri': s3_uri}).get('Item') or {}
+
+                if sum(segment_counts.values()) > 0:
+                    status = 'completed'
+                elif file_ext not in ALLOWED_TYPES:
+                    status = 'unsupported'
+                else:
+                    status = status_info.get('status', 'pending')
+
+                item = {
+                    'asset_key': key,
+                    'catalog_pk': 'asset',
+                    's3_uri': s3_uri,
+                    'file_type': file_ext,
+                    'status': status,
+                    'size': obj['Size'],
+                    'retry_count': status_info.get('retry_count', 0),
+                    'segment_counts': segment_counts,
+                    'segment_count': sum(segment_counts.values()),
+                    'last_modified': utc_timestamp(obj['LastModified']),
+                    'updated_at': datetime.now().isoformat()
+                }
+                if status_info.get('last_error'):
+                    item['last_error'] = status_info['last_error']
+                    item['last_error_time'] = status_info.get('last_error_time')
+
+                batch.put_item(Item=item)
+                total += 1
+                print(f"  {key}: {status} {segment_counts}")
+
+    print(f"✅ 已回填 {total} 条素材目录记录")
+
+if __name__ == "__main__":
+    main()
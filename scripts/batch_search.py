@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+批量文本搜索
+从文件读取查询（每行一条），通过 POST /batch 一次提交，长轮询等待结果后输出JSON
+
+用法: SEARCH_API_ENDPOINT=https://xxx.execute-api.us-east-1.amazonaws.com/prod/ python scripts/batch_search.py queries.txt [output.json]
+"""
+import json
+import os
+import sys
+import time
+import requests
+
+SEARCH_API_ENDPOINT = os.environ.get('SEARCH_API_ENDPOINT', '')
+BATCH_SIZE = int(os.environ.get('BATCH_SIZE', '200'))
+TOP_K = int(os.environ.get('TOP_K', '20'))
+WAIT_MS = 20000
+
+def run_batch(queries):
+    """提交一个批次并等待完成，返回每条查询的结果"""
+    response = requests.post(f"{SEARCH_API_ENDPOINT}batch", json={
+        'queries': queries,
+        'topK': TOP_K,
+        'waitMs': WAIT_MS
+    }, timeout=60)
+    response.raise_for_status()
+    result = response.json()
+
+    # 长轮询直到完成
+    while result['status'] not in ('completed', 'failed'):
+        params = {'waitMs': WAIT_MS}
+        if result.get('updated_at'):
+            params['since'] = result['updated_at']
+        response = requests.get(f"{SEARCH_API_ENDPOINT}status/{result['search_id']}", params=params, timeout=60)
+        if response.status_code != 200:
+            time.sleep(int(response.headers.get('Retry-After', '5')))
+            continue
+        result = response.json()
+
+    if result['status'] == 'failed':
+        raise RuntimeError(f"Batch {result['search_id']} failed: {result.get('error')}")
+    if result.get('resultsUrl'):
+        # 大结果转存在S3，响应中只有短期预签名URL
+        response = requests.get(result['resultsUrl'], timeout=60)
+        response.raise_for_status()
+        return response.json()
+    return result['results']
+
+def main():
+    if not SEARCH_API_ENDPOINT or len(sys.argv) < 2:
+        print("用法: SEARCH_API_ENDPOINT=... python scripts/batch_search.py queries.txt [output.json]")
+        sys.exit(1)
+
+    with open(sys.argv[1], encoding='utf-8') as f:
+        queries = [line.strip() for line in f if line.strip()]
+
+    print(f"🚀 共 {len(queries)} 条查询，每批 {BATCH_SIZE} 条")
+    started = time.time()
+    all_results = []
+    for start in range(0, len(queries), BATCH_SIZE):
+        batch = queries[start:start + BATCH_SIZE]
+        batch_results = run_batch(batch)
+        for entry in batch_results:
+            entry['index'] += start
+        all_results.extend(batch_results)
+        print(f"  已完成 {len(all_results)}/{len(queries)}")
+
+    failed = sum(1 for entry in all_results if 'error' in entry)
+    print(f"✅ 完成，用时 {time.time() - started:.1f}s，失败 {failed} 条")
+
+    output = json.dumps(all_results, ensure_ascii=False, indent=2)
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], 'w', encoding='utf-8') as f:
+            f.write(output)
+        print(f"结果已写入 {sys.argv[2]}")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
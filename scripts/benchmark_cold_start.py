@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+冷启动导入耗时基准（导入时间预算检查）
+每个Lambda在全新的Python进程中导入handler模块，测量导入耗时中位数，
+并检查导入阶段没有加载boto3/opensearchpy等重量级依赖；超出预算或提前加载时返回非0
+
+用法:
+    python scripts/benchmark_cold_start.py                    # 全部Lambda，默认预算
+    python scripts/benchmark_cold_start.py --runs 10 --handler app --handler search_api
+    python scripts/benchmark_cold_start.py --budget-ms 80     # 统一覆盖预算
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(ROOT_DIR, 'backend')
+LAYER_DIR = os.path.join(BACKEND_DIR, 'layers', 'opensearch_layer', 'python')
+
+# 各Lambda导入handler模块的耗时预算（毫秒）
+IMPORT_BUDGETS_MS = {
+    'app': 100,
+    'search_api': 100,
+    'search_worker': 100,
+    'embedding': 120,
+    'maintenance': 100,
+    'dlq_redrive': 100
+}
+
+# 导入阶段不应加载的模块（应在首次使用时才导入）
+DEFERRED_MODULES = ['boto3', 'botocore', 'opensearchpy', 'PIL']
+
+# 导入时仅用于读取配置的环境变量
+DUMMY_ENV = {
+    'AWS_REGION': 'us-east-1',
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'UPLOAD_BUCKET': 'benchmark-uploads',
+    'SEARCH_TABLE_NAME': 'benchmark-searches',
+    'SEARCH_QUEUE_URL': 'https://sqs.us-east-1.amazonaws.com/000000000000/benchmark-search',
+    'EMBEDDING_QUEUE_URLS': '{}',
+    'BEDROCK_REGIONS': '[]',
+    'PRIME_ON_INIT': 'false'
+}
+
+# 子进程内执行：计时导入，可选调用一次不访问AWS的路由
+PROBE = r'''
+import json, sys, time
+sys.path[:0] = [{handler_dir!r}, {layer_dir!r}]
+start = time.perf_counter()
+import main
+import_ms = (time.perf_counter() - start) * 1000
+loaded = [name for name in {deferred!r} if name in sys.modules]
+invoke_ms = None
+if {probe_event!r}:
+    start = time.perf_counter()
+    main.handler(json.loads({probe_event!r}), None)
+    invoke_ms = (time.perf_counter() - start) * 1000
+    loaded += [name for name in {deferred!r} if name in sys.modules and name not in loaded]
+print(json.dumps({{'import_ms': import_ms, 'invoke_ms': invoke_ms, 'loaded': loaded}}))
+'''
+
+# 只有app有不访问AWS的健康检查路由
+PROBE_EVENTS = {
+    'app': {'path': '/health', 'httpMethod': 'GET'}
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Lambda冷启动导入耗时基准')
+    parser.add_argument('--handler', action='append', choices=sorted(IMPORT_BUDGETS_MS), help='只测指定Lambda（可重复）')
+    parser.add_argument('--runs', type=int, default=5, help='每个Lambda的冷导入次数')
+    parser.add_argument('--budget-ms', type=float, help='统一覆盖各Lambda的预算')
+    return parser.parse_args()
+
+def measure_once(name):
+    """在全新进程中导入一次handler，返回测量结果"""
+    probe_event = json.dumps(PROBE_EVENTS[name]) if name in PROBE_EVENTS else ''
+    code = PROBE.format(
+        handler_dir=os.path.join(BACKEND_DIR, name),
+        layer_dir=LAYER_DIR,
+        deferred=DEFERRED_MODULES,
+        probe_event=probe_event
+    )
+    env = {**os.environ, **DUMMY_ENV, 'PYTHONDONTWRITEBYTECODE': '1'}
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, env=env,
+                            cwd=os.path.join(BACKEND_DIR, name))
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'import failed')
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def benchmark(name, runs, budget_ms):
+    """多次冷导入取中位数，与预算比较"""
+    try:
+        samples = [measure_once(name) for _ in range(runs)]
+    except Exception as e:
+        print(f"  ❌ {name}: 导入失败 ({str(e)})")
+        return False
+
+    import_ms = statistics.median(s['import_ms'] for s in samples)
+    loaded = sorted({module for s in samples for module in s['loaded']})
+    line = f"{name}: 导入 {import_ms:.1f}ms (预算 {budget_ms:.0f}ms)"
+    if samples[0]['invoke_ms'] is not None:
+        line += f"，首次调用 {statistics.median(s['invoke_ms'] for s in samples):.1f}ms"
+
+    ok = import_ms <= budget_ms and not loaded
+    if loaded:
+        line += f"，提前加载了 {', '.join(loaded)}"
+    print(f"  {'✅' if ok else '❌'} {line}")
+    return ok
+
+def main():
+    args = parse_args()
+    handlers = args.handler or sorted(IMPORT_BUDGETS_MS)
+
+    print(f"🚀 冷启动导入基准 ({args.runs} 次/Lambda，Python {sys.version.split()[0]})")
+    results = [
+        benchmark(name, args.runs, args.budget_ms or IMPORT_BUDGETS_MS[name])
+        for name in handlers
+    ]
+
+    print(f"\n🏁 {sum(results)}/{len(results)} 个Lambda在预算内")
+    sys.exit(0 if all(results) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -1,63 +1,55 @@
 #!/usr/bin/env python3
 """
 初始化OpenSearch Serverless索引
+物理索引 embeddings-v1 通过别名 embeddings 读写（与embedding Lambda保持一致）
 """
 import boto3
 import os
-from opensearchpy import OpenSearch, RequestsHttpConnection
-from aws_requests_auth.aws_auth import AWSRequestsAuth
+import sys
+from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
 
-def create_index():
-    # 获取配置
+# 索引定义与Lambda共用opensearch_layer中的index_schema
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'layers', 'opensearch_layer', 'python'))
+from index_schema import build_index_body  # noqa: E402
+
+OPENSEARCH_INDEX = os.environ.get('OPENSEARCH_INDEX', 'embeddings')
+
+def get_opensearch_client():
+    """初始化OpenSearch客户端"""
     region = os.environ.get('AWS_REGION', boto3.Session().region_name or 'us-east-1')
-    host = os.environ.get('OPENSEARCH_HOST', f'multimodal-embeddings.{region}.aoss.amazonaws.com')
-    
+    endpoint = os.environ.get('OPENSEARCH_ENDPOINT', f'https://multimodal-embeddings.{region}.aoss.amazonaws.com')
+    host = os.environ.get('OPENSEARCH_HOST', endpoint.replace('https://', ''))
+
     # AWS认证
-    session = boto3.Session()
-    credentials = session.get_credentials()
-    awsauth = AWSRequestsAuth(
-        aws_access_key=credentials.access_key,
-        aws_secret_access_key=credentials.secret_key,
-        aws_token=credentials.token,
-        aws_host=host,
-        aws_region=region,
-        aws_service='aoss'
-    )
-    
+    credentials = boto3.Session().get_credentials()
+    auth = AWSV4SignerAuth(credentials, region, 'aoss')
+
     # OpenSearch客户端
     client = OpenSearch(
         hosts=[{'host': host, 'port': 443}],
-        http_auth=awsauth,
+        http_auth=auth,
         use_ssl=True,
         verify_certs=True,
-        connection_class=RequestsHttpConnection
+        connection_class=RequestsHttpConnection,
+        pool_maxsize=20
     )
-    
-    # 索引映射
-    index_mapping = {
-        "mappings": {
-            "properties": {
-                "s3_uri": {"type": "keyword"},
-                "embedding": {
-                    "type": "dense_vector",
-                    "dims": 1024,
-                    "index": True,
-                    "similarity": "cosine"
-                },
-                "file_type": {"type": "keyword"},
-                "timestamp": {"type": "date"},
-                "id": {"type": "keyword"}
-            }
-        }
-    }
-    
+    return client
+
+def create_index():
+    client = get_opensearch_client()
+
+    if client.indices.exists(index=OPENSEARCH_INDEX):
+        print(f"索引或别名已存在: {OPENSEARCH_INDEX}")
+        return
+
+    physical_index = f"{OPENSEARCH_INDEX}-v1"
     try:
         # 创建索引
         response = client.indices.create(
-            index='embeddings',
-            body=index_mapping
+            index=physical_index,
+            body=build_index_body(alias=OPENSEARCH_INDEX)
         )
-        print(f"索引创建成功: {response}")
+        print(f"索引创建成功: {physical_index} (别名: {OPENSEARCH_INDEX}) {response}")
     except Exception as e:
         if "resource_already_exists_exception" in str(e):
             print("索引已存在")
@@ -65,4 +57,4 @@ def create_index():
             print(f"创建索引失败: {e}")
 
 if __name__ == "__main__":
-    create_index()
\ No newline at end of file
+    create_index()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+分批重投embedding DLQ中的消息
+反复调用DLQ重投Lambda（限速、去重、按通道和年龄排序的逻辑都在Lambda中），打印每轮进度，
+直到DLQ清空、或本轮因Bedrock限流/积压没有可投递的消息
+
+用法:
+    python scripts/redrive_dlq.py                  # 重投直到DLQ清空
+    python scripts/redrive_dlq.py --dry-run        # 只报告，不投递不删除
+    python scripts/redrive_dlq.py --rounds 3 --max-messages 50
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import boto3
+
+SERVICE_PREFIX = os.environ.get('SERVICE_PREFIX', 'multimodal-search')
+FUNCTION_NAME = os.environ.get('DLQ_REDRIVE_FUNCTION_NAME', f"{SERVICE_PREFIX}-dlq-redrive")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='分批重投embedding DLQ')
+    parser.add_argument('--max-messages', type=int, default=100, help='每轮最多扫描的DLQ消息数')
+    parser.add_argument('--rounds', type=int, default=0, help='最多执行轮数（0表示直到清空）')
+    parser.add_argument('--interval', type=int, default=60, help='两轮之间等待的秒数，给通道队列消化时间')
+    parser.add_argument('--dry-run', action='store_true', help='只报告，不投递不删除')
+    return parser.parse_args()
+
+def run_round(lambda_client, max_messages, dry_run):
+    """调用一次重投Lambda，返回其报告"""
+    response = lambda_client.invoke(
+        FunctionName=FUNCTION_NAME,
+        InvocationType='RequestResponse',
+        Payload=json.dumps({'maxMessages': max_messages, 'dryRun': dry_run})
+    )
+    report = json.loads(response['Payload'].read())
+    if response.get('FunctionError'):
+        raise RuntimeError(f"Redrive Lambda failed: {report}")
+    return report
+
+def main():
+    args = parse_args()
+    lambda_client = boto3.client('lambda')
+
+    print(f"🚀 重投DLQ: {FUNCTION_NAME} (每轮最多 {args.max_messages} 条{', dry run' if args.dry_run else ''})")
+    totals = {'redriven': 0, 'already_completed': 0, 'duplicates': 0, 'missing_source': 0, 'invalid': 0, 'parked': 0}
+    round_number = 0
+    while True:
+        round_number += 1
+        report = run_round(lambda_client, args.max_messages, args.dry_run)
+        redriven = sum(report['redriven'].values())
+        totals['redriven'] += redriven
+        for key in ['already_completed', 'duplicates', 'missing_source', 'invalid', 'parked']:
+            totals[key] += report[key]
+
+        lanes = ', '.join(f"{lane} {count}" for lane, count in report['redriven'].items())
+        print(f"  第{round_number}轮: 扫描 {report['scanned']}，重投 {redriven} ({lanes})，"
+              f"已完成跳过 {report['already_completed']}，重复 {report['duplicates']}，"
+              f"源文件缺失 {report['missing_source']}，停放 {report['parked']}，推迟 {report['deferred']}，"
+              f"DLQ剩余 {report['remaining']}")
+
+        if args.dry_run or report['scanned'] == 0 or report['remaining'] == 0:
+            break
+        if args.rounds and round_number >= args.rounds:
+            break
+        if redriven == 0 and report['deferred'] > 0:
+            print(f"  ⏳ 通道繁忙或最近被限流，{args.interval}s 后重试")
+        time.sleep(args.interval)
+
+    print(f"✅ 完成: {json.dumps(totals, ensure_ascii=False)}")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        sys.exit(130)
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+蓝绿重建OpenSearch索引（零停机迁移mapping/HNSW参数/量化设置）
+
+流程:
+1. 解析别名当前指向的源索引，按新参数创建下一版本索引
+2. 使用PIT（不支持时回退到scroll）读取源索引，parallel_bulk并行写入新索引
+3. 追平复制期间新写入的文档
+4. 校验文档数量和抽样召回率，通过后原子切换别名（源索引默认保留以便回滚）
+
+示例:
+    python scripts/reindex_opensearch.py --m 32 --ef-construction 256
+    python scripts/reindex_opensearch.py --engine faiss --fp16 --workers 8
+    python scripts/reindex_opensearch.py --rollback-to embeddings-v1
+"""
+import argparse
+import random
+import re
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from opensearchpy import helpers
+
+from init_opensearch import OPENSEARCH_INDEX, build_index_body, get_opensearch_client
+
+EMBEDDING_FIELDS = ['visual_embedding', 'text_embedding', 'audio_embedding']
+CATCH_UP_MARGIN = timedelta(minutes=1)  # 文档timestamp在写入前生成，预留写入延迟
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='蓝绿重建OpenSearch索引')
+    parser.add_argument('--alias', default=OPENSEARCH_INDEX, help='读写使用的别名')
+    parser.add_argument('--engine', choices=['nmslib', 'faiss', 'lucene'], help='knn引擎')
+    parser.add_argument('--space-type', default=None, help='距离度量，例如 l2 / cosinesimil / innerproduct')
+    parser.add_argument('--m', type=int, help='HNSW参数m')
+    parser.add_argument('--ef-construction', type=int, help='HNSW参数ef_construction')
+    parser.add_argument('--fp16', action='store_true', help='faiss标量量化为fp16（需要--engine faiss）')
+    parser.add_argument('--workers', type=int, default=4, help='并行_bulk线程数')
+    parser.add_argument('--batch-size', type=int, default=200, help='每次读取和写入的文档数')
+    parser.add_argument('--sample-size', type=int, default=20, help='召回率校验抽样文档数')
+    parser.add_argument('--min-recall', type=float, default=0.95, help='切换所需的最低抽样召回率')
+    parser.add_argument('--verify-timeout', type=int, default=180, help='等待新索引文档数一致的秒数')
+    parser.add_argument('--no-cutover', action='store_true', help='只构建和校验，不切换别名')
+    parser.add_argument('--delete-old', action='store_true', help='切换后删除源索引')
+    parser.add_argument('--migrate-legacy', action='store_true',
+                        help='别名名称当前是真实索引时，复制后删除该索引并创建同名别名（短暂不可用）')
+    parser.add_argument('--rollback-to', help='把别名切回指定的旧索引后退出')
+    return parser.parse_args()
+
+def build_method(args):
+    """根据命令行参数构建knn_vector的method定义"""
+    if not any([args.engine, args.space_type, args.m, args.ef_construction, args.fp16]):
+        return None
+    if args.fp16 and args.engine != 'faiss':
+        raise ValueError('--fp16 仅支持 --engine faiss')
+
+    method = {'name': 'hnsw', 'engine': args.engine or 'nmslib'}
+    if args.space_type:
+        method['space_type'] = args.space_type
+
+    parameters = {}
+    if args.m:
+        parameters['m'] = args.m
+    if args.ef_construction:
+        parameters['ef_construction'] = args.ef_construction
+    if args.fp16:
+        parameters['encoder'] = {'name': 'sq', 'parameters': {'type': 'fp16'}}
+    if parameters:
+        method['parameters'] = parameters
+    return method
+
+def resolve_source_index(client, alias):
+    """返回 (源索引名, 是否为旧版真实索引)"""
+    if client.indices.exists_alias(name=alias):
+        indices = list(client.indices.get_alias(name=alias).keys())
+        if len(indices) != 1:
+            raise ValueError(f"别名 {alias} 指向多个索引: {indices}")
+        return indices[0], False
+    if client.indices.exists(index=alias):
+        return alias, True
+    raise ValueError(f"索引或别名不存在: {alias}")
+
+def next_index_name(alias, source_index):
+    """embeddings-v3 -> embeddings-v4；其他命名从v2开始"""
+    match = re.match(rf'^{re.escape(alias)}-v(\d+)$', source_index)
+    version = int(match.group(1)) + 1 if match else 2
+    return f"{alias}-v{version}"
+
+def count_documents(client, index):
+    """统计索引文档总数"""
+    result = client.search(index=index, body={'size': 0, 'track_total_hits': True, 'query': {'match_all': {}}})
+    return result['hits']['total']['value']
+
+def iter_documents(client, index, batch_size, query=None):
+    """使用PIT + search_after读取快照，不支持PIT时回退到scroll"""
+    query = query or {'match_all': {}}
+    try:
+        pit_id = client.create_pit(index=index, params={'keep_alive': '10m'})['pit_id']
+    except Exception as e:
+        print(f"PIT不可用，回退到scroll: {e}")
+        for hit in helpers.scan(client, index=index, query={'query': query}, size=batch_size, scroll='10m'):
+            yield hit['_source']
+        return
+
+    try:
+        search_after = None
+        while True:
+            body = {
+                'size': batch_size,
+                'query': query,
+                'pit': {'id': pit_id, 'keep_alive': '10m'},
+                'sort': [{'timestamp': 'asc'}, {'_id': 'asc'}]
+            }
+            if search_after:
+                body['search_after'] = search_after
+            hits = client.search(body=body)['hits']['hits']
+            if not hits:
+                return
+            for hit in hits:
+                yield hit['_source']
+            search_after = hits[-1]['sort']
+    finally:
+        try:
+            client.delete_pit(body={'pit_id': [pit_id]})
+        except Exception:
+            pass
+
+def bulk_copy(client, documents, target_index, args):
+    """并行_bulk写入目标索引，返回 (成功数, 失败数)"""
+    # 向量集合不支持自定义_id，使用index操作由服务端生成
+    actions = ({'_op_type': 'index', '_index': target_index, '_source': doc} for doc in documents)
+
+    copied = failed = 0
+    for ok, item in helpers.parallel_bulk(
+        client, actions,
+        thread_count=args.workers,
+        chunk_size=args.batch_size,
+        queue_size=args.workers * 2,
+        raise_on_error=False,
+        raise_on_exception=False
+    ):
+        if ok:
+            copied += 1
+            if copied % 1000 == 0:
+                print(f"  已复制 {copied} 个文档")
+        else:
+            failed += 1
+            print(f"  写入失败: {item}")
+    return copied, failed
+
+def doc_key(doc):
+    """文档的业务唯一键（新索引的_id与源索引不同）"""
+    field = next((f for f in EMBEDDING_FIELDS if f in doc), None)
+    return (doc.get('s3_uri'), doc.get('segment_index'), field)
+
+def doc_timestamp(moment):
+    """
+    与embedding Lambda写入的timestamp同格式：不带时区的UTC ISO-8601（Lambda运行时区为UTC），
+    脚本在非UTC时区运行时也不会把追平起点算到未来
+    """
+    return moment.astimezone(timezone.utc).replace(tzinfo=None).isoformat()
+
+def catch_up(client, source_index, target_index, since, args):
+    """复制复制期间新写入源索引的文档，按业务键去重；since为带时区的时间"""
+    query = {'range': {'timestamp': {'gte': doc_timestamp(since)}}}
+    candidates = list(iter_documents(client, source_index, args.batch_size, query=query))
+    if not candidates:
+        return 0
+
+    s3_uris = list({doc['s3_uri'] for doc in candidates})
+    existing = set()
+    for doc in iter_documents(client, target_index, args.batch_size, query={'terms': {'s3_uri': s3_uris}}):
+        existing.add(doc_key(doc))
+
+    missing = [doc for doc in candidates if doc_key(doc) not in existing]
+    copied, _ = bulk_copy(client, missing, target_index, args)
+    print(f"追平复制: {copied} 个新文档")
+    return copied
+
+def wait_for_count(client, source_index, target_index, timeout):
+    """等待新索引可见文档数追上源索引（Serverless刷新存在延迟）"""
+    deadline = time.time() + timeout
+    while True:
+        source_count = count_documents(client, source_index)
+        target_count = count_documents(client, target_index)
+        print(f"文档数校验: 源={source_count} 新={target_count}")
+        if target_count >= source_count or time.time() > deadline:
+            return source_count, target_count
+        time.sleep(10)
+
+def sample_recall(client, source_index, target_index, sample_size, k=10):
+    """抽样比较源索引与新索引的kNN结果重合率"""
+    samples = client.search(
+        index=source_index,
+        body={
+            'size': sample_size,
+            'query': {'function_score': {'query': {'match_all': {}}, 'random_score': {'seed': random.randint(0, 10 ** 6)}}}
+        }
+    )['hits']['hits']
+
+    recalls = []
+    for hit in samples:
+        doc = hit['_source']
+        for field in EMBEDDING_FIELDS:
+            if field not in doc:
+                continue
+            body = {
+                'size': k,
+                'query': {'knn': {field: {'vector': doc[field], 'k': k}}},
+                '_source': ['s3_uri', 'segment_index']
+            }
+            expected = {(h['_source']['s3_uri'], h['_source'].get('segment_index'))
+                        for h in client.search(index=source_index, body=body)['hits']['hits']}
+            actual = {(h['_source']['s3_uri'], h['_source'].get('segment_index'))
+                      for h in client.search(index=target_index, body=body)['hits']['hits']}
+            if expected:
+                recalls.append(len(expected & actual) / len(expected))
+
+    if not recalls:
+        return 1.0
+    return sum(recalls) / len(recalls)
+
+def cutover(client, alias, source_index, target_index, legacy):
+    """原子切换别名到新索引"""
+    if legacy:
+        # 别名名称被真实索引占用，只能先删除（数据已复制到新索引）
+        client.indices.delete(index=source_index)
+        client.indices.update_aliases(body={'actions': [
+            {'add': {'index': target_index, 'alias': alias, 'is_write_index': True}}
+        ]})
+    else:
+        client.indices.update_aliases(body={'actions': [
+            {'remove': {'index': source_index, 'alias': alias}},
+            {'add': {'index': target_index, 'alias': alias, 'is_write_index': True}}
+        ]})
+    print(f"✅ 别名 {alias} 已切换到 {target_index}")
+
+def rollback(client, alias, index):
+    """把别名切回指定索引"""
+    current = list(client.indices.get_alias(name=alias).keys()) if client.indices.exists_alias(name=alias) else []
+    actions = [{'remove': {'index': i, 'alias': alias}} for i in current if i != index]
+    actions.append({'add': {'index': index, 'alias': alias, 'is_write_index': True}})
+    client.indices.update_aliases(body={'actions': actions})
+    print(f"✅ 别名 {alias} 已回滚到 {index}")
+
+def main():
+    args = parse_args()
+    client = get_opensearch_client()
+
+    if args.rollback_to:
+        rollback(client, args.alias, args.rollback_to)
+        return 0
+
+    source_index, legacy = resolve_source_index(client, args.alias)
+    if legacy and not args.migrate_legacy:
+        print(f"❌ {args.alias} 是真实索引而不是别名，请使用 --migrate-legacy 迁移")
+        return 1
+
+    target_index = next_index_name(args.alias, source_index)
+    print(f"源索引: {source_index} -> 新索引: {target_index}")
+
+    client.indices.create(index=target_index, body=build_index_body(method=build_method(args)))
+    print(f"已创建新索引: {target_index}")
+
+    # 全量复制（PIT快照）
+    copy_started = datetime.now(timezone.utc)
+    started = time.time()
+    copied, failed = bulk_copy(client, iter_documents(client, source_index, args.batch_size), target_index, args)
+    print(f"全量复制完成: 成功 {copied}，失败 {failed}，耗时 {time.time() - started:.1f}s")
+    if failed:
+        print("❌ 存在写入失败的文档，停止切换")
+        return 1
+
+    # 追平复制期间的新写入
+    catch_up_started = datetime.now(timezone.utc)
+    catch_up(client, source_index, target_index, copy_started - CATCH_UP_MARGIN, args)
+
+    # 校验
+    source_count, target_count = wait_for_count(client, source_index, target_index, args.verify_timeout)
+    if target_count < source_count:
+        print(f"❌ 文档数不一致（源={source_count} 新={target_count}），停止切换")
+        return 1
+
+    recall = sample_recall(client, source_index, target_index, args.sample_size)
+    print(f"抽样召回率: {recall:.3f}（阈值 {args.min_recall}）")
+    if recall < args.min_recall:
+        print("❌ 召回率低于阈值，停止切换")
+        return 1
+
+    if args.no_cutover:
+        print(f"校验通过，未切换别名（--no-cutover）。新索引: {target_index}")
+        return 0
+
+    if not legacy:
+        cutover(client, args.alias, source_index, target_index, legacy)
+        # 切换前最后一刻仍写入源索引的文档
+        catch_up(client, source_index, target_index, catch_up_started - CATCH_UP_MARGIN, args)
+    else:
+        catch_up(client, source_index, target_index, catch_up_started - CATCH_UP_MARGIN, args)
+        cutover(client, args.alias, source_index, target_index, legacy)
+
+    if args.delete_old and not legacy:
+        client.indices.delete(index=source_index)
+        print(f"已删除源索引: {source_index}")
+    elif not legacy:
+        print(f"源索引 {source_index} 已保留，可用 --rollback-to {source_index} 回滚")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+本地测试多区域Bedrock路由（不访问AWS）
+用桩替代各区域客户端和并发余量函数，验证按余量选区、传输成本过滤、本区域优先、
+本区域没有余量时切换到远端区域，以及区域客户端的缓存和跨区域中转
+
+用法: python scripts/test_bedrock_router.py
+"""
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'backend', 'layers', 'opensearch_layer', 'python'))
+os.environ.setdefault('AWS_REGION', 'us-east-1')
+
+from bedrock_pool import BedrockRegionRouter, CONCURRENCY_POOL  # noqa: E402
+
+HOME_REGION = 'us-east-1'
+REGIONS = [
+    {'region': 'us-west-2', 'outputBucket': 'usw2-staging', 'maxConcurrency': 4, 'transferCostPerGb': 0.02},
+    {'region': 'eu-west-1', 'outputBucket': 'euw1-staging', 'maxConcurrency': 4, 'transferCostPerGb': 0.05}
+]
+MB = 1024 ** 2
+
+class StubClient:
+    """记录调用的区域客户端桩"""
+    def __init__(self, service, region):
+        self.service = service
+        self.region = region
+        self.calls = []
+
+    def copy_object(self, **kwargs):
+        self.calls.append(('copy_object', kwargs))
+
+    def delete_object(self, **kwargs):
+        self.calls.append(('delete_object', kwargs))
+
+def make_router(headroom):
+    """headroom: {区域: 余量}；返回(路由器, 已创建的客户端列表, 余量查询记录)"""
+    created = []
+    queries = []
+
+    def client_factory(service, region):
+        client = StubClient(service, region)
+        created.append(client)
+        return client
+
+    def headroom_fn(pool, lane):
+        queries.append((pool, lane))
+        region = pool.split('@', 1)[1] if '@' in pool else HOME_REGION
+        return headroom[region]
+
+    router = BedrockRegionRouter(
+        HOME_REGION, 'home-uploads', REGIONS,
+        max_transfer_cost=0.005, client_factory=client_factory, headroom_fn=headroom_fn
+    )
+    return router, created, queries
+
+def test_routes_by_headroom():
+    """选择该通道余量最大的区域，余量按各区域自己的池查询"""
+    router, _, queries = make_router({'us-east-1': 1, 'us-west-2': 3, 'eu-west-1': 2})
+    region, pool = router.choose(CONCURRENCY_POOL, 'search', 10 * MB)
+    pools = {pool for pool, lane in queries if lane == 'search'}
+    if region == 'us-west-2' and pool == 'marengo@us-west-2' and pools == {'marengo', 'marengo@us-west-2', 'marengo@eu-west-1'}:
+        print("✅ 按余量选区: us-west-2 (marengo@us-west-2)")
+        return True
+    print(f"❌ 按余量选区异常: {region} {pool}，查询 {queries}")
+    return False
+
+def test_failover_when_home_saturated():
+    """本区域余量耗尽（含过期租约导致的负余量）时切换到有余量的远端区域"""
+    results = []
+    for home_headroom in (0, -2):
+        router, _, _ = make_router({'us-east-1': home_headroom, 'us-west-2': 1, 'eu-west-1': 0})
+        results.append(router.choose(CONCURRENCY_POOL, 'image', 1 * MB))
+    if all(result == ('us-west-2', 'marengo@us-west-2') for result in results):
+        print("✅ 本区域无余量时切换到 us-west-2")
+        return True
+    print(f"❌ 故障切换异常: {results}")
+    return False
+
+def test_transfer_cost_filter():
+    """传输成本超过上限的区域不参与选择，即使余量更大；本区域始终可选"""
+    router, _, _ = make_router({'us-east-1': 0, 'us-west-2': 5, 'eu-west-1': 5})
+    # 200MB: us-west-2约0.0039美元可选，eu-west-1约0.0098美元被过滤
+    medium = router.choose(CONCURRENCY_POOL, 'media-small', 200 * MB)
+    # 1GB: 两个远端区域都超过上限，只能留在本区域等待
+    large = router.choose(CONCURRENCY_POOL, 'media-large', 1024 * MB)
+    if medium[0] == 'us-west-2' and large == (HOME_REGION, CONCURRENCY_POOL):
+        print("✅ 传输成本过滤: 200MB -> us-west-2，1GB -> 本区域")
+        return True
+    print(f"❌ 传输成本过滤异常: 200MB -> {medium}，1GB -> {large}")
+    return False
+
+def test_tie_breaks():
+    """余量相同时本区域优先；远端区域之间选传输成本低的"""
+    router, _, _ = make_router({'us-east-1': 2, 'us-west-2': 2, 'eu-west-1': 2})
+    home = router.choose(CONCURRENCY_POOL, 'search', 1 * MB)
+    router, _, _ = make_router({'us-east-1': 0, 'us-west-2': 2, 'eu-west-1': 2})
+    remote = router.choose(CONCURRENCY_POOL, 'search', 1 * MB)
+    if home == (HOME_REGION, CONCURRENCY_POOL) and remote[0] == 'us-west-2':
+        print("✅ 余量相同时本区域优先，远端选传输成本低的 us-west-2")
+        return True
+    print(f"❌ 平局处理异常: {home} {remote}")
+    return False
+
+def test_regional_clients():
+    """区域客户端按(服务, 区域)缓存；中转输入使用目标区域的s3客户端和中转桶"""
+    router, created, _ = make_router({'us-east-1': 0, 'us-west-2': 1, 'eu-west-1': 0})
+    first = router.client('bedrock-runtime', 'us-west-2')
+    cached = router.client('bedrock-runtime', 'us-west-2') is first
+    staged_key, staged_uri = router.stage_input('us-west-2', 's3://home-uploads/uploads/clip.mp4')
+    router.delete_staged_input('us-west-2', staged_key)
+    s3 = router.client('s3', 'us-west-2')
+    copy_args = s3.calls[0][1]
+    ok = (
+        cached
+        and [(client.service, client.region) for client in created] == [('bedrock-runtime', 'us-west-2'), ('s3', 'us-west-2')]
+        and copy_args['Bucket'] == 'usw2-staging'
+        and copy_args['CopySource'] == {'Bucket': 'home-uploads', 'Key': 'uploads/clip.mp4'}
+        and staged_uri == f"s3://usw2-staging/{staged_key}"
+        and staged_key.endswith('/clip.mp4')
+        and s3.calls[1] == ('delete_object', {'Bucket': 'usw2-staging', 'Key': staged_key})
+    )
+    if ok:
+        print(f"✅ 区域客户端复用，输入中转到 {staged_uri}")
+        return True
+    print(f"❌ 区域客户端异常: created={[(c.service, c.region) for c in created]} calls={s3.calls}")
+    return False
+
+def main():
+    print("🚀 本地测试 BedrockRegionRouter")
+    results = [
+        test_routes_by_headroom(),
+        test_failover_when_home_saturated(),
+        test_transfer_cost_filter(),
+        test_tie_breaks(),
+        test_regional_clients()
+    ]
+
+    print(f"\n🏁 {sum(results)}/{len(results)} 项通过")
+    sys.exit(0 if all(results) else 1)
+
+if __name__ == "__main__":
+    main()
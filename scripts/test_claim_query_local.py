@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+本地测试搜索API的查询合并指针（不访问AWS）
+用内存表替代DynamoDB（条件写入在锁内原子执行），并发调用claim_query，
+验证同一查询只有一个请求认领成功、其余都合并到它；并验证无效请求不会占住指针，
+以及预签名直传的文件只按上传后S3的ETag合并（不信任客户端提供的哈希）
+
+用法: python scripts/test_claim_query_local.py
+"""
+import base64
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [
+    os.path.join(ROOT_DIR, 'backend', 'search_api'),
+    os.path.join(ROOT_DIR, 'backend', 'layers', 'opensearch_layer', 'python')
+]
+os.environ.setdefault('AWS_REGION', 'us-east-1')
+os.environ.setdefault('SEARCH_QUEUE_URL', 'https://sqs.us-east-1.amazonaws.com/000000000000/local-search')
+
+import main as search_api  # noqa: E402
+
+CONCURRENCY = int(os.environ.get('CONCURRENCY', '50'))
+
+class ConditionalCheckFailedException(Exception):
+    pass
+
+class FakeTable:
+    """内存表，只实现claim_query用到的两种条件表达式"""
+    def __init__(self):
+        self.items = {}
+        self.lock = threading.Lock()
+
+    def _check(self, existing, condition, values):
+        if condition is None:
+            return True
+        if condition == "attribute_not_exists(search_id) OR expires_at < :now":
+            return existing is None or existing['expires_at'] < values[':now']
+        if condition == "target_search_id = :old":
+            return existing is not None and existing.get('target_search_id') == values[':old']
+        if condition == "#status = :awaiting":
+            return existing is not None and existing.get('status') == values[':awaiting']
+        raise ValueError(f"unsupported condition: {condition}")
+
+    def put_item(self, Item, ConditionExpression=None, ExpressionAttributeValues=None):
+        # 放大竞争窗口
+        time.sleep(0.001)
+        with self.lock:
+            existing = self.items.get(Item['search_id'])
+            if not self._check(existing, ConditionExpression, ExpressionAttributeValues or {}):
+                raise ConditionalCheckFailedException()
+            self.items[Item['search_id']] = dict(Item)
+
+    def get_item(self, Key, ConsistentRead=False):
+        with self.lock:
+            item = self.items.get(Key['search_id'])
+            return {'Item': dict(item)} if item else {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeNames=None, ExpressionAttributeValues=None,
+                    ConditionExpression=None, ReturnValues=None):
+        """只支持 SET a = :x, b = :y 形式的更新"""
+        names = ExpressionAttributeNames or {}
+        values = ExpressionAttributeValues or {}
+        with self.lock:
+            if not self._check(self.items.get(Key['search_id']), ConditionExpression, values):
+                raise ConditionalCheckFailedException()
+            item = self.items.setdefault(Key['search_id'], dict(Key))
+            for assignment in UpdateExpression[len('SET '):].split(', '):
+                field, value = assignment.split(' = ')
+                item[names.get(field, field)] = values[value]
+            return {'Attributes': dict(item)} if ReturnValues else {}
+
+class FakeDynamoDB:
+    def __init__(self):
+        self.table = FakeTable()
+        self.meta = type('Meta', (), {'client': type('Client', (), {
+            'exceptions': type('Exceptions', (), {'ConditionalCheckFailedException': ConditionalCheckFailedException})
+        })})
+
+    def Table(self, name):
+        return self.table
+
+class FakeS3:
+    """按key返回固定ETag的S3桩，记录删除的对象"""
+    def __init__(self, etags):
+        self.etags = etags
+        self.deleted = []
+
+    def head_object(self, Bucket, Key):
+        return {'ETag': f'"{self.etags[Key]}"', 'ContentLength': 1024}
+
+    def delete_object(self, Bucket, Key):
+        self.deleted.append(Key)
+
+class FakeSQS:
+    def __init__(self):
+        self.messages = []
+
+    def send_message(self, QueueUrl, MessageBody, MessageAttributes=None):
+        self.messages.append(json.loads(MessageBody))
+
+def fresh_table():
+    search_api.dynamodb = FakeDynamoDB()
+    return search_api.dynamodb.table
+
+def test_concurrent_claims():
+    """并发认领同一查询：恰好一个认领成功，其余返回认领者的search_id"""
+    fresh_table()
+    query_key = f"text:visual-text:{uuid.uuid4().hex}"
+    search_ids = [str(uuid.uuid4()) for _ in range(CONCURRENCY)]
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        results = list(executor.map(lambda search_id: search_api.claim_query(query_key, search_id), search_ids))
+
+    winners = [search_id for search_id, existing in zip(search_ids, results) if existing is None]
+    merged_into = {existing['search_id'] for existing in results if existing}
+    if len(winners) == 1 and merged_into == set(winners):
+        print(f"✅ {CONCURRENCY} 个并发认领: 1 个认领成功，{CONCURRENCY - 1} 个合并到 {winners[0]}")
+        return True
+    print(f"❌ 并发认领异常: 认领成功 {len(winners)} 个，合并到 {merged_into}")
+    return False
+
+def test_failed_target_replaced():
+    """指针指向的搜索已失败时，新请求替换指针；并发替换时仍只有一个成功"""
+    table = fresh_table()
+    query_key = f"text:visual-text:{uuid.uuid4().hex}"
+    failed_id = str(uuid.uuid4())
+    search_api.claim_query(query_key, failed_id)
+    table.put_item(Item={'search_id': failed_id, 'status': 'failed'})
+
+    search_ids = [str(uuid.uuid4()) for _ in range(CONCURRENCY)]
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        results = list(executor.map(lambda search_id: search_api.claim_query(query_key, search_id), search_ids))
+
+    winners = [search_id for search_id, existing in zip(search_ids, results) if existing is None]
+    pointer = table.items[f"query#{query_key}"]
+    if len(winners) == 1 and pointer['target_search_id'] == winners[0]:
+        print(f"✅ 失败搜索的指针被替换为 {winners[0]}")
+        return True
+    print(f"❌ 替换失败搜索的指针异常: 认领成功 {len(winners)} 个，指针 {pointer['target_search_id']}")
+    return False
+
+def test_expired_pointer_reclaimed():
+    """超过合并窗口的指针可被重新认领"""
+    table = fresh_table()
+    query_key = f"text:visual-text:{uuid.uuid4().hex}"
+    table.put_item(Item={
+        'search_id': f"query#{query_key}",
+        'target_search_id': str(uuid.uuid4()),
+        'claimed_at': 0,
+        'expires_at': 1
+    })
+    if search_api.claim_query(query_key, str(uuid.uuid4())) is None:
+        print("✅ 过期指针被重新认领")
+        return True
+    print("❌ 过期指针未被重新认领")
+    return False
+
+def test_invalid_request_does_not_claim():
+    """参数缺失的请求返回400且不写入合并指针"""
+    table = fresh_table()
+    event = {'body': json.dumps({
+        'searchType': 'file',
+        'searchMode': 'visual-image',
+        'file': base64.b64encode(b'not really an image').decode('ascii')
+    })}
+    response = search_api.start_search(event)
+    pointers = [key for key in table.items if key.startswith('query#')]
+    if response['statusCode'] == 400 and not pointers:
+        print("✅ 无效请求返回400，未占用合并指针")
+        return True
+    print(f"❌ 无效请求: 状态码 {response['statusCode']}，指针 {pointers}")
+    return False
+
+def test_text_key_includes_mode():
+    """相同文本、不同搜索模式不合并"""
+    body = {'queryText': 'A red car'}
+    keys = {search_api.coalesce_key({}, body, 'text', mode) for mode in ('visual-text', 'audio')}
+    if len(keys) == 2:
+        print("✅ 文本合并键包含搜索模式")
+        return True
+    print(f"❌ 不同搜索模式得到相同的合并键: {keys}")
+    return False
+
+def test_client_hash_ignored():
+    """预签名直传的文件请求在创建时不合并，客户端提供的contentHash不参与合并键"""
+    body = {'fileName': 'a.jpg', 'fileType': 'image/jpeg', 'contentHash': 'f' * 64}
+    if search_api.coalesce_key({}, body, 'file', 'visual-image') is None:
+        print("✅ 客户端提供的contentHash不参与合并")
+        return True
+    print("❌ 客户端提供的contentHash被用作合并键")
+    return False
+
+def test_uploaded_files_coalesce_by_etag():
+    """上传完成后按S3的ETag合并：相同内容只入队一次，后来者跟随到已有搜索；不同内容各自入队"""
+    table = fresh_table()
+    etag = uuid.uuid4().hex
+    search_api.s3_client = FakeS3({'temp/a.jpg': etag, 'temp/b.jpg': etag, 'temp/c.jpg': uuid.uuid4().hex})
+    search_api.sqs = FakeSQS()
+    for name in ('a', 'b', 'c'):
+        table.put_item(Item={
+            'search_id': name,
+            'status': 'awaiting_upload',
+            'search_type': 'file',
+            'search_mode': 'visual-image',
+            'file_name': f'{name}.jpg',
+            'file_type': 'image/jpeg',
+            's3_key': f'temp/{name}.jpg',
+            'created_at': '2024-01-01T00:00:00',
+            'updated_at': '2024-01-01T00:00:00'
+        })
+        search_api.enqueue_file_search(name)
+
+    enqueued = [message['search_id'] for message in search_api.sqs.messages]
+    followed = search_api.load_search_item('b')['search_id']
+    if enqueued == ['a', 'c'] and table.items['b']['status'] == 'coalesced' and followed == 'a' \
+            and search_api.s3_client.deleted == ['temp/b.jpg']:
+        print("✅ 相同内容的上传合并到已有搜索，不同内容各自入队")
+        return True
+    print(f"❌ 上传后合并异常: 入队 {enqueued}，b={table.items['b']}，跟随到 {followed}")
+    return False
+
+def main():
+    print(f"🚀 本地测试 claim_query (并发 {CONCURRENCY})")
+    results = [
+        test_concurrent_claims(),
+        test_failed_target_replaced(),
+        test_expired_pointer_reclaimed(),
+        test_invalid_request_does_not_claim(),
+        test_text_key_includes_mode(),
+        test_client_hash_ignored(),
+        test_uploaded_files_coalesce_by_etag()
+    ]
+
+    print(f"\n🏁 {sum(results)}/{len(results)} 项通过")
+    sys.exit(0 if all(results) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+测试搜索API的请求合并与幂等
+并发发送相同查询，验证所有请求拿到同一个search_id（只创建一个搜索任务）
+
+用法: SEARCH_API_ENDPOINT=https://xxx.execute-api.us-east-1.amazonaws.com/prod/ python scripts/test_search_coalescing.py
+"""
+import os
+import sys
+import uuid
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+SEARCH_API_ENDPOINT = os.environ.get('SEARCH_API_ENDPOINT', '')
+CONCURRENCY = int(os.environ.get('CONCURRENCY', '20'))
+
+def start_search(payload, headers=None):
+    """启动搜索，返回(状态码, 响应JSON)"""
+    response = requests.post(SEARCH_API_ENDPOINT, json=payload, headers=headers or {}, timeout=60)
+    return response.status_code, response.json()
+
+def fire_concurrently(payload, headers=None):
+    """并发发送CONCURRENCY个相同请求，返回所有search_id"""
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        futures = [executor.submit(start_search, payload, headers) for _ in range(CONCURRENCY)]
+        results = [future.result() for future in futures]
+
+    for status_code, body in results:
+        if status_code not in (200, 201, 202):
+            print(f"  ❌ 请求失败: {status_code} {body}")
+    return [body.get('search_id') for _, body in results]
+
+def check_single_search(name, search_ids):
+    unique_ids = set(search_ids)
+    if len(unique_ids) == 1 and None not in unique_ids:
+        print(f"✅ {name}: {len(search_ids)} 个并发请求合并为 1 个搜索 {unique_ids.pop()}")
+        return True
+    print(f"❌ {name}: 产生了 {len(unique_ids)} 个不同的search_id: {unique_ids}")
+    return False
+
+def test_concurrent_text_duplicates():
+    """相同文本（大小写和空白不同）的并发请求"""
+    marker = uuid.uuid4().hex[:8]
+    search_ids = []
+    variants = [f"a red car {marker}", f"  A Red  Car {marker} ", f"a red CAR {marker}"]
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        futures = [
+            executor.submit(start_search, {'searchType': 'text', 'searchMode': 'visual-text', 'queryText': variants[i % len(variants)]})
+            for i in range(CONCURRENCY)
+        ]
+        search_ids = [future.result()[1].get('search_id') for future in futures]
+    return check_single_search("规范化文本并发去重", search_ids)
+
+def test_concurrent_idempotency_key():
+    """相同Idempotency-Key的并发请求"""
+    headers = {'Idempotency-Key': str(uuid.uuid4())}
+    payload = {'searchType': 'text', 'searchMode': 'visual-text', 'queryText': f"mountain lake {uuid.uuid4().hex[:8]}"}
+    return check_single_search("Idempotency-Key并发去重", fire_concurrently(payload, headers))
+
+def test_distinct_queries_not_merged():
+    """不同查询不能被合并"""
+    first = start_search({'searchType': 'text', 'queryText': f"city at night {uuid.uuid4().hex[:8]}"})[1]
+    second = start_search({'searchType': 'text', 'queryText': f"city at night {uuid.uuid4().hex[:8]}"})[1]
+    if first.get('search_id') != second.get('search_id'):
+        print("✅ 不同查询生成不同的search_id")
+        return True
+    print(f"❌ 不同查询被错误合并: {first.get('search_id')}")
+    return False
+
+def main():
+    if not SEARCH_API_ENDPOINT:
+        print("❌ 请设置 SEARCH_API_ENDPOINT 环境变量")
+        sys.exit(1)
+
+    print(f"🚀 测试请求合并: {SEARCH_API_ENDPOINT} (并发 {CONCURRENCY})")
+    results = [
+        test_concurrent_text_duplicates(),
+        test_concurrent_idempotency_key(),
+        test_distinct_queries_not_merged()
+    ]
+
+    print(f"\n🏁 {sum(results)}/{len(results)} 项通过")
+    sys.exit(0 if all(results) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+本地测试搜索API的长轮询逻辑（不访问AWS）
+用内存中的load_item驱动wait_for_change，覆盖超时、状态变化和since三条返回路径，
+并验证同一个已完成搜索被多次轮询时耗时EWMA只计入一次
+
+用法: python scripts/test_wait_for_change.py
+"""
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [
+    os.path.join(ROOT_DIR, 'backend', 'search_api'),
+    os.path.join(ROOT_DIR, 'backend', 'layers', 'opensearch_layer', 'python')
+]
+os.environ.setdefault('AWS_REGION', 'us-east-1')
+os.environ.setdefault('SEARCH_QUEUE_URL', 'https://sqs.us-east-1.amazonaws.com/000000000000/local-search')
+
+import main as search_api  # noqa: E402
+
+# 缩短轮询间隔，让测试在1秒内完成
+search_api.WAIT_POLL_INITIAL = 0.02
+search_api.WAIT_POLL_MAX = 0.05
+
+def make_loader(states):
+    """按调用次数依次返回states中的记录，用完后一直返回最后一条"""
+    calls = []
+    def load_item(search_id):
+        calls.append(search_id)
+        return dict(states[min(len(calls), len(states)) - 1])
+    return load_item, calls
+
+def search_item(status, updated_at):
+    return {
+        'search_id': 'local-search',
+        'status': status,
+        'search_type': 'text',
+        'created_at': '2024-01-01T00:00:00',
+        'updated_at': updated_at
+    }
+
+def test_timeout():
+    """记录一直不变时在等待预算用完后返回最后一次读到的记录"""
+    load_item, calls = make_loader([search_item('processing', '2024-01-01T00:00:01')])
+    started = time.time()
+    item = search_api.wait_for_change('local-search', 300, load_item=load_item)
+    elapsed = time.time() - started
+    if item['status'] == 'processing' and 0.3 <= elapsed < 0.6 and len(calls) > 1:
+        print(f"✅ 超时返回: {elapsed * 1000:.0f}ms 内轮询 {len(calls)} 次")
+        return True
+    print(f"❌ 超时返回异常: status={item['status']} elapsed={elapsed:.3f}s calls={len(calls)}")
+    return False
+
+def test_terminal_status():
+    """到达终态时立即返回，不等满预算"""
+    load_item, calls = make_loader([
+        search_item('pending', '2024-01-01T00:00:01'),
+        search_item('processing', '2024-01-01T00:00:02'),
+        search_item('completed', '2024-01-01T00:00:03')
+    ])
+    started = time.time()
+    item = search_api.wait_for_change('local-search', 5000, load_item=load_item)
+    elapsed = time.time() - started
+    if item['status'] == 'completed' and len(calls) == 3 and elapsed < 1:
+        print(f"✅ 终态提前返回: 第 {len(calls)} 次读取，{elapsed * 1000:.0f}ms")
+        return True
+    print(f"❌ 终态返回异常: status={item['status']} elapsed={elapsed:.3f}s calls={len(calls)}")
+    return False
+
+def test_since():
+    """updated_at不同于since时立即返回；未传since时非终态的变化不打断等待"""
+    states = [
+        search_item('processing', '2024-01-01T00:00:01'),
+        search_item('processing', '2024-01-01T00:00:01'),
+        search_item('processing', '2024-01-01T00:00:02')
+    ]
+    load_item, calls = make_loader(states)
+    item = search_api.wait_for_change('local-search', 5000, since='2024-01-01T00:00:01', load_item=load_item)
+    changed = item['updated_at'] == '2024-01-01T00:00:02' and len(calls) == 3
+
+    load_item, stale_calls = make_loader([search_item('processing', '2024-01-01T00:00:02')])
+    item = search_api.wait_for_change('local-search', 5000, since='2024-01-01T00:00:01', load_item=load_item)
+    stale = len(stale_calls) == 1
+
+    load_item, _ = make_loader(states)
+    started = time.time()
+    search_api.wait_for_change('local-search', 200, load_item=load_item)
+    waited = time.time() - started >= 0.2
+
+    if changed and stale and waited:
+        print("✅ since: 记录变化时返回，since已过期时首次读取即返回，未传since时等满预算")
+        return True
+    print(f"❌ since路径异常: changed={changed} stale={stale} waited={waited}")
+    return False
+
+class ConditionalCheckFailedException(Exception):
+    pass
+
+class FakeTable:
+    """只实现record_latency用到的条件写入"""
+    def __init__(self):
+        self.items = {}
+
+    def update_item(self, Key, UpdateExpression, ConditionExpression, ExpressionAttributeValues):
+        item = self.items.setdefault(Key['search_id'], {})
+        if 'latency_recorded' in item:
+            raise ConditionalCheckFailedException()
+        item['latency_recorded'] = True
+
+class FakeDynamoDB:
+    def __init__(self):
+        self.table = FakeTable()
+        self.meta = type('Meta', (), {'client': type('Client', (), {
+            'exceptions': type('Exceptions', (), {'ConditionalCheckFailedException': ConditionalCheckFailedException})
+        })})
+
+    def Table(self, name):
+        return self.table
+
+def test_latency_recorded_once():
+    """同一个已完成搜索被多次轮询时只更新一次EWMA"""
+    search_api.dynamodb = FakeDynamoDB()
+    search_api._latency_ewma.clear()
+    item = search_item('completed', '2024-01-01T00:00:04')
+    search_api.record_latency(item)
+    first = search_api._latency_ewma.get('text')
+    for _ in range(5):
+        search_api.record_latency(dict(item))
+    if first == 4.0 and search_api._latency_ewma.get('text') == first:
+        print("✅ 耗时EWMA每个搜索只计入一次")
+        return True
+    print(f"❌ 耗时EWMA被重复计入: {search_api._latency_ewma}")
+    return False
+
+def main():
+    print("🚀 本地测试 wait_for_change")
+    results = [
+        test_timeout(),
+        test_terminal_status(),
+        test_since(),
+        test_latency_recorded_once()
+    ]
+
+    print(f"\n🏁 {sum(results)}/{len(results)} 项通过")
+    sys.exit(0 if all(results) else 1)
+
+if __name__ == "__main__":
+    main()
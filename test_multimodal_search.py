@@ -171,6 +171,8 @@ def poll_results(search_id, max_attempts=30):
                 
                 if status == 'completed':
                     results = result.get('results', [])
+                    if result.get('resultsUrl'):
+                        results = requests.get(result['resultsUrl']).json()
                     print(f"✅ 搜索完成！找到 {len(results)} 个相似内容")
                     
                     # 显示前3个结果